@@ -21,11 +21,13 @@ import base64
 import logging
 import logging.handlers
 import os
+import queue
 import sys
-import tempfile
 import threading
+import time
 import traceback
 import uuid
+from concurrent.futures import Future
 from io import BytesIO
 
 import torch
@@ -33,11 +35,14 @@ import trimesh
 import uvicorn
 from PIL import Image
 from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 
 from hy3dgen.rembg import BackgroundRemover
+from hy3dgen.residency import ModelResidencyManager
 from hy3dgen.shapegen import Hunyuan3DDiTFlowMatchingPipeline, FloaterRemover, DegenerateFaceRemover, FaceReducer, \
-    MeshSimplifier
+    MeshSimplifier, PostprocessChain
+from hy3dgen.shapegen.exporters import MEDIA_TYPES, export_mesh_buffer, iter_buffer
+from hy3dgen.shapegen.models.autoencoders.volume_decoders import query_grid_cache
 from hy3dgen.texgen import Hunyuan3DPaintPipeline
 from hy3dgen.text2image import HunyuanDiTPipeline
 
@@ -126,17 +131,13 @@ class StreamToLogger(object):
         self.linebuf = ''
 
 
-def pretty_print_semaphore(semaphore):
-    if semaphore is None:
-        return "None"
-    return f"Semaphore(value={semaphore._value}, locked={semaphore.locked()})"
-
-
 SAVE_DIR = 'gradio_cache'
 os.makedirs(SAVE_DIR, exist_ok=True)
 
 worker_id = str(uuid.uuid4())[:6]
 logger = build_logger("controller", f"{SAVE_DIR}/controller.log")
+batcher = None
+job_manager = None
 
 
 def load_image_from_base64(image):
@@ -149,84 +150,400 @@ class ModelWorker:
                  tex_model_path='tencent/Hunyuan3D-2',
                  subfolder='hunyuan3d-dit-v2-mini-turbo',
                  device='cuda',
-                 enable_tex=False):
+                 enable_tex=False,
+                 device_budget=None,
+                 cpu_budget=None):
         self.model_path = model_path
+        self.subfolder = subfolder
         self.worker_id = worker_id
         self.device = device
         logger.info(f"Loading the model {model_path} on worker {worker_id} ...")
 
+        # Models move between the device, pinned CPU memory and disk within these budgets (bytes)
+        self.residency = ModelResidencyManager(device, device_budget=device_budget, cpu_budget=cpu_budget)
+
         self.rembg = BackgroundRemover()
-        self.pipeline = Hunyuan3DDiTFlowMatchingPipeline.from_pretrained(
-            model_path,
-            subfolder=subfolder,
-            use_safetensors=True,
-            device=device,
-        )
-        self.pipeline.enable_flashvdm(mc_algo='mc')
-        # self.pipeline_t2i = HunyuanDiTPipeline(
-        #     'Tencent-Hunyuan/HunyuanDiT-v1.1-Diffusers-Distilled',
-        #     device=device
-        # )
+        self.residency.register('rembg', BackgroundRemover, obj=self.rembg, cpu_only=True,
+                                setter=lambda model: setattr(self, 'rembg', model))
+        self.pipeline = self.load_shape_pipeline()
+        self.residency.register('shapegen', self.load_shape_pipeline, obj=self.pipeline,
+                                setter=lambda model: setattr(self, 'pipeline', model))
+        # The text-to-image model is only loaded when a text prompt comes in
+        self.pipeline_t2i = None
+        self.residency.register('t2i', lambda: HunyuanDiTPipeline(
+            'Tencent-Hunyuan/HunyuanDiT-v1.1-Diffusers-Distilled',
+            device=device
+        ), setter=lambda model: setattr(self, 'pipeline_t2i', model))
+        self.pipeline_tex = None
         if enable_tex:
             self.pipeline_tex = Hunyuan3DPaintPipeline.from_pretrained(tex_model_path)
+            self.pipeline_tex.enable_residency(self.residency)
+
+    def load_shape_pipeline(self):
+        pipeline = Hunyuan3DDiTFlowMatchingPipeline.from_pretrained(
+            self.model_path,
+            subfolder=self.subfolder,
+            use_safetensors=True,
+            device=self.device,
+        )
+        pipeline.enable_flashvdm(mc_algo='mc')
+        pipeline.enable_cond_cache()
+        return pipeline
 
     def get_queue_length(self):
-        if model_semaphore is None:
+        if batcher is None:
             return 0
-        else:
-            return args.limit_model_concurrency - model_semaphore._value + (len(
-                model_semaphore._waiters) if model_semaphore._waiters is not None else 0)
+        return batcher.queue_length()
 
     def get_status(self):
         return {
             "speed": 1,
             "queue_length": self.get_queue_length(),
+            "query_grid_cache": query_grid_cache.stats(),
+            "cond_cache": self.pipeline.cond_cache.stats() if self.pipeline is not None else None,
+            "models": self.residency.stats(),
         }
 
-    @torch.inference_mode()
-    def generate(self, uid, params):
+    def prepare_image(self, params):
         if 'image' in params:
             image = params["image"]
             image = load_image_from_base64(image)
         else:
             if 'text' in params:
                 text = params["text"]
-                image = self.pipeline_t2i(text)
+                with self.residency.acquire('t2i') as pipeline_t2i:
+                    image = pipeline_t2i(text)
             else:
                 raise ValueError("No input image or text provided")
+        with self.residency.acquire('rembg') as rembg:
+            return rembg(image)
 
-        image = self.rembg(image)
-        params['image'] = image
-
-        if 'mesh' in params:
-            mesh = trimesh.load(BytesIO(base64.b64decode(params["mesh"])), file_type='glb')
-        else:
-            seed = params.get("seed", 1234)
-            params['generator'] = torch.Generator(self.device).manual_seed(seed)
-            params['octree_resolution'] = params.get("octree_resolution", 128)
-            params['num_inference_steps'] = params.get("num_inference_steps", 5)
-            params['guidance_scale'] = params.get('guidance_scale', 5.0)
-            params['mc_algo'] = 'mc'
-            import time
+    @torch.inference_mode()
+    def generate_batch(self, requests, progress_callback=None):
+        """Generate the meshes of compatible requests with a single shape pipeline call.
+
+        All requests that need shape generation must share the same `batch_key`.
+        `progress_callback(fraction)` is called after every sampling step.
+        Meshes are serialized in memory; they are also written to `SAVE_DIR` when `params['save']` is set.
+        Returns one entry per request: (buffer, uid, save_path), with `save_path` None if not saved, or the
+        exception that failed that request.
+        """
+        # Inputs are prepared one request at a time, so a bad payload only fails its own request
+        results = [None] * len(requests)
+        images = [None] * len(requests)
+        meshes = [None] * len(requests)
+        to_generate = []
+        for i, (uid, params) in enumerate(requests):
+            try:
+                images[i] = self.prepare_image(params)
+                if 'mesh' in params:
+                    meshes[i] = trimesh.load(BytesIO(base64.b64decode(params["mesh"])), file_type='glb')
+                else:
+                    to_generate.append(i)
+            except Exception as e:
+                traceback.print_exc()
+                results[i] = e
+
+        prefetch_tex = self.pipeline_tex is not None and any(params.get('texture', False) for _, params in requests)
+
+        if len(to_generate) > 0:
+            pipeline_kwargs = dict(batch_key(requests[to_generate[0]][1]))
             start_time = time.time()
-            mesh = self.pipeline(**params)[0]
-            logger.info("--- %s seconds ---" % (time.time() - start_time))
+            callback = None
+            if progress_callback is not None:
+                def callback(step_idx, t, outputs):
+                    progress_callback((step_idx + 1) / pipeline_kwargs['num_inference_steps'])
+            try:
+                with self.residency.acquire('shapegen') as pipeline:
+                    # shapegen is pinned in use now, so the texture prefetch cannot evict it
+                    if prefetch_tex:
+                        self.pipeline_tex.prefetch_models()
+                    outputs = pipeline(
+                        image=[images[i] for i in to_generate],
+                        generator=[torch.Generator(self.device).manual_seed(int(requests[i][1].get("seed", 1234)))
+                                   for i in to_generate],
+                        mc_algo='mc',
+                        callback=callback,
+                        callback_steps=1,
+                        **pipeline_kwargs,
+                    )
+                logger.info("--- %s seconds for a batch of %d ---" % (time.time() - start_time, len(to_generate)))
+                for i, mesh in zip(to_generate, outputs):
+                    meshes[i] = mesh
+            except Exception as e:
+                traceback.print_exc()
+                for i in to_generate:
+                    results[i] = e
+        elif prefetch_tex:
+            self.pipeline_tex.prefetch_models()
+
+        for i, ((uid, params), image, mesh) in enumerate(zip(requests, images, meshes)):
+            if results[i] is not None:
+                continue
+            try:
+                results[i] = self.finish_mesh(uid, params, image, mesh)
+            except Exception as e:
+                traceback.print_exc()
+                results[i] = e
+
+        torch.cuda.empty_cache()
+        return results
 
+    def finish_mesh(self, uid, params, image, mesh):
         if params.get('texture', False):
-            mesh = FloaterRemover()(mesh)
-            mesh = DegenerateFaceRemover()(mesh)
-            mesh = FaceReducer()(mesh, max_facenum=params.get('face_count', 40000))
+            mesh = PostprocessChain([
+                FloaterRemover(),
+                DegenerateFaceRemover(),
+                (FaceReducer(), dict(max_facenum=params.get('face_count', 40000))),
+            ])(mesh)
             mesh = self.pipeline_tex(mesh, image)
 
         type = params.get('type', 'glb')
-        with tempfile.NamedTemporaryFile(suffix=f'.{type}', delete=False) as temp_file:
-            mesh.export(temp_file.name)
-            mesh = trimesh.load(temp_file.name)
+        buffer = export_mesh_buffer(mesh, type)
+        save_path = None
+        if params.get('save', False):
             save_path = os.path.join(SAVE_DIR, f'{str(uid)}.{type}')
-            mesh.export(save_path)
+            with open(save_path, 'wb') as f:
+                f.write(buffer.getbuffer())
+        return buffer, uid, save_path
+
+
+# Shape pipeline arguments a request may set, with their type and default. They are part of the batch key.
+PIPELINE_PARAMS = {
+    'num_inference_steps': (int, 5),
+    'octree_resolution': (int, 128),
+    'guidance_scale': (float, 5.0),
+    'box_v': (float, None),
+    'mc_level': (float, None),
+    'num_chunks': (int, None),
+}
+# Other request fields handled by the server itself
+REQUEST_PARAMS = {'image', 'text', 'mesh', 'seed', 'texture', 'face_count', 'type', 'save'}
+
+
+def validate_params(params):
+    """Raise a ValueError for payloads that could not be generated, before they are queued."""
+    if not isinstance(params, dict):
+        raise ValueError("The request payload must be a JSON object")
+    unknown = set(params) - set(PIPELINE_PARAMS) - REQUEST_PARAMS
+    if unknown:
+        raise ValueError(f"Unsupported parameters: {', '.join(sorted(unknown))}")
+    if 'image' not in params and 'text' not in params:
+        raise ValueError("No input image or text provided")
+    try:
+        int(params.get('seed', 1234))
+        int(params.get('face_count', 40000))
+    except (TypeError, ValueError):
+        raise ValueError("`seed` and `face_count` must be integers")
+    batch_key(params)
+
+
+def batch_key(params):
+    """Requests with equal keys can share one pipeline call; the key holds the pipeline arguments."""
+    key = []
+    for name, (cast, default) in PIPELINE_PARAMS.items():
+        value = params.get(name, default)
+        if value is None:
+            continue
+        try:
+            key.append((name, cast(value)))
+        except (TypeError, ValueError):
+            raise ValueError(f"`{name}` must be a {cast.__name__}, got {value!r}")
+    return tuple(key)
+
+
+class _BatchRequest:
+    def __init__(self, uid, params, on_start=None, on_progress=None):
+        self.uid = uid
+        self.params = params
+        validate_params(params)
+        self.key = batch_key(params)
+        self.future = Future()
+        self.enqueued_at = time.monotonic()
+        self.on_start = on_start
+        self.on_progress = on_progress
+
+
+class MicroBatcher:
+    """Groups concurrent requests with the same `batch_key` into one `ModelWorker.generate_batch` call.
+
+    A batch is dispatched when it reaches `max_batch_size`, or `max_wait_ms` after its oldest request
+    arrived. Requests with a different key wait for the next batch in arrival order.
+    """
 
-        torch.cuda.empty_cache()
-        return save_path, uid
+    def __init__(self, worker, max_batch_size=4, max_wait_ms=50):
+        self.worker = worker
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._waiting = []
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def queue_length(self):
+        return self._queue.qsize() + len(self._waiting)
+
+    def submit(self, uid, params, on_start=None, on_progress=None) -> Future:
+        request = _BatchRequest(uid, params, on_start=on_start, on_progress=on_progress)
+        self._queue.put(request)
+        return request.future
+
+    def _next_batch(self):
+        first = self._waiting.pop(0) if self._waiting else self._queue.get()
+        batch = [first]
+        for request in list(self._waiting):
+            if len(batch) >= self.max_batch_size:
+                break
+            if request.key == first.key:
+                batch.append(request)
+                self._waiting.remove(request)
+
+        deadline = first.enqueued_at + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request.key == first.key:
+                batch.append(request)
+            else:
+                self._waiting.append(request)
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._next_batch()
+            for request in batch:
+                if request.on_start is not None:
+                    request.on_start()
+
+            def progress_callback(fraction):
+                for request in batch:
+                    if request.on_progress is not None:
+                        request.on_progress(fraction)
+
+            try:
+                results = self.worker.generate_batch(
+                    [(request.uid, request.params) for request in batch],
+                    progress_callback=progress_callback,
+                )
+                for request, result in zip(batch, results):
+                    if isinstance(result, Exception):
+                        request.future.set_exception(result)
+                    else:
+                        request.future.set_result(result)
+            except Exception as e:
+                traceback.print_exc()
+                for request in batch:
+                    request.future.set_exception(e)
+
+
+class QueueFullError(RuntimeError):
+    pass
+
+
+class Job:
+    def __init__(self, uid, params):
+        self.uid = uid
+        self.params = params
+        self.state = 'queued'
+        self.progress = 0.0
+        self.buffer = None
+        self.path = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+
+    def to_dict(self):
+        return {
+            'uid': self.uid,
+            'status': self.state,
+            'progress': self.progress,
+            'error': self.error,
+        }
+
+
+class JobManager:
+    """Tracks `/send` jobs through queued -> running -> done / failed.
+
+    At most `max_queued_jobs` unfinished jobs are admitted, and they run on the batcher's GPU worker.
+    Finished jobs, their in-memory meshes and any saved mesh files are evicted `ttl` seconds after completion,
+    and earlier, oldest first, while more than `max_finished_jobs` jobs or `max_finished_bytes` of meshes are kept.
+    """
+
+    def __init__(self, batcher, max_queued_jobs=64, ttl=3600, max_finished_jobs=256, max_finished_bytes=2 << 30):
+        self.batcher = batcher
+        self.max_queued_jobs = max_queued_jobs
+        self.ttl = ttl
+        self.max_finished_jobs = max_finished_jobs
+        self.max_finished_bytes = max_finished_bytes
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def num_unfinished(self):
+        with self._lock:
+            return sum(job.state in ('queued', 'running') for job in self._jobs.values())
+
+    def submit(self, params) -> Job:
+        validate_params(params)
+        self.evict_expired()
+        if self.num_unfinished() >= self.max_queued_jobs:
+            raise QueueFullError(f"Too many pending jobs (max {self.max_queued_jobs})")
+
+        job = Job(str(uuid.uuid4()), params)
+        with self._lock:
+            self._jobs[job.uid] = job
+
+        def on_start():
+            job.state = 'running'
+
+        def on_progress(fraction):
+            job.progress = fraction
+
+        future = self.batcher.submit(job.uid, params, on_start=on_start, on_progress=on_progress)
+        future.add_done_callback(lambda f: self._finish(job, f))
+        return job
+
+    def _finish(self, job, future):
+        error = future.exception()
+        if error is None:
+            job.buffer, _, job.path = future.result()
+            job.progress = 1.0
+            job.state = 'done'
+        else:
+            job.error = str(error)
+            job.state = 'failed'
+        job.finished_at = time.time()
+        self.evict_expired()
+
+    def get(self, uid):
+        self.evict_expired()
+        with self._lock:
+            return self._jobs.get(uid)
+
+    def evict_expired(self):
+        now = time.time()
+        with self._lock:
+            finished = sorted((job for job in self._jobs.values() if job.finished_at is not None),
+                              key=lambda job: job.finished_at)
+            expired = [job for job in finished if now - job.finished_at > self.ttl]
+            kept = finished[len(expired):]
+            kept_bytes = sum(job.buffer.getbuffer().nbytes for job in kept if job.buffer is not None)
+            # the newest result is kept even if it alone exceeds the byte budget
+            while len(kept) > self.max_finished_jobs or (len(kept) > 1 and kept_bytes > self.max_finished_bytes):
+                job = kept.pop(0)
+                if job.buffer is not None:
+                    kept_bytes -= job.buffer.getbuffer().nbytes
+                expired.append(job)
+            for job in expired:
+                del self._jobs[job.uid]
+        for job in expired:
+            job.buffer = None
+            if job.path is not None and os.path.exists(job.path):
+                os.remove(job.path)
 
 
 app = FastAPI()
@@ -241,14 +558,27 @@ app.add_middleware(
 )
 
 
+def mesh_response(buffer, type, uid=None, headers=None):
+    headers = dict(headers or {})
+    headers['Content-Length'] = str(buffer.getbuffer().nbytes)
+    if uid is not None:
+        headers['Content-Disposition'] = f'attachment; filename="{uid}.{type}"'
+    return StreamingResponse(iter_buffer(buffer), media_type=MEDIA_TYPES.get(type, 'application/octet-stream'),
+                             headers=headers)
+
+
 @app.post("/generate")
 async def generate(request: Request):
     logger.info("Worker generating...")
     params = await request.json()
     uid = uuid.uuid4()
     try:
-        file_path, uid = worker.generate(uid, params)
-        return FileResponse(file_path)
+        validate_params(params)
+    except ValueError as e:
+        return JSONResponse({"text": str(e), "error_code": 1}, status_code=400)
+    try:
+        buffer, uid, _ = await asyncio.wrap_future(batcher.submit(uid, params))
+        return mesh_response(buffer, params.get('type', 'glb'))
     except ValueError as e:
         traceback.print_exc()
         print("Caught ValueError:", e)
@@ -275,26 +605,33 @@ async def generate(request: Request):
 
 
 @app.post("/send")
-async def generate(request: Request):
+async def send(request: Request):
     logger.info("Worker send...")
     params = await request.json()
-    uid = uuid.uuid4()
-    threading.Thread(target=worker.generate, args=(uid, params,)).start()
-    ret = {"uid": str(uid)}
+    try:
+        job = job_manager.submit(params)
+    except QueueFullError as e:
+        return JSONResponse({"text": str(e), "error_code": 1}, status_code=429)
+    except ValueError as e:
+        return JSONResponse({"text": str(e), "error_code": 1}, status_code=400)
+    ret = {"uid": job.uid}
     return JSONResponse(ret, status_code=200)
 
 
+@app.get("/worker_status")
+async def worker_status():
+    return JSONResponse(worker.get_status(), status_code=200)
+
+
 @app.get("/status/{uid}")
 async def status(uid: str):
-    save_file_path = os.path.join(SAVE_DIR, f'{uid}.glb')
-    print(save_file_path, os.path.exists(save_file_path))
-    if not os.path.exists(save_file_path):
-        response = {'status': 'processing'}
-        return JSONResponse(response, status_code=200)
-    else:
-        base64_str = base64.b64encode(open(save_file_path, 'rb').read()).decode()
-        response = {'status': 'completed', 'model_base64': base64_str}
-        return JSONResponse(response, status_code=200)
+    job = job_manager.get(uid)
+    if job is None:
+        return JSONResponse({'status': 'unknown', 'uid': uid}, status_code=404)
+    if job.state != 'done':
+        return JSONResponse(job.to_dict(), status_code=200)
+    return mesh_response(job.buffer, job.params.get('type', 'glb'), uid=job.uid,
+                         headers={'X-Job-Status': 'completed'})
 
 
 if __name__ == "__main__":
@@ -304,13 +641,28 @@ if __name__ == "__main__":
     parser.add_argument("--model_path", type=str, default='tencent/Hunyuan3D-2mini')
     parser.add_argument("--tex_model_path", type=str, default='tencent/Hunyuan3D-2')
     parser.add_argument("--device", type=str, default="cuda")
-    parser.add_argument("--limit-model-concurrency", type=int, default=5)
+    parser.add_argument("--max-batch-size", type=int, default=4)
+    parser.add_argument("--max-wait-ms", type=int, default=50)
+    parser.add_argument("--max-queued-jobs", type=int, default=64)
+    parser.add_argument("--job-ttl", type=int, default=3600, help="Seconds to keep finished /send results")
+    parser.add_argument("--max-finished-jobs", type=int, default=256,
+                        help="Finished /send results kept before the oldest are evicted")
+    parser.add_argument("--max-finished-gb", type=float, default=2.0,
+                        help="Size of finished /send meshes kept in memory before the oldest are evicted")
     parser.add_argument('--enable_tex', action='store_true')
+    parser.add_argument("--device-budget-gb", type=float, default=None,
+                        help="GB of model weights kept on the device, idle models are offloaded beyond it")
+    parser.add_argument("--cpu-budget-gb", type=float, default=None,
+                        help="GB of offloaded model weights kept in CPU memory, idle models are unloaded beyond it")
     args = parser.parse_args()
     logger.info(f"args: {args}")
 
-    model_semaphore = asyncio.Semaphore(args.limit_model_concurrency)
-
     worker = ModelWorker(model_path=args.model_path, device=args.device, enable_tex=args.enable_tex,
-                         tex_model_path=args.tex_model_path)
+                         tex_model_path=args.tex_model_path,
+                         device_budget=int(args.device_budget_gb * 1024 ** 3) if args.device_budget_gb else None,
+                         cpu_budget=int(args.cpu_budget_gb * 1024 ** 3) if args.cpu_budget_gb else None)
+    batcher = MicroBatcher(worker, max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms)
+    job_manager = JobManager(batcher, max_queued_jobs=args.max_queued_jobs, ttl=args.job_ttl,
+                             max_finished_jobs=args.max_finished_jobs,
+                             max_finished_bytes=int(args.max_finished_gb * (1 << 30)))
     uvicorn.run(app, host=args.host, port=args.port, log_level="info")
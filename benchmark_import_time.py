@@ -0,0 +1,63 @@
+"""
+Import-time benchmark for the hy3dgen packages.
+
+Each target is imported in a fresh interpreter. The script fails when a target pulls in one of the
+heavy dependencies that must stay lazy, or when its median import time exceeds the budget.
+
+    python benchmark_import_time.py --runs 5 --budget-ms 300
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+# Module imported -> heavy modules it must not load
+TARGETS = {
+    'hy3dgen': ['torch', 'hy3dgen.shapegen', 'hy3dgen.texgen'],
+    'hy3dgen.shapegen': ['torch', 'diffusers', 'pymeshlab', 'skimage', 'trimesh', 'hy3dgen.shapegen.models'],
+    'hy3dgen.texgen': ['torch', 'diffusers', 'cv2', 'xatlas', 'custom_rasterizer', 'mesh_processor'],
+}
+
+PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "modules": sorted(sys.modules)}}))
+'''
+
+
+def measure(module):
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE.format(module=module)],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=300.0,
+                        help='maximum median import time of each target')
+    args = parser.parse_args()
+
+    failures = []
+    for module, forbidden in TARGETS.items():
+        samples = [measure(module) for _ in range(args.runs)]
+        median_ms = statistics.median(sample['seconds'] for sample in samples) * 1000
+        loaded = sorted(set(forbidden) & set(samples[0]['modules']))
+        print(f'{module:<20} {median_ms:8.1f} ms  eager heavy imports: {", ".join(loaded) or "none"}')
+        if loaded:
+            failures.append(f'{module} eagerly imports {", ".join(loaded)}')
+        if median_ms > args.budget_ms:
+            failures.append(f'{module} takes {median_ms:.1f} ms to import, budget is {args.budget_ms:.0f} ms')
+
+    for failure in failures:
+        print(f'FAIL: {failure}')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Micro-benchmark of the MoE inference paths on CPU, and on GPU when one is available.
+
+Runs one MoEBlock with the per-expert loop (`moe_infer`) and with the batched expert matmuls
+(`moe_infer_grouped`) on the same random tokens, checks how far they differ, reports how many assignments
+exceed the expert capacity and the median time of each path.
+
+    python benchmark_moe.py --tokens 4096 --dim 1024 --experts 8 --top-k 2
+    python benchmark_moe.py --devices cuda --capacity-factor 1.5
+"""
+import argparse
+import math
+import statistics
+import time
+
+import torch
+
+from hy3dgen.shapegen.models.denoisers.moe_layers import MoEBlock
+
+
+def measure(fn, runs, device):
+    fn()
+    samples = []
+    for _ in range(runs):
+        if device.type == 'cuda':
+            torch.cuda.synchronize(device)
+        start = time.perf_counter()
+        fn()
+        if device.type == 'cuda':
+            torch.cuda.synchronize(device)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def dropped_fraction(block, x):
+    """Fraction of the routed assignments beyond the capacity of their expert"""
+    topk_idx, _, _ = block.gate(x)
+    num_experts = len(block.experts)
+    capacity = min(x.shape[0] * x.shape[1], math.ceil(block.capacity_factor * topk_idx.numel() / num_experts))
+    counts = torch.bincount(topk_idx.view(-1), minlength=num_experts)
+    return float((counts - capacity).clamp(min=0).sum()) / topk_idx.numel()
+
+
+def benchmark(block, x, device, runs):
+    dtype = torch.float16 if device.type == 'cuda' else torch.float32
+    block = block.to(device, dtype)
+    x = x.to(device, dtype)
+
+    outputs, seconds = {}, {}
+    with torch.inference_mode():
+        for name, grouped in [('loop', False), ('grouped', True)]:
+            block.grouped_experts = grouped
+            outputs[name] = block(x).float()
+            seconds[name] = measure(lambda: block(x), runs, device)
+            print(f'{device.type:<5} {name:<8} {seconds[name] * 1000:9.2f} ms')
+        dropped = dropped_fraction(block, x)
+
+    error = (outputs['loop'] - outputs['grouped']).abs().max().item()
+    print(f'{device.type:<5} speedup  {seconds["loop"] / seconds["grouped"]:9.2f}x')
+    print(f'{device.type:<5} dropped assignments {dropped:.2%}, max abs difference {error:.2e}')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--batch-size', type=int, default=2)
+    parser.add_argument('--tokens', type=int, default=4096)
+    parser.add_argument('--dim', type=int, default=1024)
+    parser.add_argument('--experts', type=int, default=8)
+    parser.add_argument('--top-k', type=int, default=2)
+    parser.add_argument('--capacity-factor', type=float, default=2.0)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--threads', type=int, default=None)
+    parser.add_argument('--devices', nargs='+', default=['cpu', 'cuda'] if torch.cuda.is_available() else ['cpu'])
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    torch.manual_seed(0)
+    block = MoEBlock(args.dim, num_experts=args.experts, moe_top_k=args.top_k,
+                     ff_inner_dim=args.dim * 4, capacity_factor=args.capacity_factor).eval()
+    block.build_grouped_experts()
+    x = torch.randn(args.batch_size, args.tokens, args.dim)
+
+    for device in args.devices:
+        benchmark(block, x, torch.device(device), args.runs)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+"""
+Speed and quality benchmark for sampling options of the shape pipeline.
+
+Every variant generates meshes for the same images and seeds as a reference run. The script reports the
+sampling time, the speedup over the reference and the Chamfer distance to the reference meshes.
+
+    python benchmark_sampling.py --images assets/demo.png assets/example_images/004.png --step-cache
+    python benchmark_sampling.py --guidance-schedules 0,1,2 0,0.6,1 0,0.6,2
+    python benchmark_sampling.py --solvers euler heun midpoint dpm --nfes 10 15 20 30
+    python benchmark_sampling.py --device cpu --model tencent/Hunyuan3D-2mini \
+        --subfolder hunyuan3d-dit-v2-mini --steps 10 --octree-resolution 128 --step-cache
+"""
+import argparse
+import time
+
+import numpy as np
+import torch
+from PIL import Image
+
+from hy3dgen.rembg import BackgroundRemover
+from hy3dgen.shapegen import GuidanceSchedule, Hunyuan3DDiTFlowMatchingPipeline
+from hy3dgen.shapegen.schedulers import (
+    FlowMatchDPMSolverMultistepScheduler,
+    FlowMatchEulerDiscreteScheduler,
+    FlowMatchHeunDiscreteScheduler,
+)
+
+# Solver -> (scheduler class, extra config, number of pipeline steps giving `nfe` model evaluations)
+SOLVERS = {
+    'euler': (FlowMatchEulerDiscreteScheduler, {}, lambda nfe: nfe),
+    'heun': (FlowMatchHeunDiscreteScheduler, {'solver': 'heun'}, lambda nfe: nfe // 2 + 1),
+    'midpoint': (FlowMatchHeunDiscreteScheduler, {'solver': 'midpoint'}, lambda nfe: nfe // 2 + 1),
+    'dpm': (FlowMatchDPMSolverMultistepScheduler, {'solver_order': 2}, lambda nfe: nfe + 1),
+}
+
+
+def chamfer_distance(mesh_a, mesh_b, num_points=20000, chunk_size=4096, seed=0):
+    """Symmetric mean nearest-neighbour distance between points sampled on two meshes."""
+    points_a = torch.from_numpy(np.asarray(mesh_a.sample(num_points, seed=seed), dtype=np.float32))
+    points_b = torch.from_numpy(np.asarray(mesh_b.sample(num_points, seed=seed), dtype=np.float32))
+
+    def one_way(source, target):
+        return torch.cat([torch.cdist(chunk, target).min(dim=1).values for chunk in source.split(chunk_size)]).mean()
+
+    return float(one_way(points_a, points_b) + one_way(points_b, points_a)) / 2
+
+
+def load_images(paths):
+    rembg = None
+    images = []
+    for path in paths:
+        image = Image.open(path)
+        if image.mode == 'RGB':
+            rembg = rembg or BackgroundRemover()
+            image = rembg(image)
+        images.append(image.convert('RGBA'))
+    return images
+
+
+def run(pipeline, images, args, **call_kwargs):
+    call_kwargs.setdefault('num_inference_steps', args.steps)
+    meshes, seconds = [], 0.0
+    for image in images:
+        if args.device.startswith('cuda'):
+            torch.cuda.synchronize()
+        start = time.time()
+        mesh = pipeline(
+            image=image,
+            octree_resolution=args.octree_resolution,
+            num_chunks=args.num_chunks,
+            generator=torch.manual_seed(args.seed),
+            output_type='trimesh',
+            enable_pbar=False,
+            **call_kwargs,
+        )[0]
+        if args.device.startswith('cuda'):
+            torch.cuda.synchronize()
+        seconds += time.time() - start
+        meshes.append(mesh)
+    return meshes, seconds
+
+
+def build_variants(pipeline, args):
+    """(name, setup, teardown, call kwargs) of every variant selected on the command line"""
+    variants = []
+    if args.step_cache:
+        for refresh_interval in args.refresh_intervals:
+            variants.append((
+                f'step cache (refresh {refresh_interval}, drift {args.drift_threshold})',
+                lambda r=refresh_interval: pipeline.enable_step_cache(
+                    refresh_interval=r, drift_threshold=args.drift_threshold),
+                lambda: pipeline.enable_step_cache(False),
+                {},
+            ))
+    for spec in args.guidance_schedules:
+        start, end, every = spec.split(',')
+        schedule = GuidanceSchedule(interval=(float(start), float(end)), every=int(every))
+        variants.append((f'cfg {start}..{end} every {every}', lambda: None, lambda: None,
+                         {'guidance_schedule': schedule}))
+
+    default_scheduler = pipeline.scheduler
+
+    def restore_scheduler():
+        pipeline.scheduler = default_scheduler
+
+    for solver in args.solvers:
+        scheduler_cls, config, steps_for = SOLVERS[solver]
+        for nfe in args.nfes:
+            def use_scheduler(scheduler_cls=scheduler_cls, config=config):
+                pipeline.scheduler = scheduler_cls.from_config(default_scheduler.config, **config)
+            variants.append((f'{solver} ({nfe} NFE)', use_scheduler, restore_scheduler,
+                             {'num_inference_steps': steps_for(nfe)}))
+    return variants
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--images', nargs='+', default=['assets/demo.png'])
+    parser.add_argument('--model', default='tencent/Hunyuan3D-2')
+    parser.add_argument('--subfolder', default='hunyuan3d-dit-v2-0')
+    parser.add_argument('--device', default='cuda' if torch.cuda.is_available() else 'cpu')
+    parser.add_argument('--steps', type=int, default=50)
+    parser.add_argument('--octree-resolution', type=int, default=256)
+    parser.add_argument('--num-chunks', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=12345)
+    parser.add_argument('--step-cache', action='store_true', help='benchmark DiT step caching')
+    parser.add_argument('--refresh-intervals', type=int, nargs='+', default=[2, 3, 4])
+    parser.add_argument('--drift-threshold', type=float, default=0.05)
+    parser.add_argument('--solvers', nargs='*', default=[], choices=sorted(SOLVERS),
+                        help='benchmark these solvers at the --nfes budgets against the reference')
+    parser.add_argument('--nfes', type=int, nargs='+', default=[10, 15, 20, 30])
+    parser.add_argument('--guidance-schedules', nargs='*', default=[], metavar='START,END,EVERY',
+                        help='benchmark classifier-free guidance limited to these intervals of model time')
+    args = parser.parse_args()
+
+    dtype = torch.float16 if args.device.startswith('cuda') else torch.float32
+    pipeline = Hunyuan3DDiTFlowMatchingPipeline.from_pretrained(
+        args.model, subfolder=args.subfolder, device=args.device, dtype=dtype)
+    images = load_images(args.images)
+
+    # warm up kernels and caches so the reference is not penalized
+    run(pipeline, images[:1], args, num_inference_steps=2)
+    reference, reference_seconds = run(pipeline, images, args)
+    reference_name = f'{type(pipeline.scheduler).__name__} ({len(pipeline.scheduler.timesteps)} NFE)'
+    print(f'{reference_name:<48} {reference_seconds:8.2f}s  speedup 1.00x  chamfer 0')
+
+    for name, setup, teardown, call_kwargs in build_variants(pipeline, args):
+        setup()
+        try:
+            meshes, seconds = run(pipeline, images, args, **call_kwargs)
+        finally:
+            teardown()
+        chamfer = np.mean([chamfer_distance(a, b) for a, b in zip(reference, meshes)])
+        print(f'{name:<48} {seconds:8.2f}s  speedup {reference_seconds / seconds:.2f}x  chamfer {chamfer:.5f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+import os
+import time
+from contextlib import contextmanager
+
+from PIL import Image
+
+from facade_deformer import FacadeDeformer
+
+VIEWS = ["front", "left", "back", "right"]
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+
+class DesignPipeline:
+    """
+    In-process image -> shape -> parametric pipeline
+
+    The multiview shape model is loaded on the first run and stays resident, and the generated
+    mesh is passed straight to a FacadeDeformer instead of going through files and subprocesses.
+    `timings` holds the seconds spent in each stage of the last run.
+
+    Example:
+        pipeline = DesignPipeline()
+        result = pipeline.run(image_dir="assets/example_mv_images/1")
+        vertices = result["deformer"].apply({"X": 120})
+    """
+
+    def __init__(self, model_path='tencent/Hunyuan3D-2mv', subfolder='hunyuan3d-dit-v2-mv', variant='fp16',
+                 num_inference_steps=50, octree_resolution=380, num_chunks=20000, seed=12345):
+        self.model_path = model_path
+        self.subfolder = subfolder
+        self.variant = variant
+        self.num_inference_steps = num_inference_steps
+        self.octree_resolution = octree_resolution
+        self.num_chunks = num_chunks
+        self.seed = seed
+        self._shape_pipeline = None
+        self.timings = {}
+
+    @contextmanager
+    def _stage(self, name):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.timings[name] = time.time() - start
+
+    @property
+    def shape_pipeline(self):
+        if self._shape_pipeline is None:
+            from hy3dgen.shapegen import Hunyuan3DDiTFlowMatchingPipeline
+            with self._stage("load_shape_model"):
+                self._shape_pipeline = Hunyuan3DDiTFlowMatchingPipeline.from_pretrained(
+                    self.model_path,
+                    subfolder=self.subfolder,
+                    variant=self.variant,
+                )
+        return self._shape_pipeline
+
+    def load_images(self, image_dir, views=None):
+        """
+        Load the view images of `image_dir` as a dict of view name to image
+
+        Without `views`, the images must be named after their view, e.g. `front.png` and `left.jpg`,
+        and other files are ignored. Otherwise `views` maps view names to file names in `image_dir`.
+        """
+        if views is None:
+            views = {}
+            for f in sorted(os.listdir(image_dir)):
+                stem, ext = os.path.splitext(f)
+                if ext.lower() not in IMAGE_EXTENSIONS or stem.lower() not in VIEWS:
+                    continue
+                if stem.lower() in views:
+                    raise ValueError(f"Several images for the {stem.lower()} view in {image_dir}")
+                views[stem.lower()] = f
+            if not views:
+                raise FileNotFoundError(
+                    f"No images named after a view ({', '.join(VIEWS)}) in {image_dir}; pass `views` to map them")
+        unknown = set(views) - set(VIEWS)
+        if unknown:
+            raise ValueError(f"Unknown views {sorted(unknown)}, expected some of {VIEWS}")
+        return {view: Image.open(os.path.join(image_dir, f)).convert("RGBA") for view, f in views.items()}
+
+    def generate_shape(self, images, seed=None):
+        import torch
+        return self.shape_pipeline(
+            image=images,
+            num_inference_steps=self.num_inference_steps,
+            octree_resolution=self.octree_resolution,
+            num_chunks=self.num_chunks,
+            generator=torch.manual_seed(self.seed if seed is None else seed),
+            output_type='trimesh'
+        )[0]
+
+    def run(self, image_dir=None, images=None, views=None, seed=None, export_path=None):
+        """
+        Run all stages and return a dict with the `mesh`, its `deformer` and the stage `timings`
+
+        Args:
+            image_dir: folder with up to four view images, used if `images` is None
+            images: dict of view name to PIL image
+            views: dict of view name to file name in `image_dir`, see `load_images`
+            seed: overrides the pipeline seed for this run
+            export_path: also write the generated mesh there, for the standalone viewer
+        """
+        self.timings = {}
+        # Touch the model first so its one-off load is reported as its own stage
+        self.shape_pipeline
+        with self._stage("load_images"):
+            if images is None:
+                images = self.load_images(image_dir, views=views)
+        with self._stage("generate_shape"):
+            mesh = self.generate_shape(images, seed=seed)
+        with self._stage("build_deformer"):
+            deformer = FacadeDeformer.from_trimesh(mesh)
+        if export_path is not None:
+            with self._stage("export"):
+                mesh.export(export_path)
+
+        for name, seconds in self.timings.items():
+            print(f"--- {name}: {seconds:.2f} seconds ---")
+        return {"mesh": mesh, "deformer": deformer, "timings": dict(self.timings)}
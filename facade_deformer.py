@@ -0,0 +1,83 @@
+import numpy as np
+
+# Slider name, face normal axis, normal sign, and the axis the facade is stretched along
+FACADES = [
+    ('Stretch +X Facade', 0, 1, 0),
+    ('Stretch -X Facade', 0, -1, 0),
+    ('Stretch +Y Facade', 1, 1, 1),
+    ('Stretch -Y Facade', 1, -1, 1),
+]
+GLOBAL_AXES = ['X', 'Y', 'Z']
+
+DEFAULT_SLIDER_VALUES = {name: 100 for name in GLOBAL_AXES + [facade[0] for facade in FACADES]}
+
+
+class FacadeDeformer:
+    """
+    Global and per-facade scaling of a building mesh
+
+    Facade vertex sets are found once from the face normals. Every axis keeps a small code per
+    vertex telling which of the facades stretched along that axis it belongs to, so `apply` is a
+    lookup table of combined scales and one multiply per axis, written into a preallocated buffer.
+
+    Args:
+        vertices: np.array of shape (N, 3)
+        faces: np.array of shape (M, 3)
+        face_normals: np.array of shape (M, 3), computed from the faces if None
+        normal_threshold: minimum normal component for a face to belong to a facade
+        swap_yz: write the output in Y-up order, as the viewers expect
+    """
+
+    def __init__(self, vertices, faces, face_normals=None, normal_threshold=0.9, swap_yz=True):
+        self.vertices = np.ascontiguousarray(vertices, dtype=np.float32)
+        self.faces = np.ascontiguousarray(faces, dtype=np.uint32)
+        if face_normals is None:
+            tri = self.vertices[self.faces]
+            face_normals = np.cross(tri[:, 1] - tri[:, 0], tri[:, 2] - tri[:, 0])
+            face_normals /= np.maximum(np.linalg.norm(face_normals, axis=1, keepdims=True), 1e-12)
+
+        self.facade_vertices = {}
+        for name, normal_axis, sign, _ in FACADES:
+            facade_faces = np.where(face_normals[:, normal_axis] * sign > normal_threshold)[0]
+            self.facade_vertices[name] = np.unique(self.faces[facade_faces].flatten())
+
+        # Per axis: the facades stretched along it and a bit code of facade membership per vertex
+        self._axis_facades = []
+        self._axis_codes = []
+        for axis in range(3):
+            names = [name for name, _, _, scale_axis in FACADES if scale_axis == axis]
+            code = np.zeros(len(self.vertices), dtype=np.uint8)
+            for bit, name in enumerate(names):
+                code[self.facade_vertices[name]] |= 1 << bit
+            self._axis_facades.append(names)
+            self._axis_codes.append(code)
+
+        self.output_axes = [0, 2, 1] if swap_yz else [0, 1, 2]
+        self.output = np.empty_like(self.vertices)
+        self._scale = np.empty(len(self.vertices), dtype=np.float32)
+
+    @classmethod
+    def from_trimesh(cls, mesh, **kwargs):
+        return cls(mesh.vertices, mesh.faces, face_normals=mesh.face_normals, **kwargs)
+
+    def _scale_table(self, axis, slider_values):
+        names = self._axis_facades[axis]
+        table = np.full(1 << len(names), slider_values[GLOBAL_AXES[axis]] / 100, dtype=np.float32)
+        for code in range(len(table)):
+            for bit, name in enumerate(names):
+                if code & (1 << bit):
+                    table[code] *= slider_values[name] / 100
+        return table
+
+    def apply(self, slider_values):
+        """
+        Deform the mesh for the given slider values (percentages, 100 = unchanged)
+
+        Returns the output buffer, which is reused by the next call.
+        """
+        slider_values = {**DEFAULT_SLIDER_VALUES, **slider_values}
+        for axis in range(3):
+            table = self._scale_table(axis, slider_values)
+            np.take(table, self._axis_codes[axis], out=self._scale)
+            np.multiply(self.vertices[:, axis], self._scale, out=self.output[:, self.output_axes[axis]])
+        return self.output
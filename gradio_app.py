@@ -187,7 +187,8 @@ def _gen_shape(
     if image is None:
         start_time = time.time()
         try:
-            image = t2i_worker(caption)
+            with residency.acquire('t2i') as t2i_worker:
+                image = t2i_worker(caption)
         except Exception as e:
             raise gr.Error(f"Text to 3D is disable. Please enable it by `python gradio_app.py --enable_t23d`.")
         time_meta['text2image'] = time.time() - start_time
@@ -198,13 +199,15 @@ def _gen_shape(
         start_time = time.time()
         for k, v in image.items():
             if check_box_rembg or v.mode == "RGB":
-                img = rmbg_worker(v.convert('RGB'))
+                with residency.acquire('rembg') as rmbg_worker:
+                    img = rmbg_worker(v.convert('RGB'))
                 image[k] = img
         time_meta['remove background'] = time.time() - start_time
     else:
         if check_box_rembg or image.mode == "RGB":
             start_time = time.time()
-            image = rmbg_worker(image.convert('RGB'))
+            with residency.acquire('rembg') as rmbg_worker:
+                image = rmbg_worker(image.convert('RGB'))
             time_meta['remove background'] = time.time() - start_time
 
     # remove disk io to make responding faster, uncomment at your will.
@@ -215,15 +218,19 @@ def _gen_shape(
 
     generator = torch.Generator()
     generator = generator.manual_seed(int(seed))
-    outputs = i23d_worker(
-        image=image,
-        num_inference_steps=steps,
-        guidance_scale=guidance_scale,
-        generator=generator,
-        octree_resolution=octree_resolution,
-        num_chunks=num_chunks,
-        output_type='mesh'
-    )
+    with residency.acquire('shapegen') as i23d_worker:
+        # shapegen is pinned in use now, so prefetching the texture models cannot evict it
+        if HAS_TEXTUREGEN:
+            texgen_worker.prefetch_models()
+        outputs = i23d_worker(
+            image=image,
+            num_inference_steps=steps,
+            guidance_scale=guidance_scale,
+            generator=generator,
+            octree_resolution=octree_resolution,
+            num_chunks=num_chunks,
+            output_type='mesh'
+        )
     time_meta['shape generation'] = time.time() - start_time
     logger.info("---Shape generation takes %s seconds ---" % (time.time() - start_time))
 
@@ -614,10 +621,10 @@ def build_app():
                                                             textured=True)
             else:
                 mesh = trimesh.load(file_out)
-                mesh = floater_remove_worker(mesh)
-                mesh = degenerate_face_remove_worker(mesh)
+                stages = [floater_remove_worker, degenerate_face_remove_worker]
                 if reduce_face:
-                    mesh = face_reduce_worker(mesh, target_face_num)
+                    stages.append((face_reduce_worker, dict(max_facenum=target_face_num)))
+                mesh = PostprocessChain(stages)(mesh)
                 save_folder = gen_save_folder()
                 path = export_mesh(mesh, save_folder, textured=False, type=file_type)
 
@@ -658,6 +665,10 @@ if __name__ == '__main__':
     parser.add_argument('--enable_flashvdm', action='store_true')
     parser.add_argument('--compile', action='store_true')
     parser.add_argument('--low_vram_mode', action='store_true')
+    parser.add_argument("--device-budget-gb", type=float, default=None,
+                        help="GB of model weights kept on the device, idle models are offloaded beyond it")
+    parser.add_argument("--cpu-budget-gb", type=float, default=None,
+                        help="GB of offloaded model weights kept in CPU memory, idle models are unloaded beyond it")
     args = parser.parse_args()
 
     SAVE_DIR = args.cache_path
@@ -689,6 +700,15 @@ if __name__ == '__main__':
 
     SUPPORTED_FORMATS = ['glb', 'obj', 'ply', 'stl']
 
+    from hy3dgen.residency import ModelResidencyManager
+
+    # All models move between the device, pinned CPU memory and disk within these budgets
+    residency = ModelResidencyManager(
+        args.device,
+        device_budget=int(args.device_budget_gb * 1024 ** 3) if args.device_budget_gb else None,
+        cpu_budget=int(args.cpu_budget_gb * 1024 ** 3) if args.cpu_budget_gb else None,
+    )
+
     HAS_TEXTUREGEN = False
     if not args.disable_tex:
         try:
@@ -697,6 +717,8 @@ if __name__ == '__main__':
             texgen_worker = Hunyuan3DPaintPipeline.from_pretrained(args.texgen_model_path)
             if args.low_vram_mode:
                 texgen_worker.enable_model_cpu_offload()
+            else:
+                texgen_worker.enable_residency(residency)
             # Not help much, ignore for now.
             # if args.compile:
             #     texgen_worker.models['delight_model'].pipeline.unet.compile()
@@ -714,26 +736,32 @@ if __name__ == '__main__':
     if args.enable_t23d:
         from hy3dgen.text2image import HunyuanDiTPipeline
 
-        t2i_worker = HunyuanDiTPipeline('Tencent-Hunyuan/HunyuanDiT-v1.1-Diffusers-Distilled', device=args.device)
+        # only loaded when the first text prompt comes in
+        residency.register('t2i', lambda: HunyuanDiTPipeline(
+            'Tencent-Hunyuan/HunyuanDiT-v1.1-Diffusers-Distilled', device=args.device))
         HAS_T2I = True
 
     from hy3dgen.shapegen import FaceReducer, FloaterRemover, DegenerateFaceRemover, MeshSimplifier, \
-        Hunyuan3DDiTFlowMatchingPipeline
+        PostprocessChain, Hunyuan3DDiTFlowMatchingPipeline
     from hy3dgen.shapegen.pipelines import export_to_trimesh
     from hy3dgen.rembg import BackgroundRemover
 
-    rmbg_worker = BackgroundRemover()
-    i23d_worker = Hunyuan3DDiTFlowMatchingPipeline.from_pretrained(
-        args.model_path,
-        subfolder=args.subfolder,
-        use_safetensors=True,
-        device=args.device,
-    )
-    if args.enable_flashvdm:
-        mc_algo = 'mc' if args.device in ['cpu', 'mps'] else args.mc_algo
-        i23d_worker.enable_flashvdm(mc_algo=mc_algo)
-    if args.compile:
-        i23d_worker.compile()
+    def load_shape_pipeline():
+        pipeline = Hunyuan3DDiTFlowMatchingPipeline.from_pretrained(
+            args.model_path,
+            subfolder=args.subfolder,
+            use_safetensors=True,
+            device=args.device,
+        )
+        if args.enable_flashvdm:
+            mc_algo = 'mc' if args.device in ['cpu', 'mps'] else args.mc_algo
+            pipeline.enable_flashvdm(mc_algo=mc_algo)
+        if args.compile:
+            pipeline.compile()
+        return pipeline
+
+    residency.register('rembg', BackgroundRemover, obj=BackgroundRemover(), cpu_only=True)
+    residency.register('shapegen', load_shape_pipeline, obj=load_shape_pipeline())
 
     floater_remove_worker = FloaterRemover()
     degenerate_face_remove_worker = DegenerateFaceRemover()
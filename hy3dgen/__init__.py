@@ -10,4 +10,21 @@
 # their software and algorithms, including trained model weights, parameters (including
 # optimizer states), machine-learning model code, inference-enabling code, training-enabling code,
 # fine-tuning enabling code and other elements of the foregoing made publicly available
-# by Tencent in accordance with TENCENT HUNYUAN COMMUNITY LICENSE AGREEMENT.
\ No newline at end of file
+# by Tencent in accordance with TENCENT HUNYUAN COMMUNITY LICENSE AGREEMENT.
+
+# Subpackages are imported on first access, e.g. `hy3dgen.shapegen` does not load `hy3dgen.texgen`.
+import importlib
+
+_SUBMODULES = ['shapegen', 'texgen', 'rembg', 'text2image', 'residency']
+
+__all__ = list(_SUBMODULES)
+
+
+def __getattr__(name):
+    if name not in _SUBMODULES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return importlib.import_module(f'.{name}', __name__)
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,263 @@
+# Hunyuan 3D is licensed under the TENCENT HUNYUAN NON-COMMERCIAL LICENSE AGREEMENT
+# except for the third-party components listed below.
+# Hunyuan 3D does not impose any additional limitations beyond what is outlined
+# in the repsective licenses of these third-party components.
+# Users must comply with all terms and conditions of original licenses of these third-party
+# components and must ensure that the usage of the third party components adheres to
+# all relevant laws and regulations.
+
+# For avoidance of doubts, Hunyuan 3D means the large language models and
+# their software and algorithms, including trained model weights, parameters (including
+# optimizer states), machine-learning model code, inference-enabling code, training-enabling code,
+# fine-tuning enabling code and other elements of the foregoing made publicly available
+# by Tencent in accordance with TENCENT HUNYUAN COMMUNITY LICENSE AGREEMENT.
+
+import gc
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import torch
+
+logger = logging.getLogger('hy3dgen.residency')
+
+UNLOADED = 'unloaded'
+CPU = 'cpu'
+DEVICE = 'device'
+_TIER_ORDER = {UNLOADED: 0, CPU: 1, DEVICE: 2}
+
+
+def find_modules(obj, depth=2):
+    """The `nn.Module`s held by a model, a diffusers pipeline or one of the wrappers around them."""
+    if isinstance(obj, torch.nn.Module):
+        return [obj]
+    if depth == 0 or obj is None:
+        return []
+    modules = []
+    values = list(getattr(obj, 'components', {}).values()) if isinstance(getattr(obj, 'components', None), dict) \
+        else []
+    values += list(vars(obj).values()) if hasattr(obj, '__dict__') else []
+    for value in values:
+        for module in find_modules(value, depth - 1):
+            if all(module is not m for m in modules):
+                modules.append(module)
+    return modules
+
+
+def module_nbytes(modules):
+    seen = set()
+    total = 0
+    for module in modules:
+        for tensor in list(module.parameters()) + list(module.buffers()):
+            key = (tensor.data_ptr(), tensor.device)
+            if key not in seen:
+                seen.add(key)
+                total += tensor.numel() * tensor.element_size()
+    return total
+
+
+class ManagedModel:
+    def __init__(self, name, loader, setter=None, size_hint=0, cpu_only=False):
+        self.name = name
+        self.loader = loader
+        self.setter = setter
+        self.size_hint = size_hint
+        self.cpu_only = cpu_only
+        self.obj = None
+        self.tier = UNLOADED
+        self.nbytes = size_hint
+        self.in_use = 0
+        self.last_used = 0.0
+        # held while the model is loaded, moved or unloaded
+        self.lock = threading.Lock()
+
+    def assign(self, obj):
+        self.obj = obj
+        if self.setter is not None:
+            self.setter(obj)
+
+
+class ModelResidencyManager:
+    """Keeps models in device memory, pinned CPU memory or unloaded, within memory budgets.
+
+    Models are registered with a loader and moved as a whole. Acquiring a model brings it to the device,
+    first offloading the least recently used idle models to CPU when `device_budget` would be exceeded, and
+    unloading CPU models past `cpu_budget`. `prefetch` starts the same transition in the background so the
+    next stage is ready when the current one finishes.
+
+    Loads and transfers only hold the lock of the model they change, so a prefetch does not block models
+    that are already resident. The manager lock only guards the bookkeeping.
+
+    Args:
+        device: device the models run on.
+        device_budget (`int`, *optional*): bytes of model weights allowed on the device, unbounded if None.
+        cpu_budget (`int`, *optional*): bytes of model weights allowed in CPU memory, unbounded if None.
+        pin_memory (`bool`): pin offloaded weights so they are copied back to the device faster.
+    """
+
+    def __init__(self, device='cuda', device_budget=None, cpu_budget=None, pin_memory=True):
+        self.device = torch.device(device)
+        self.device_budget = device_budget
+        self.cpu_budget = cpu_budget
+        self.pin_memory = pin_memory and torch.cuda.is_available() and self.device.type == 'cuda'
+        self._models = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='hy3dgen-prefetch')
+
+    def register(self, name, loader, obj=None, setter=None, size_hint=0, cpu_only=False):
+        """Register a model.
+
+        Args:
+            loader: callable that builds the model from scratch, used after it was unloaded.
+            obj: the model if it is already loaded; its tier is inferred from where its weights are.
+            setter: called with the model whenever it is (re)loaded, or with None when it is unloaded,
+                so that owners do not keep stale references.
+            size_hint: weight bytes assumed before the model is first loaded.
+            cpu_only: the model never moves to the device, e.g. onnxruntime sessions.
+        """
+        entry = ManagedModel(name, loader, setter=setter, size_hint=size_hint, cpu_only=cpu_only)
+        if obj is not None:
+            entry.obj = obj
+            modules = find_modules(obj)
+            entry.nbytes = module_nbytes(modules) or size_hint
+            on_device = any(p.device.type == self.device.type for m in modules for p in m.parameters())
+            entry.tier = DEVICE if on_device and not cpu_only else CPU
+        with self._lock:
+            self._models[name] = entry
+        return entry
+
+    def _used(self, tier):
+        return sum(m.nbytes for m in self._models.values() if m.tier == tier)
+
+    def _make_room(self, tier, nbytes, keep):
+        budget = self.device_budget if tier == DEVICE else self.cpu_budget
+        if budget is None:
+            return
+        with self._lock:
+            candidates = sorted(
+                (m for m in self._models.values() if m.tier == tier and m.in_use == 0 and m is not keep),
+                key=lambda m: m.last_used,
+            )
+            used = self._used(tier)
+        for victim in candidates:
+            if used + nbytes <= budget:
+                return
+            # models that are being loaded or moved by another thread are skipped, never waited for
+            if not victim.lock.acquire(blocking=False):
+                continue
+            try:
+                with self._lock:
+                    if victim.tier != tier or victim.in_use > 0:
+                        continue
+                if tier == DEVICE:
+                    self._move(victim, CPU)
+                else:
+                    self._unload(victim)
+            finally:
+                victim.lock.release()
+            used -= victim.nbytes
+        if used + nbytes > budget:
+            logger.warning(f'Memory budget of {tier} exceeded by {(used + nbytes - budget) / 1024 ** 2:.0f} MB '
+                           f'while loading {keep.name}, all other models are in use')
+
+    def _move(self, entry, tier):
+        """Called with `entry.lock` held."""
+        if entry.tier == tier or entry.cpu_only:
+            return
+        self._make_room(tier, entry.nbytes, entry)
+
+        start = time.time()
+        device = self.device if tier == DEVICE else torch.device('cpu')
+        obj = entry.obj
+        if not isinstance(obj, torch.nn.Module) and callable(getattr(obj, 'to', None)):
+            obj.to(device)
+        else:
+            for module in find_modules(obj):
+                module.to(device)
+        if tier == CPU and self.pin_memory:
+            # through `_apply`, like `.to()`, so modules whose parameters share storage can restore it
+            for module in find_modules(obj):
+                module._apply(lambda tensor: tensor.pin_memory())
+        with self._lock:
+            entry.tier = tier
+        logger.info(f'Moved {entry.name} to {device} in {time.time() - start:.2f}s')
+
+    def _load(self, entry):
+        """Called with `entry.lock` held."""
+        start = time.time()
+        # loaders usually build straight onto the device
+        self._make_room(CPU if entry.cpu_only else DEVICE, entry.nbytes, entry)
+        entry.assign(entry.loader())
+        modules = find_modules(entry.obj)
+        nbytes = module_nbytes(modules) or entry.size_hint
+        on_device = any(p.device.type == self.device.type for m in modules for p in m.parameters())
+        with self._lock:
+            entry.nbytes = nbytes
+            entry.tier = DEVICE if on_device and not entry.cpu_only else CPU
+        logger.info(f'Loaded {entry.name} ({entry.nbytes / 1024 ** 2:.0f} MB) in {time.time() - start:.2f}s')
+
+    def _unload(self, entry):
+        """Called with `entry.lock` held."""
+        entry.assign(None)
+        with self._lock:
+            entry.tier = UNLOADED
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        logger.info(f'Unloaded {entry.name}')
+
+    def _ensure(self, name, tier, acquire=False):
+        with self._lock:
+            entry = self._models[name]
+        with entry.lock:
+            if entry.tier == UNLOADED:
+                self._load(entry)
+            if _TIER_ORDER[entry.tier] < _TIER_ORDER[tier]:
+                self._move(entry, tier)
+            if acquire:
+                # still under entry.lock, so the model cannot be evicted before it is marked in use
+                with self._lock:
+                    entry.in_use += 1
+        return entry
+
+    @contextmanager
+    def acquire(self, name):
+        """Bring a model to the device and keep it there for the duration of the block."""
+        entry = self._ensure(name, DEVICE, acquire=True)
+        try:
+            yield entry.obj
+        finally:
+            with self._lock:
+                entry.in_use -= 1
+                entry.last_used = time.time()
+
+    def prefetch(self, name, tier=DEVICE):
+        """Start loading a model in the background, returns a Future."""
+        return self._executor.submit(self._ensure, name, tier)
+
+    def offload(self, name):
+        with self._lock:
+            entry = self._models[name]
+        with entry.lock:
+            with self._lock:
+                idle = entry.tier == DEVICE and entry.in_use == 0
+            if idle:
+                self._move(entry, CPU)
+
+    def unload(self, name):
+        with self._lock:
+            entry = self._models[name]
+        with entry.lock:
+            with self._lock:
+                idle = entry.tier != UNLOADED and entry.in_use == 0
+            if idle:
+                self._unload(entry)
+
+    def stats(self):
+        with self._lock:
+            return {
+                name: {'tier': m.tier, 'mb': round(m.nbytes / 1024 ** 2), 'in_use': m.in_use}
+                for name, m in self._models.items()
+            }
@@ -12,6 +12,41 @@
 # fine-tuning enabling code and other elements of the foregoing made publicly available
 # by Tencent in accordance with TENCENT HUNYUAN COMMUNITY LICENSE AGREEMENT.
 
-from .pipelines import Hunyuan3DDiTPipeline, Hunyuan3DDiTFlowMatchingPipeline
-from .postprocessors import FaceReducer, FloaterRemover, DegenerateFaceRemover, MeshSimplifier
-from .preprocessors import ImageProcessorV2, IMAGE_PROCESSORS, DEFAULT_IMAGEPROCESSOR
+# Public names are resolved on first access, so importing the package does not pull in
+# diffusers, pymeshlab, skimage or the models until they are used.
+import importlib
+from typing import TYPE_CHECKING
+
+_LAZY_IMPORTS = {
+    'Hunyuan3DDiTPipeline': '.pipelines',
+    'Hunyuan3DDiTFlowMatchingPipeline': '.pipelines',
+    'GuidanceSchedule': '.guidance',
+    'FaceReducer': '.postprocessors',
+    'FloaterRemover': '.postprocessors',
+    'DegenerateFaceRemover': '.postprocessors',
+    'MeshSimplifier': '.postprocessors',
+    'PostprocessChain': '.postprocessors',
+    'ImageProcessorV2': '.preprocessors',
+    'IMAGE_PROCESSORS': '.preprocessors',
+    'DEFAULT_IMAGEPROCESSOR': '.preprocessors',
+}
+
+__all__ = list(_LAZY_IMPORTS)
+
+if TYPE_CHECKING:
+    from .pipelines import Hunyuan3DDiTPipeline, Hunyuan3DDiTFlowMatchingPipeline
+    from .guidance import GuidanceSchedule
+    from .postprocessors import FaceReducer, FloaterRemover, DegenerateFaceRemover, MeshSimplifier, PostprocessChain
+    from .preprocessors import ImageProcessorV2, IMAGE_PROCESSORS, DEFAULT_IMAGEPROCESSOR
+
+
+def __getattr__(name):
+    if name not in _LAZY_IMPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_LAZY_IMPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
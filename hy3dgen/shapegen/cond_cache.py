@@ -0,0 +1,179 @@
+# Hunyuan 3D is licensed under the TENCENT HUNYUAN NON-COMMERCIAL LICENSE AGREEMENT
+# except for the third-party components listed below.
+# Hunyuan 3D does not impose any additional limitations beyond what is outlined
+# in the repsective licenses of these third-party components.
+# Users must comply with all terms and conditions of original licenses of these third-party
+# components and must ensure that the usage of the third party components adheres to
+# all relevant laws and regulations.
+
+# For avoidance of doubts, Hunyuan 3D means the large language models and
+# their software and algorithms, including trained model weights, parameters (including
+# optimizer states), machine-learning model code, inference-enabling code, training-enabling code,
+# fine-tuning enabling code and other elements of the foregoing made publicly available
+# by Tencent in accordance with TENCENT HUNYUAN COMMUNITY LICENSE AGREEMENT.
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import torch
+
+from .utils import logger
+
+
+def map_nested(fn, value):
+    if isinstance(value, torch.Tensor):
+        return fn(value)
+    return {k: map_nested(fn, v) for k, v in value.items()}
+
+
+def cat_nested(values):
+    if isinstance(values[0], torch.Tensor):
+        return torch.cat(values, dim=0)
+    return {k: cat_nested([v[k] for v in values]) for k in values[0].keys()}
+
+
+def select_inputs(inputs: dict, indices):
+    """Pick the samples `indices` from a dict of batched tensors and per-sample lists."""
+    outputs = {}
+    for key, value in inputs.items():
+        if isinstance(value, torch.Tensor):
+            outputs[key] = value[indices]
+        elif isinstance(value, (list, tuple)):
+            outputs[key] = [value[i] for i in indices]
+        else:
+            outputs[key] = value
+    return outputs
+
+
+def flatten_nested(value, prefix=''):
+    if isinstance(value, torch.Tensor):
+        return {prefix: value}
+    flat = {}
+    for k, v in value.items():
+        flat.update(flatten_nested(v, f'{prefix}.{k}' if prefix else k))
+    return flat
+
+
+def unflatten_nested(flat):
+    value = {}
+    for key, tensor in flat.items():
+        node = value
+        *parents, leaf = key.split('.')
+        for parent in parents:
+            node = node.setdefault(parent, {})
+        node[leaf] = tensor
+    return value
+
+
+def conditioner_fingerprint(conditioner, namespace: str = '', num_sampled_params: int = 4,
+                            values_per_param: int = 4096):
+    """Hash of the conditioner architecture, configs and weights, used to scope cached embeddings to one model.
+
+    The weights are identified by a strided sample of `values_per_param` values from `num_sampled_params`
+    parameters spread over the model, so checkpoints with the same architecture do not share entries.
+    """
+    h = hashlib.sha256(namespace.encode())
+    for name, module in conditioner.named_modules():
+        h.update(f'{name}:{type(module).__qualname__};'.encode())
+        config = getattr(module, 'config', None)
+        if config is not None and hasattr(config, 'to_json_string'):
+            h.update(config.to_json_string().encode())
+    params = [(name, p) for name, p in conditioner.named_parameters() if p.device.type != 'meta']
+    if params:
+        h.update(str(params[0][1].dtype).encode())
+    step = max(1, len(params) // num_sampled_params)
+    for name, param in params[::step][:num_sampled_params]:
+        values = param.detach().flatten()
+        values = values[::max(1, values.numel() // values_per_param)][:values_per_param]
+        h.update(name.encode())
+        h.update(values.to(torch.float32).cpu().numpy().tobytes())
+    return h.hexdigest()
+
+
+def sample_key(fingerprint: str, image: torch.Tensor, inputs: dict):
+    """Content hash of one preprocessed sample (image of batch size 1 and its per-sample inputs)."""
+    h = hashlib.blake2b(fingerprint.encode(), digest_size=20)
+    for name, value in [('image', image)] + sorted(inputs.items()):
+        h.update(name.encode())
+        if isinstance(value, torch.Tensor):
+            h.update(str((tuple(value.shape), value.dtype)).encode())
+            h.update(value.detach().cpu().contiguous().flatten().view(torch.uint8).numpy().tobytes())
+        else:
+            h.update(repr(value).encode())
+    return h.hexdigest()
+
+
+class ConditionCache:
+    """Content-addressed cache of conditioner outputs for single samples.
+
+    Entries hold the conditional and unconditional embeddings of one image, kept on CPU in an LRU of
+    `max_entries`. If `cache_dir` is given, entries are also written to `{cache_dir}/{key}.safetensors`
+    and reloaded from there after they fall out of memory.
+    """
+
+    def __init__(self, max_entries: int = 32, cache_dir: str = None):
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f'{key}.safetensors')
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+
+        if self.cache_dir is not None and os.path.exists(self._path(key)):
+            import safetensors.torch
+            try:
+                entry = unflatten_nested(safetensors.torch.load_file(self._path(key), device='cpu'))
+            except Exception as e:
+                logger.warning(f'Failed to load cached condition {key}: {e}')
+            else:
+                with self._lock:
+                    self.disk_hits += 1
+                self._put_memory(key, entry)
+                return entry
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _put_memory(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def put(self, key, entry):
+        entry = map_nested(lambda t: t.detach().to('cpu').clone(), entry)
+        self._put_memory(key, entry)
+        if self.cache_dir is not None:
+            import safetensors.torch
+            safetensors.torch.save_file(flatten_nested(entry), self._path(key))
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+            }
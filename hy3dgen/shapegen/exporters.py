@@ -0,0 +1,137 @@
+# Hunyuan 3D is licensed under the TENCENT HUNYUAN NON-COMMERCIAL LICENSE AGREEMENT
+# except for the third-party components listed below.
+# Hunyuan 3D does not impose any additional limitations beyond what is outlined
+# in the repsective licenses of these third-party components.
+# Users must comply with all terms and conditions of original licenses of these third-party
+# components and must ensure that the usage of the third party components adheres to
+# all relevant laws and regulations.
+
+# For avoidance of doubts, Hunyuan 3D means the large language models and
+# their software and algorithms, including trained model weights, parameters (including
+# optimizer states), machine-learning model code, inference-enabling code, training-enabling code,
+# fine-tuning enabling code and other elements of the foregoing made publicly available
+# by Tencent in accordance with TENCENT HUNYUAN COMMUNITY LICENSE AGREEMENT.
+
+import io
+import json
+import struct
+
+import numpy as np
+import trimesh
+
+MEDIA_TYPES = {
+    'glb': 'model/gltf-binary',
+    'obj': 'model/obj',
+    'ply': 'application/octet-stream',
+}
+
+
+def _pad4(length):
+    return (4 - length % 4) % 4
+
+
+def _raw_bytes(array: np.ndarray):
+    """A byte view of a contiguous array, written without an intermediate `tobytes` copy."""
+    return np.ascontiguousarray(array).view(np.uint8)
+
+
+def write_glb(vertices: np.ndarray, faces: np.ndarray, file_obj):
+    """Write a single-primitive glTF 2.0 binary from vertex and face arrays."""
+    vertices = np.ascontiguousarray(vertices, dtype='<f4')
+    faces = np.ascontiguousarray(faces, dtype='<u4')
+    positions_size = vertices.nbytes
+    indices_size = faces.nbytes
+
+    gltf = {
+        'asset': {'version': '2.0', 'generator': 'hy3dgen'},
+        'scene': 0,
+        'scenes': [{'nodes': [0]}],
+        'nodes': [{'mesh': 0}],
+        'meshes': [{'primitives': [{'attributes': {'POSITION': 0}, 'indices': 1, 'mode': 4}]}],
+        'buffers': [{'byteLength': positions_size + indices_size}],
+        'bufferViews': [
+            {'buffer': 0, 'byteOffset': 0, 'byteLength': positions_size, 'target': 34962},
+            {'buffer': 0, 'byteOffset': positions_size, 'byteLength': indices_size, 'target': 34963},
+        ],
+        'accessors': [
+            {
+                'bufferView': 0, 'componentType': 5126, 'count': len(vertices), 'type': 'VEC3',
+                'min': vertices.min(axis=0).tolist() if len(vertices) else [0, 0, 0],
+                'max': vertices.max(axis=0).tolist() if len(vertices) else [0, 0, 0],
+            },
+            {'bufferView': 1, 'componentType': 5125, 'count': faces.size, 'type': 'SCALAR'},
+        ],
+    }
+    json_chunk = json.dumps(gltf, separators=(',', ':')).encode()
+    json_chunk += b' ' * _pad4(len(json_chunk))
+    bin_size = positions_size + indices_size
+    bin_padding = _pad4(bin_size)
+    total_size = 12 + 8 + len(json_chunk) + 8 + bin_size + bin_padding
+
+    file_obj.write(struct.pack('<4sII', b'glTF', 2, total_size))
+    file_obj.write(struct.pack('<I4s', len(json_chunk), b'JSON'))
+    file_obj.write(json_chunk)
+    file_obj.write(struct.pack('<I4s', bin_size + bin_padding, b'BIN\x00'))
+    file_obj.write(_raw_bytes(vertices))
+    file_obj.write(_raw_bytes(faces))
+    file_obj.write(b'\x00' * bin_padding)
+
+
+def write_obj(vertices: np.ndarray, faces: np.ndarray, file_obj):
+    np.savetxt(file_obj, vertices, fmt='v %.6f %.6f %.6f')
+    np.savetxt(file_obj, np.asarray(faces, dtype=np.int64) + 1, fmt='f %d %d %d')
+
+
+def write_ply(vertices: np.ndarray, faces: np.ndarray, file_obj):
+    """Write a binary little-endian PLY."""
+    vertices = np.ascontiguousarray(vertices, dtype='<f4')
+    face_records = np.empty(len(faces), dtype=[('count', 'u1'), ('index', '<i4', (3,))])
+    face_records['count'] = 3
+    face_records['index'] = faces
+    header = (
+        'ply\n'
+        'format binary_little_endian 1.0\n'
+        f'element vertex {len(vertices)}\n'
+        'property float x\n'
+        'property float y\n'
+        'property float z\n'
+        f'element face {len(faces)}\n'
+        'property list uchar int vertex_indices\n'
+        'end_header\n'
+    )
+    file_obj.write(header.encode('ascii'))
+    file_obj.write(_raw_bytes(vertices))
+    file_obj.write(_raw_bytes(face_records))
+
+
+MESH_WRITERS = {
+    'glb': write_glb,
+    'obj': write_obj,
+    'ply': write_ply,
+}
+
+
+def export_mesh_buffer(mesh: trimesh.Trimesh, file_type: str = 'glb') -> io.BytesIO:
+    """Serialize `mesh` into an in-memory buffer.
+
+    Untextured meshes are written straight from their vertex and face arrays. Meshes with texture or
+    material visuals fall back to trimesh's exporter, still without touching the disk.
+    Use `buffer.getbuffer()` to read the result without copying it.
+    """
+    file_type = file_type.lower()
+    buffer = io.BytesIO()
+    is_plain = isinstance(mesh, trimesh.Trimesh) and not mesh.visual.defined
+    if is_plain and file_type in MESH_WRITERS:
+        MESH_WRITERS[file_type](mesh.vertices, mesh.faces, buffer)
+    else:
+        data = mesh.export(file_type=file_type)
+        buffer.write(data.encode() if isinstance(data, str) else data)
+    buffer.seek(0)
+    return buffer
+
+
+def iter_buffer(buffer: io.BytesIO, chunk_size: int = 1 << 20):
+    """Yield zero-copy chunks of `buffer` for streaming responses."""
+    view = buffer.getbuffer()
+    for start in range(0, len(view), chunk_size):
+        yield view[start:start + chunk_size]
@@ -0,0 +1,56 @@
+# Hunyuan 3D is licensed under the TENCENT HUNYUAN NON-COMMERCIAL LICENSE AGREEMENT
+# except for the third-party components listed below.
+# Hunyuan 3D does not impose any additional limitations beyond what is outlined
+# in the repsective licenses of these third-party components.
+# Users must comply with all terms and conditions of original licenses of these third-party
+# components and must ensure that the usage of the third party components adheres to
+# all relevant laws and regulations.
+
+# For avoidance of doubts, Hunyuan 3D means the large language models and
+# their software and algorithms, including trained model weights, parameters (including
+# optimizer states), machine-learning model code, inference-enabling code, training-enabling code,
+# fine-tuning enabling code and other elements of the foregoing made publicly available
+# by Tencent in accordance with TENCENT HUNYUAN COMMUNITY LICENSE AGREEMENT.
+
+GUIDED = 'guided'
+REUSE = 'reuse'
+UNGUIDED = 'unguided'
+
+
+class GuidanceSchedule:
+    """Which sampling steps of the flow-matching pipeline run classifier-free guidance.
+
+    A guided step runs the conditional and unconditional branches as one batch of twice the size. Other steps
+    run the conditional branch alone: inside `interval` they reuse the guidance direction `cond - uncond` of the
+    last guided step, outside it they apply no guidance.
+
+    Args:
+        interval (`Tuple[float, float]`): start and end of the guided range in model time, where 0 is pure noise
+            and 1 the clean sample.
+        every (`int`): run a guided step every `every` steps inside the interval.
+
+    Example:
+        pipeline(image=image, guidance_schedule=GuidanceSchedule(interval=(0.0, 0.6), every=2))
+    """
+
+    def __init__(self, interval=(0.0, 1.0), every=1):
+        if every < 1:
+            raise ValueError(f"`every` must be a positive integer, got {every}")
+        self.interval = tuple(interval)
+        self.every = every
+
+    def plan(self, times):
+        """Mode of each step (`GUIDED`, `REUSE` or `UNGUIDED`) for a list of model times."""
+        start, end = self.interval
+        modes = []
+        position = 0
+        for t in times:
+            if not start <= t <= end:
+                modes.append(UNGUIDED)
+                continue
+            modes.append(GUIDED if position % self.every == 0 else REUSE)
+            position += 1
+        return modes
+
+    def __repr__(self):
+        return f'GuidanceSchedule(interval={self.interval}, every={self.every})'
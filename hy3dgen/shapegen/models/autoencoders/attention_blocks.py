@@ -22,7 +22,6 @@ from einops import rearrange
 from torch import Tensor
 
 from .attention_processors import CrossAttentionProcessor
-from ...utils import logger
 
 scaled_dot_product_attention = nn.functional.scaled_dot_product_attention
 
@@ -200,7 +199,7 @@ class QKVMultiheadCrossAttention(nn.Module):
 
         self.attn_processor = CrossAttentionProcessor()
 
-    def forward(self, q, kv):
+    def forward(self, q, kv, kv_selection=None):
         _, n_ctx, _ = q.shape
         bs, n_data, width = kv.shape
         attn_ch = width // self.heads // 2
@@ -211,7 +210,7 @@ class QKVMultiheadCrossAttention(nn.Module):
         q = self.q_norm(q)
         k = self.k_norm(k)
         q, k, v = map(lambda t: rearrange(t, 'b n h d -> b h n d', h=self.heads), (q, k, v))
-        out = self.attn_processor(self, q, k, v)
+        out = self.attn_processor(self, q, k, v, kv_selection=kv_selection)
         out = out.transpose(1, 2).reshape(bs, n_ctx, -1)
         return out
 
@@ -227,7 +226,6 @@ class MultiheadCrossAttention(nn.Module):
         data_width: Optional[int] = None,
         norm_layer=nn.LayerNorm,
         qk_norm: bool = False,
-        kv_cache: bool = False,
     ):
         super().__init__()
         self.n_data = n_data
@@ -244,19 +242,18 @@ class MultiheadCrossAttention(nn.Module):
             norm_layer=norm_layer,
             qk_norm=qk_norm
         )
-        self.kv_cache = kv_cache
-        self.data = None
 
-    def forward(self, x, data):
+    def project_kv(self, data):
+        return self.c_kv(data)
+
+    def forward(self, x, data, kv_selection=None, data_kv=None):
+        """
+        Args:
+            data_kv: `project_kv(data)` computed by the caller, `data` is not used when it is given.
+        """
         x = self.c_q(x)
-        if self.kv_cache:
-            if self.data is None:
-                self.data = self.c_kv(data)
-                logger.info('Save kv cache,this should be called only once for one mesh')
-            data = self.data
-        else:
-            data = self.c_kv(data)
-        x = self.attention(x, data)
+        data = self.c_kv(data) if data_kv is None else data_kv
+        x = self.attention(x, data, kv_selection=kv_selection)
         x = self.c_proj(x)
         return x
 
@@ -293,8 +290,12 @@ class ResidualCrossAttentionBlock(nn.Module):
         self.ln_3 = norm_layer(width, elementwise_affine=True, eps=1e-6)
         self.mlp = MLP(width=width, expand_ratio=mlp_expand_ratio)
 
-    def forward(self, x: torch.Tensor, data: torch.Tensor):
-        x = x + self.attn(self.ln_1(x), self.ln_2(data))
+    def project_kv(self, data: torch.Tensor):
+        return self.attn.project_kv(self.ln_2(data))
+
+    def forward(self, x: torch.Tensor, data: torch.Tensor = None, kv_selection=None, data_kv=None):
+        data = self.ln_2(data) if data_kv is None else None
+        x = x + self.attn(self.ln_1(x), data, kv_selection=kv_selection, data_kv=data_kv)
         x = x + self.mlp(self.ln_3(x))
         return x
 
@@ -479,15 +480,36 @@ class CrossAttentionDecoder(nn.Module):
         self.cross_attn_decoder.attn.attention.attn_processor = processor
 
     def set_default_cross_attention_processor(self):
-        self.cross_attn_decoder.attn.attention.attn_processor = CrossAttentionProcessor
+        self.cross_attn_decoder.attn.attention.attn_processor = CrossAttentionProcessor()
 
-    def forward(self, queries=None, query_embeddings=None, latents=None):
-        if query_embeddings is None:
-            query_embeddings = self.query_proj(self.fourier_embedder(queries).to(latents.dtype))
-        self.count += query_embeddings.shape[1]
+    def project_latents(self, latents):
+        """
+        Keys and values of the cross attention for `latents`.
+
+        Volume decoders compute them once per decode and pass them to every query chunk as `latents_kv`,
+        slicing or repeating them along the batch like the latents. They are dropped when the decode returns.
+        """
         if self.downsample_ratio != 1:
             latents = self.latents_proj(latents)
-        x = self.cross_attn_decoder(query_embeddings, latents)
+        return self.cross_attn_decoder.project_kv(latents)
+
+    def forward(self, queries=None, query_embeddings=None, latents=None, kv_selection=None, latents_kv=None):
+        """
+        Args:
+            kv_selection: latent token selection of this call, passed to the attention processor; see
+                `FlashVDMCrossAttentionProcessor`. Processors without selection support attend to all tokens.
+            latents_kv: `project_latents(latents)`, skips projecting the latents again for this chunk.
+        """
+        dtype = latents.dtype if latents_kv is None else latents_kv.dtype
+        if query_embeddings is None:
+            query_embeddings = self.query_proj(self.fourier_embedder(queries).to(dtype))
+        self.count += query_embeddings.shape[1]
+        if latents_kv is not None:
+            x = self.cross_attn_decoder(query_embeddings, kv_selection=kv_selection, data_kv=latents_kv)
+        else:
+            if self.downsample_ratio != 1:
+                latents = self.latents_proj(latents)
+            x = self.cross_attn_decoder(query_embeddings, latents, kv_selection=kv_selection)
         if self.enable_ln_post:
             x = self.ln_post(x)
         occ = self.output_proj(x)
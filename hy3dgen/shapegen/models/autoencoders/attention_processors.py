@@ -27,16 +27,25 @@ if os.environ.get('CA_USE_SAGEATTN', '0') == '1':
 
 
 class CrossAttentionProcessor:
-    def __call__(self, attn, q, k, v):
+    def __call__(self, attn, q, k, v, kv_selection=None):
         out = scaled_dot_product_attention(q, k, v)
         return out
 
 
 class FlashVDMCrossAttentionProcessor:
-    def __init__(self, topk=None):
-        self.topk = topk
+    """
+    Cross attention against an adaptive subset of the latent tokens.
 
-    def __call__(self, attn, q, k, v):
+    The selection is given per call as `kv_selection`: True to select one key subset for all queries, None or
+    False for full attention, or `(cell_ids, counts)` of spatial cells whose queries are contiguous in `q`, each
+    cell getting its own subset. The processor keeps no per-call state, so concurrent decodes can share it.
+    Cells are processed `cells_per_batch` at a time: their queries are padded to the longest cell of the batch,
+    the key subsets of all of them are selected at once and a single attention call covers the batch.
+    """
+
+    cells_per_batch = 32
+
+    def __call__(self, attn, q, k, v, kv_selection=None):
         if k.shape[-2] == 3072:
             topk = 1024
         elif k.shape[-2] == 512:
@@ -44,7 +53,7 @@ class FlashVDMCrossAttentionProcessor:
         else:
             topk = k.shape[-2] // 3
 
-        if self.topk is True:
+        if kv_selection is True:
             q1 = q[:, :, ::100, :]
             sim = q1 @ k.transpose(-1, -2)
             sim = torch.mean(sim, -2)
@@ -53,44 +62,83 @@ class FlashVDMCrossAttentionProcessor:
             v0 = torch.gather(v, dim=-2, index=topk_ind)
             k0 = torch.gather(k, dim=-2, index=topk_ind)
             out = scaled_dot_product_attention(q, k0, v0)
-        elif self.topk is False:
+        elif kv_selection is None or kv_selection is False:
             out = scaled_dot_product_attention(q, k, v)
         else:
-            idx, counts = self.topk
-            start = 0
-            outs = []
-            for grid_coord, count in zip(idx, counts):
-                end = start + count
-                q_chunk = q[:, :, start:end, :]
-                k0, v0 = self.select_topkv(q_chunk, k, v, topk)
-                out = scaled_dot_product_attention(q_chunk, k0, v0)
-                outs.append(out)
-                start += count
-            out = torch.cat(outs, dim=-2)
-        self.topk = False
+            idx, counts = kv_selection
+            out = self.attend_cells(q, k, v, counts, topk)
         return out
 
-    def select_topkv(self, q_chunk, k, v, topk):
-        q1 = q_chunk[:, :, ::50, :]
-        sim = q1 @ k.transpose(-1, -2)
-        sim = torch.mean(sim, -2)
-        topk_ind = torch.topk(sim, dim=-1, k=topk).indices.squeeze(-2).unsqueeze(-1)
-        topk_ind = topk_ind.expand(-1, -1, -1, v.shape[-1])
-        v0 = torch.gather(v, dim=-2, index=topk_ind)
-        k0 = torch.gather(k, dim=-2, index=topk_ind)
-        return k0, v0
+    def attend_cells(self, q, k, v, counts, topk):
+        out = torch.empty_like(q)
+        starts = [0]
+        for count in counts[:-1]:
+            starts.append(starts[-1] + count)
+        # cells of similar size are batched together to keep the padding small
+        order = sorted(range(len(counts)), key=counts.__getitem__)
+        for group_start in range(0, len(order), self.cells_per_batch):
+            cells = order[group_start:group_start + self.cells_per_batch]
+            group_counts = [counts[c] for c in cells]
+            length, total = max(group_counts), sum(group_counts)
+            cell_counts = torch.tensor(group_counts, device=q.device)
+            cell_starts = torch.tensor([starts[c] for c in cells], device=q.device)
+
+            # [G, L] rows of q for each cell, padded by repeating the last query of the cell
+            positions = torch.arange(length, device=q.device)
+            valid = positions[None] < cell_counts[:, None]
+            rows = cell_starts[:, None] + torch.minimum(positions[None], cell_counts[:, None] - 1)
+            q_cells = q[:, :, rows]
+
+            k0, v0, key_mask = self.select_cell_kv(q_cells, valid, k, v, topk)
+            out_cells = self.cell_attention(q_cells, k0, v0, key_mask)
+
+            cell_ids = torch.repeat_interleave(
+                torch.arange(len(cells), device=q.device), cell_counts, output_size=total)
+            within = torch.arange(total, device=q.device) - (cell_counts.cumsum(0) - cell_counts)[cell_ids]
+            out[:, :, cell_starts[cell_ids] + within] = out_cells.flatten(2, 3)[:, :, cell_ids * length + within]
+        return out
+
+    def select_cell_kv(self, q_cells, valid, k, v, topk):
+        """Keys and values of each cell, [B, H, G, topk, D], from the mean of every 50th query of the cell."""
+        sampled = valid & (torch.arange(valid.shape[1], device=valid.device) % 50 == 0)
+        weights = sampled / sampled.sum(-1, keepdim=True)
+        # the mean similarity equals the similarity of the mean query
+        q_mean = torch.einsum('bhgld,gl->bhgd', q_cells, weights.to(q_cells.dtype))
+        sim = q_mean @ k.transpose(-1, -2)
+        topk_ind = torch.topk(sim, dim=-1, k=topk).indices.unsqueeze(-1).expand(-1, -1, -1, -1, v.shape[-1])
+        num_cells = q_cells.shape[2]
+        k0 = torch.gather(k.unsqueeze(2).expand(-1, -1, num_cells, -1, -1), dim=-2, index=topk_ind)
+        v0 = torch.gather(v.unsqueeze(2).expand(-1, -1, num_cells, -1, -1), dim=-2, index=topk_ind)
+        return k0, v0, None
+
+    def cell_attention(self, q_cells, k0, v0, key_mask=None):
+        """Attention of [B, H, G, L, D] queries over per-cell keys, with the cells folded into the batch."""
+        batch, heads, num_cells, length, dim = q_cells.shape
+
+        def fold(t):
+            return t.transpose(1, 2).reshape(batch * num_cells, heads, t.shape[-2], dim)
+
+        if key_mask is None:
+            out = scaled_dot_product_attention(fold(q_cells), fold(k0), fold(v0))
+        else:
+            attn_mask = key_mask[None, :, None, None, :].expand(batch, -1, -1, -1, -1).flatten(0, 1)
+            out = F.scaled_dot_product_attention(fold(q_cells), fold(k0), fold(v0), attn_mask=attn_mask)
+        return out.view(batch, num_cells, heads, length, dim).transpose(1, 2)
 
 
 class FlashVDMTopMCrossAttentionProcessor(FlashVDMCrossAttentionProcessor):
-    def select_topkv(self, q_chunk, k, v, topk):
-        q1 = q_chunk[:, :, ::30, :]
-        sim = q1 @ k.transpose(-1, -2)
-        # sim = sim.to(torch.float32)
+    def select_cell_kv(self, q_cells, valid, k, v, topk):
+        """
+        Keys activated by any of every 30th query of the cell, padded to the largest cell with a key mask.
+        """
+        q_sampled = q_cells[:, :, :, ::30]
+        sampled = valid[:, ::30]
+        sim = q_sampled @ k.transpose(-1, -2).unsqueeze(2)
         sim = sim.softmax(-1)
         sim = torch.mean(sim, 1)
-        activated_token = torch.where(sim > 1e-6)[2]
-        index = torch.unique(activated_token, return_counts=True)[0].unsqueeze(0).unsqueeze(0).unsqueeze(-1)
-        index = index.expand(-1, v.shape[1], -1, v.shape[-1])
-        v0 = torch.gather(v, dim=-2, index=index)
-        k0 = torch.gather(k, dim=-2, index=index)
-        return k0, v0
+        activated = ((sim > 1e-6) & sampled[None, :, :, None]).any(-2).any(0)
+        num_activated = activated.sum(-1)
+        # activated keys first, in index order, then padding
+        index = torch.argsort((~activated).to(torch.uint8), dim=-1, stable=True)[:, :int(num_activated.max())]
+        key_mask = torch.arange(index.shape[1], device=index.device)[None] < num_activated[:, None]
+        return k[:, :, index], v[:, :, index], key_mask
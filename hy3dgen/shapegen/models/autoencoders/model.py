@@ -24,7 +24,7 @@ import yaml
 from .attention_blocks import FourierEmbedder, Transformer, CrossAttentionDecoder, PointCrossAttentionEncoder
 from .surface_extractors import MCSurfaceExtractor, SurfaceExtractors
 from .volume_decoders import VanillaVolumeDecoder, FlashVDMVolumeDecoding, HierarchicalVolumeDecoding
-from ...utils import logger, synchronize_timer, smart_load_model
+from ...utils import logger, synchronize_timer, smart_load_model, load_checkpoint, instantiate_with_state_dict
 
 
 class DiagonalGaussianDistribution(object):
@@ -99,17 +99,12 @@ class VectsetVAE(nn.Module):
             raise FileNotFoundError(f"Model file {ckpt_path} not found")
 
         logger.info(f"Loading model from {ckpt_path}")
-        if use_safetensors:
-            import safetensors.torch
-            ckpt = safetensors.torch.load_file(ckpt_path, device='cpu')
-        else:
-            ckpt = torch.load(ckpt_path, map_location='cpu', weights_only=True)
+        ckpt = load_checkpoint(ckpt_path, use_safetensors)
 
         model_kwargs = config['params']
         model_kwargs.update(kwargs)
 
-        model = cls(**model_kwargs)
-        model.load_state_dict(ckpt)
+        model = instantiate_with_state_dict(lambda: cls(**model_kwargs), ckpt, cls.__name__)
         model.to(device=device, dtype=dtype)
         return model
 
@@ -187,12 +182,22 @@ class VectsetVAE(nn.Module):
                 self.volume_decoder = FlashVDMVolumeDecoding(topk_mode)
             else:
                 self.volume_decoder = HierarchicalVolumeDecoding()
-            if mc_algo not in SurfaceExtractors.keys():
-                raise ValueError(f'Unsupported mc_algo {mc_algo}, available: {list(SurfaceExtractors.keys())}')
-            self.surface_extractor = SurfaceExtractors[mc_algo]()
+            self.set_surface_extractor(mc_algo)
         else:
             self.volume_decoder = VanillaVolumeDecoder()
-            self.surface_extractor = MCSurfaceExtractor()
+            self.set_surface_extractor('mc')
+
+    def set_surface_extractor(self, mc_algo):
+        """Switch to the `mc_algo` surface extractor, keeping the current one if it is already of that kind."""
+        if mc_algo not in SurfaceExtractors.keys():
+            raise ValueError(f'Unsupported mc_algo {mc_algo}, available: {list(SurfaceExtractors.keys())}')
+        current = self.surface_extractor
+        if type(current) is SurfaceExtractors[mc_algo]:
+            return
+        # shut down the worker pool of a replaced brick extractor
+        if hasattr(current, 'close'):
+            current.close()
+        self.surface_extractor = SurfaceExtractors[mc_algo]()
 
 
 class ShapeVAE(VectsetVAE):
@@ -0,0 +1,275 @@
+# Hunyuan 3D is licensed under the TENCENT HUNYUAN NON-COMMERCIAL LICENSE AGREEMENT
+# except for the third-party components listed below.
+# Hunyuan 3D does not impose any additional limitations beyond what is outlined
+# in the repsective licenses of these third-party components.
+# Users must comply with all terms and conditions of original licenses of these third-party
+# components and must ensure that the usage of the third party components adheres to
+# all relevant laws and regulations.
+
+# For avoidance of doubts, Hunyuan 3D means the large language models and
+# their software and algorithms, including trained model weights, parameters (including
+# optimizer states), machine-learning model code, inference-enabling code, training-enabling code,
+# fine-tuning enabling code and other elements of the foregoing made publicly available
+# by Tencent in accordance with TENCENT HUNYUAN COMMUNITY LICENSE AGREEMENT.
+
+import math
+
+import torch
+
+
+def _dilate_axis(mask: torch.Tensor, radius: int, dim: int):
+    """Binary dilation of `mask` along `dim`. The input is padded by `radius` on both sides of `dim`."""
+    length = mask.shape[dim] - 2 * radius
+    out = mask.narrow(dim, 0, length).clone()
+    for offset in range(1, 2 * radius + 1):
+        out |= mask.narrow(dim, offset, length)
+    return out
+
+
+class SparseBlockGrid:
+    """A batch of (R+1)^3 logit grids stored as active bricks of `block_size`^3 voxels.
+
+    Only bricks close to the surface are allocated, so memory scales with surface area instead of volume.
+
+    Attributes:
+        brick_coords (torch.LongTensor): [K, 4] brick coordinates (b, bx, by, bz), sorted by sample index.
+        bricks (torch.Tensor): [K, S, S, S] logits of the active bricks, unevaluated voxels hold `fill_value`.
+        active (torch.BoolTensor): [K, S, S, S] voxels that are evaluated (or to be evaluated).
+        brick_index (torch.IntTensor): [B, n, n, n] slot of each brick in `bricks`, -1 if inactive.
+    """
+
+    def __init__(
+        self,
+        brick_coords: torch.Tensor,
+        bricks: torch.Tensor,
+        active: torch.Tensor,
+        batch_size: int,
+        resolution: int,
+        block_size: int = 8,
+        fill_value: float = -10000.,
+    ):
+        self.brick_coords = brick_coords
+        self.bricks = bricks
+        self.active = active
+        self.batch_size = batch_size
+        self.resolution = resolution
+        self.block_size = block_size
+        self.fill_value = fill_value
+        self.blocks_per_axis = math.ceil((resolution + 1) / block_size)
+
+        n = self.blocks_per_axis
+        self.brick_index = torch.full((batch_size, n, n, n), -1, dtype=torch.int32, device=bricks.device)
+        self.brick_index[brick_coords[:, 0], brick_coords[:, 1], brick_coords[:, 2], brick_coords[:, 3]] = \
+            torch.arange(brick_coords.shape[0], dtype=torch.int32, device=bricks.device)
+
+    @property
+    def shape(self):
+        return (self.batch_size, self.resolution + 1, self.resolution + 1, self.resolution + 1)
+
+    @property
+    def device(self):
+        return self.bricks.device
+
+    @property
+    def dtype(self):
+        return self.bricks.dtype
+
+    @property
+    def num_bricks(self):
+        return self.brick_coords.shape[0]
+
+    @property
+    def nbytes(self):
+        tensors = (self.brick_coords, self.bricks, self.active, self.brick_index)
+        return sum(t.numel() * t.element_size() for t in tensors)
+
+    def __len__(self):
+        return self.batch_size
+
+    def __getitem__(self, i: int):
+        """The grid of sample `i`, as a SparseBlockGrid of batch size 1."""
+        select = self.brick_coords[:, 0] == i
+        brick_coords = self.brick_coords[select].clone()
+        brick_coords[:, 0] = 0
+        return SparseBlockGrid(
+            brick_coords, self.bricks[select], self.active[select],
+            batch_size=1, resolution=self.resolution, block_size=self.block_size, fill_value=self.fill_value,
+        )
+
+    @classmethod
+    def from_dense(cls, grid_logits: torch.Tensor, block_size: int = 8, fill_value: float = -10000.):
+        """Build a grid with every brick active from dense logits of shape [B, R+1, R+1, R+1]."""
+        batch_size, size = grid_logits.shape[0], grid_logits.shape[1]
+        n = math.ceil(size / block_size)
+        pad = n * block_size - size
+        device = grid_logits.device
+
+        dense = torch.full((batch_size, n * block_size, n * block_size, n * block_size), fill_value,
+                           dtype=grid_logits.dtype, device=device)
+        dense[:, :size, :size, :size] = grid_logits
+        bricks = dense.view(batch_size, n, block_size, n, block_size, n, block_size) \
+            .permute(0, 1, 3, 5, 2, 4, 6).reshape(-1, block_size, block_size, block_size)
+
+        inside = torch.ones(n * block_size, dtype=torch.bool, device=device)
+        if pad > 0:
+            inside[size:] = False
+        active = inside[:, None, None] & inside[None, :, None] & inside[None, None, :]
+        active = active.view(n, block_size, n, block_size, n, block_size).permute(0, 2, 4, 1, 3, 5) \
+            .reshape(1, -1, block_size, block_size, block_size).expand(batch_size, -1, -1, -1, -1) \
+            .reshape(-1, block_size, block_size, block_size)
+
+        brick_coords = torch.stack(torch.meshgrid(
+            torch.arange(batch_size, device=device),
+            torch.arange(n, device=device),
+            torch.arange(n, device=device),
+            torch.arange(n, device=device),
+            indexing='ij'
+        ), dim=-1).reshape(-1, 4)
+        return cls(brick_coords, bricks.contiguous(), active.contiguous(), batch_size, size - 1,
+                   block_size=block_size, fill_value=fill_value)
+
+    @classmethod
+    def from_seed_points(
+        cls,
+        seeds,
+        radius: int,
+        batch_size: int,
+        resolution: int,
+        dtype=torch.float32,
+        block_size: int = 8,
+        fill_value: float = -10000.,
+    ):
+        """Allocate the bricks covering every voxel within Chebyshev distance `radius` of the seed points.
+
+        Args:
+            seeds: a tuple (b, x, y, z) of index tensors in the coordinates of this grid.
+            radius: dilation radius in voxels, at most half of `block_size`.
+
+        Returns:
+            a SparseBlockGrid whose `active` mask marks the dilated seeds, with every value set to `fill_value`.
+        """
+        # a dilated seed must not reach past the bricks on either side of its own
+        assert 2 * radius <= block_size, "radius must not exceed half of block_size"
+        b, xyz = seeds[0], torch.stack(seeds[1:], dim=1)
+        device = xyz.device
+        n = math.ceil((resolution + 1) / block_size)
+
+        # a seed touches at most two bricks per axis
+        lo = (xyz - radius).clamp(min=0) // block_size
+        hi = (xyz + radius).clamp(max=resolution) // block_size
+        choices = torch.stack([lo, hi], dim=1)  # [N, 2, 3]
+        corner = torch.stack(torch.meshgrid(*[torch.arange(2, device=device)] * 3, indexing='ij'), dim=-1)
+        corner = corner.reshape(-1, 3)  # [8, 3]
+        candidate = torch.stack([choices[:, corner[:, d], d] for d in range(3)], dim=-1)  # [N, 8, 3]
+        keys = ((b[:, None] * n + candidate[..., 0]) * n + candidate[..., 1]) * n + candidate[..., 2]
+        unique_keys = torch.unique(keys)
+
+        brick_coords = torch.stack([
+            unique_keys // n ** 3,
+            unique_keys // n ** 2 % n,
+            unique_keys // n % n,
+            unique_keys % n,
+        ], dim=1)
+
+        padded_size = block_size + 2 * radius
+        seed_mask = torch.zeros((unique_keys.shape[0], padded_size, padded_size, padded_size),
+                                dtype=torch.bool, device=device)
+        slot = torch.searchsorted(unique_keys, keys.reshape(-1))
+        local = (xyz[:, None, :] - candidate * block_size + radius).reshape(-1, 3)
+        seed_mask[slot, local[:, 0], local[:, 1], local[:, 2]] = True
+        for dim in (1, 2, 3):
+            seed_mask = _dilate_axis(seed_mask, radius, dim)
+
+        # drop the padding voxels beyond the last grid point
+        offsets = torch.arange(block_size, device=device)
+        coords = brick_coords[:, 1:, None] * block_size + offsets  # [K, 3, S]
+        inside = coords <= resolution
+        active = seed_mask & inside[:, 0, :, None, None] & inside[:, 1, None, :, None] & inside[:, 2, None, None, :]
+
+        bricks = torch.full(active.shape, fill_value, dtype=dtype, device=device)
+        return cls(brick_coords, bricks, active, batch_size, resolution,
+                   block_size=block_size, fill_value=fill_value)
+
+    def active_points(self):
+        """Indices (b, x, y, z) of the active voxels, sorted by sample index."""
+        slot, lx, ly, lz = torch.where(self.active)
+        coords = self.brick_coords[slot]
+        s = self.block_size
+        return coords[:, 0], coords[:, 1] * s + lx, coords[:, 2] * s + ly, coords[:, 3] * s + lz
+
+    def _locate(self, x, y, z):
+        s = self.block_size
+        return x // s, y // s, z // s, x % s, y % s, z % s
+
+    def set_values(self, index, values: torch.Tensor):
+        """Write `values` at the voxels `index` = (b, x, y, z). The voxels must lie in active bricks."""
+        b, x, y, z = index
+        bx, by, bz, lx, ly, lz = self._locate(x, y, z)
+        slot = self.brick_index[b, bx, by, bz].long()
+        self.bricks[slot, lx, ly, lz] = values.to(self.bricks.dtype)
+
+    def lookup(self, index):
+        """Read the values at `index` = (b, x, y, z), returning `fill_value` for inactive or outside voxels."""
+        b, x, y, z = index
+        inside = (x >= 0) & (y >= 0) & (z >= 0) & \
+                 (x <= self.resolution) & (y <= self.resolution) & (z <= self.resolution)
+        x, y, z = x.clamp(0, self.resolution), y.clamp(0, self.resolution), z.clamp(0, self.resolution)
+        bx, by, bz, lx, ly, lz = self._locate(x, y, z)
+        slot = self.brick_index[b, bx, by, bz].long()
+        valid = inside & (slot >= 0)
+        values = self.bricks[slot.clamp(min=0), lx, ly, lz]
+        return torch.where(valid, values, torch.full_like(values, self.fill_value))
+
+    def padded_bricks(self, halo: int, start: int = 0, end: int = None):
+        """The bricks [start, end) with `halo` voxels of their neighbours on every side."""
+        coords = self.brick_coords[start:end]
+        offsets = torch.arange(-halo, self.block_size + halo, device=self.device)
+        p = offsets.shape[0]
+        x = (coords[:, 1, None] * self.block_size + offsets)[:, :, None, None].expand(-1, p, p, p)
+        y = (coords[:, 2, None] * self.block_size + offsets)[:, None, :, None].expand(-1, p, p, p)
+        z = (coords[:, 3, None] * self.block_size + offsets)[:, None, None, :].expand(-1, p, p, p)
+        b = coords[:, 0, None, None, None].expand(-1, p, p, p)
+        return self.lookup((b, x, y, z))
+
+    def near_surface_points(self, mc_level: float, bricks_per_chunk: int = 4096):
+        """Indices (b, x, y, z) of evaluated voxels that are close to the iso-surface.
+
+        A voxel is selected if its sign at `mc_level` differs from one of its six valid neighbours,
+        or if its absolute logit is below 0.95; voxels at -9000 or below count as unevaluated.
+        """
+        seeds = []
+        for start in range(0, self.num_bricks, bricks_per_chunk):
+            padded = self.padded_bricks(1, start, start + bricks_per_chunk)
+            val = padded[:, 1:-1, 1:-1, 1:-1]
+            shifted = padded + mc_level
+            center = shifted[:, 1:-1, 1:-1, 1:-1]
+            sign = torch.sign(center.to(torch.float32))
+            same_sign = torch.ones_like(center, dtype=torch.bool)
+            for dim in (1, 2, 3):
+                for offset in (0, 2):
+                    neighbor = shifted
+                    for d in (1, 2, 3):
+                        neighbor = neighbor.narrow(d, offset if d == dim else 1, self.block_size)
+                    neighbor = torch.where(neighbor > -9000, neighbor, center)
+                    same_sign &= torch.sign(neighbor.to(torch.float32)) == sign
+            mask = (~same_sign & (center > -9000)) | (val.abs() < 0.95)
+            mask &= self.active[start:start + bricks_per_chunk]
+
+            slot, lx, ly, lz = torch.where(mask)
+            coords = self.brick_coords[start + slot]
+            s = self.block_size
+            seeds.append(torch.stack(
+                [coords[:, 0], coords[:, 1] * s + lx, coords[:, 2] * s + ly, coords[:, 3] * s + lz], dim=0))
+        seeds = torch.cat(seeds, dim=1) if len(seeds) > 0 else \
+            torch.zeros((4, 0), dtype=torch.long, device=self.device)
+        return tuple(seeds)
+
+    def to_dense(self, fill_value: float = float('nan')):
+        """Materialize the dense [B, R+1, R+1, R+1] logits, with `fill_value` at unevaluated voxels."""
+        n, s, size = self.blocks_per_axis, self.block_size, self.resolution + 1
+        dense = torch.full((self.batch_size, n, n, n, s, s, s), fill_value, dtype=self.dtype, device=self.device)
+        bricks = torch.where(self.bricks == self.fill_value, torch.full_like(self.bricks, fill_value), self.bricks)
+        coords = self.brick_coords
+        dense[coords[:, 0], coords[:, 1], coords[:, 2], coords[:, 3]] = bricks
+        dense = dense.permute(0, 1, 4, 2, 5, 3, 6).reshape(self.batch_size, n * s, n * s, n * s)
+        return dense[:, :size, :size, :size]
@@ -12,12 +12,17 @@
 # fine-tuning enabling code and other elements of the foregoing made publicly available
 # by Tencent in accordance with TENCENT HUNYUAN COMMUNITY LICENSE AGREEMENT.
 
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
 from typing import Union, Tuple, List
 
 import numpy as np
 import torch
 from skimage import measure
 
+from .sparse_grid import SparseBlockGrid
+
 
 class Latent2MeshOutput:
 
@@ -47,6 +52,12 @@ class SurfaceExtractor:
     def run(self, *args, **kwargs):
         return NotImplementedError
 
+    @staticmethod
+    def _to_dense(grid_logit):
+        if isinstance(grid_logit, SparseBlockGrid):
+            return grid_logit.to_dense()[0]
+        return grid_logit
+
     def __call__(self, grid_logits, **kwargs):
         outputs = []
         for i in range(grid_logits.shape[0]):
@@ -65,9 +76,18 @@ class SurfaceExtractor:
 
 
 class MCSurfaceExtractor(SurfaceExtractor):
+    """Marching cubes over the dense grid.
+
+    A SparseBlockGrid is not densified but polygonized brick by brick in this process, like
+    `BrickMCSurfaceExtractor` without its worker pool, so memory scales with the surface area.
+    """
+
     def run(self, grid_logit, *, mc_level, bounds, octree_resolution, **kwargs):
+        if isinstance(grid_logit, SparseBlockGrid):
+            return BrickMCSurfaceExtractor(num_workers=1).run(
+                grid_logit, mc_level=mc_level, bounds=bounds, octree_resolution=octree_resolution)
         vertices, faces, normals, _ = measure.marching_cubes(
-            grid_logit.cpu().numpy(),
+            self._to_dense(grid_logit).cpu().numpy(),
             mc_level,
             method="lewiner"
         )
@@ -77,7 +97,10 @@ class MCSurfaceExtractor(SurfaceExtractor):
 
 
 class DMCSurfaceExtractor(SurfaceExtractor):
+    """Differentiable dual marching cubes from `diso`, which needs the dense grid: a SparseBlockGrid is densified."""
+
     def run(self, grid_logit, *, octree_resolution, **kwargs):
+        grid_logit = self._to_dense(grid_logit)
         device = grid_logit.device
         if not hasattr(self, 'dmc'):
             try:
@@ -94,7 +117,136 @@ class DMCSurfaceExtractor(SurfaceExtractor):
         return vertices, faces
 
 
+def _marching_cubes_bricks(volumes, origins, level, resolution, eps=1e-4):
+    """Run marching cubes on a list of (S+1)^3 bricks and tag every vertex with the id of its grid edge.
+
+    NaN voxels are unevaluated, only cells whose eight corners are all evaluated are polygonized.
+    Vertices lying (within `eps`) on a grid point get the id of that point instead of an edge.
+    """
+    all_vertices, all_faces, all_keys = [], [], []
+    num_vertices = 0
+    n = resolution + 2
+    for volume, origin in zip(volumes, origins):
+        finite = np.isfinite(volume)
+        cell = finite[:-1, :-1, :-1] & finite[1:, :-1, :-1] & finite[:-1, 1:, :-1] & finite[:-1, :-1, 1:] & \
+               finite[1:, 1:, :-1] & finite[1:, :-1, 1:] & finite[:-1, 1:, 1:] & finite[1:, 1:, 1:]
+        if not cell.any():
+            continue
+        # skimage checks the mask at the origin corner of every cell
+        mask = np.zeros_like(finite)
+        mask[:-1, :-1, :-1] = cell
+        # filling the unevaluated voxels with `level` keeps it in the data range, so errors are not skipped
+        vertices, faces, _, _ = measure.marching_cubes(
+            np.nan_to_num(volume, nan=level), level, method="lewiner", mask=mask)
+        if len(faces) == 0:
+            continue
+
+        frac = np.abs(vertices - np.round(vertices))
+        on_point = frac.max(axis=1) < eps
+        axis = np.where(on_point, 3, frac.argmax(axis=1))
+        base = np.round(vertices)
+        on_edge = np.nonzero(~on_point)[0]
+        base[on_edge, axis[on_edge]] = np.floor(vertices[on_edge, axis[on_edge]])
+        base = base.astype(np.int64) + origin
+        keys = ((base[:, 0] * n + base[:, 1]) * n + base[:, 2]) * 4 + axis
+
+        all_vertices.append(vertices.astype(np.float64) + origin)
+        all_faces.append(faces + num_vertices)
+        all_keys.append(keys)
+        num_vertices += len(vertices)
+
+    if num_vertices == 0:
+        return np.zeros((0, 3)), np.zeros((0, 3), dtype=np.int64), np.zeros((0,), dtype=np.int64)
+    return np.concatenate(all_vertices), np.concatenate(all_faces), np.concatenate(all_keys)
+
+
+class BrickMCSurfaceExtractor(SurfaceExtractor):
+    """Marching cubes over the active bricks of a SparseBlockGrid that contain a sign change.
+
+    Bricks are polygonized independently in a process pool, and vertices shared across brick borders are
+    merged by the id of the grid edge they lie on, so the stitched mesh stays watertight.
+    """
+
+    def __init__(self, num_workers: int = None, bricks_per_task: int = 256, bricks_per_chunk: int = 4096):
+        self.num_workers = num_workers if num_workers is not None else (os.cpu_count() or 1)
+        self.bricks_per_task = bricks_per_task
+        self.bricks_per_chunk = bricks_per_chunk
+        self._executor = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.num_workers,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return self._executor
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __del__(self):
+        if getattr(self, '_executor', None) is not None:
+            self._executor.shutdown(wait=False)
+
+    def _surface_bricks(self, grid: SparseBlockGrid, mc_level: float):
+        volumes, origins = [], []
+        for start in range(0, grid.num_bricks, self.bricks_per_chunk):
+            end = start + self.bricks_per_chunk
+            # the brick plus the first plane of its upper neighbours, so every cell belongs to one brick
+            values = grid.padded_bricks(1, start, end)[:, 1:, 1:, 1:]
+            valid = values != grid.fill_value
+            values = values.to(torch.float32)
+            above = ((values > mc_level) & valid).flatten(1).any(dim=1)
+            below = ((values < mc_level) & valid).flatten(1).any(dim=1)
+            keep = above & below
+            values = torch.where(valid, values, torch.full_like(values, float('nan')))
+            volumes.append(values[keep].cpu().numpy())
+            origins.append((grid.brick_coords[start:end][keep, 1:] * grid.block_size).cpu().numpy())
+        if len(volumes) == 0:
+            raise RuntimeError("No surface found at the given iso value")
+        return np.concatenate(volumes), np.concatenate(origins)
+
+    def run(self, grid_logit, *, mc_level, bounds, octree_resolution, **kwargs):
+        if not isinstance(grid_logit, SparseBlockGrid):
+            grid_logit = SparseBlockGrid.from_dense(grid_logit.unsqueeze(0))
+        volumes, origins = self._surface_bricks(grid_logit, mc_level)
+
+        tasks = [
+            (volumes[i:i + self.bricks_per_task], origins[i:i + self.bricks_per_task], mc_level,
+             grid_logit.resolution)
+            for i in range(0, len(volumes), self.bricks_per_task)
+        ]
+        if self.num_workers > 1 and len(tasks) > 1:
+            results = list(self._get_executor().map(_marching_cubes_bricks, *zip(*tasks)))
+        else:
+            results = [_marching_cubes_bricks(*task) for task in tasks]
+
+        vertices, faces, keys = [], [], []
+        num_vertices = 0
+        for v, f, k in results:
+            vertices.append(v)
+            faces.append(f + num_vertices)
+            keys.append(k)
+            num_vertices += len(v)
+        if num_vertices == 0:
+            raise RuntimeError("No surface found at the given iso value")
+        vertices, faces, keys = np.concatenate(vertices), np.concatenate(faces), np.concatenate(keys)
+
+        # stitch vertices that lie on the same grid edge, and drop the faces collapsed by the merge
+        _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        vertices = vertices[first]
+        faces = inverse.reshape(-1)[faces]
+        faces = faces[(faces[:, 0] != faces[:, 1]) & (faces[:, 1] != faces[:, 2]) & (faces[:, 0] != faces[:, 2])]
+
+        grid_size, bbox_min, bbox_size = self._compute_box_stat(bounds, octree_resolution)
+        vertices = vertices / grid_size * bbox_size + bbox_min
+        return vertices, faces
+
+
 SurfaceExtractors = {
     'mc': MCSurfaceExtractor,
     'dmc': DMCSurfaceExtractor,
+    'brick_mc': BrickMCSurfaceExtractor,
 }
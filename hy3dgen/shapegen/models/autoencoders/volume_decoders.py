@@ -12,113 +12,22 @@
 # fine-tuning enabling code and other elements of the foregoing made publicly available
 # by Tencent in accordance with TENCENT HUNYUAN COMMUNITY LICENSE AGREEMENT.
 
-from typing import Union, Tuple, List, Callable
+import os
+import threading
+from collections import OrderedDict
+from typing import Union, Tuple, List, Callable, Optional
 
 import numpy as np
 import torch
-import torch.nn as nn
-import torch.nn.functional as F
 from einops import repeat
 from tqdm import tqdm
 
 from .attention_blocks import CrossAttentionDecoder
 from .attention_processors import FlashVDMCrossAttentionProcessor, FlashVDMTopMCrossAttentionProcessor
+from .sparse_grid import SparseBlockGrid
 from ...utils import logger
 
 
-def extract_near_surface_volume_fn(input_tensor: torch.Tensor, alpha: float):
-    device = input_tensor.device
-    D = input_tensor.shape[0]
-    signed_val = 0.0
-
-    # 添加偏移并处理无效值
-    val = input_tensor + alpha
-    valid_mask = val > -9000  # 假设-9000是无效值
-
-    # 改进的邻居获取函数（保持维度一致）
-    def get_neighbor(t, shift, axis):
-        """根据指定轴进行位移并保持维度一致"""
-        if shift == 0:
-            return t.clone()
-
-        # 确定填充轴（输入为[D, D, D]对应z,y,x轴）
-        pad_dims = [0, 0, 0, 0, 0, 0]  # 格式：[x前，x后，y前，y后，z前，z后]
-
-        # 根据轴类型设置填充
-        if axis == 0:  # x轴（最后一个维度）
-            pad_idx = 0 if shift > 0 else 1
-            pad_dims[pad_idx] = abs(shift)
-        elif axis == 1:  # y轴（中间维度）
-            pad_idx = 2 if shift > 0 else 3
-            pad_dims[pad_idx] = abs(shift)
-        elif axis == 2:  # z轴（第一个维度）
-            pad_idx = 4 if shift > 0 else 5
-            pad_dims[pad_idx] = abs(shift)
-
-        # 执行填充（添加batch和channel维度适配F.pad）
-        padded = F.pad(t.unsqueeze(0).unsqueeze(0), pad_dims[::-1], mode='replicate')  # 反转顺序适配F.pad
-
-        # 构建动态切片索引
-        slice_dims = [slice(None)] * 3  # 初始化为全切片
-        if axis == 0:  # x轴（dim=2）
-            if shift > 0:
-                slice_dims[0] = slice(shift, None)
-            else:
-                slice_dims[0] = slice(None, shift)
-        elif axis == 1:  # y轴（dim=1）
-            if shift > 0:
-                slice_dims[1] = slice(shift, None)
-            else:
-                slice_dims[1] = slice(None, shift)
-        elif axis == 2:  # z轴（dim=0）
-            if shift > 0:
-                slice_dims[2] = slice(shift, None)
-            else:
-                slice_dims[2] = slice(None, shift)
-
-        # 应用切片并恢复维度
-        padded = padded.squeeze(0).squeeze(0)
-        sliced = padded[slice_dims]
-        return sliced
-
-    # 获取各方向邻居（确保维度一致）
-    left = get_neighbor(val, 1, axis=0)  # x方向
-    right = get_neighbor(val, -1, axis=0)
-    back = get_neighbor(val, 1, axis=1)  # y方向
-    front = get_neighbor(val, -1, axis=1)
-    down = get_neighbor(val, 1, axis=2)  # z方向
-    up = get_neighbor(val, -1, axis=2)
-
-    # 处理边界无效值（使用where保持维度一致）
-    def safe_where(neighbor):
-        return torch.where(neighbor > -9000, neighbor, val)
-
-    left = safe_where(left)
-    right = safe_where(right)
-    back = safe_where(back)
-    front = safe_where(front)
-    down = safe_where(down)
-    up = safe_where(up)
-
-    # 计算符号一致性（转换为float32确保精度）
-    sign = torch.sign(val.to(torch.float32))
-    neighbors_sign = torch.stack([
-        torch.sign(left.to(torch.float32)),
-        torch.sign(right.to(torch.float32)),
-        torch.sign(back.to(torch.float32)),
-        torch.sign(front.to(torch.float32)),
-        torch.sign(down.to(torch.float32)),
-        torch.sign(up.to(torch.float32))
-    ], dim=0)
-
-    # 检查所有符号是否一致
-    same_sign = torch.all(neighbors_sign == sign, dim=0)
-
-    # 生成最终掩码
-    mask = (~same_sign).to(torch.int32)
-    return mask * valid_mask.to(torch.int32)
-
-
 def generate_dense_grid_points(
     bbox_min: np.ndarray,
     bbox_max: np.ndarray,
@@ -138,6 +47,175 @@ def generate_dense_grid_points(
     return xyz, grid_size, length
 
 
+class QueryGridCache:
+    """LRU cache of prepared query grids on device, bounded by a byte budget.
+
+    Query grids only depend on (bounds, resolution, mini_grid_num, dtype, device), so they can be
+    reused across requests instead of rebuilding the meshgrid and uploading it every time.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, build_fn: Callable[[], torch.Tensor]):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+
+        value = build_fn()
+        nbytes = value.numel() * value.element_size()
+        if nbytes > self.max_bytes:
+            return value
+
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = value
+                self._bytes += nbytes
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.numel() * evicted.element_size()
+                self.evictions += 1
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+query_grid_cache = QueryGridCache(int(os.environ.get('HY3DGEN_QUERY_GRID_CACHE_MB', '1024')) * 1024 ** 2)
+
+
+def get_query_grid(
+    bbox_min: np.ndarray,
+    bbox_max: np.ndarray,
+    octree_resolution: int,
+    dtype: torch.dtype,
+    device: torch.device,
+    mini_grid_num: int = None,
+):
+    """The query points of a dense grid on `device`, served from `query_grid_cache`.
+
+    Returns:
+        points of shape [(R+1)^3, 3], or [mini_grid_num^3, M^3, 3] grouped by mini grid if `mini_grid_num`
+        is given, and the grid size.
+    """
+    grid_size = [int(octree_resolution) + 1] * 3
+    key = (tuple(np.asarray(bbox_min).tolist()), tuple(np.asarray(bbox_max).tolist()),
+           int(octree_resolution), mini_grid_num, dtype, str(torch.device(device)))
+
+    def build():
+        xyz_samples, _, _ = generate_dense_grid_points(
+            bbox_min=bbox_min,
+            bbox_max=bbox_max,
+            octree_resolution=octree_resolution,
+            indexing="ij"
+        )
+        xyz_samples = torch.from_numpy(xyz_samples).to(device, dtype=dtype)
+        if mini_grid_num is None:
+            return xyz_samples.contiguous().reshape(-1, 3)
+        mini_grid_size = xyz_samples.shape[0] // mini_grid_num
+        return xyz_samples.view(
+            mini_grid_num, mini_grid_size,
+            mini_grid_num, mini_grid_size,
+            mini_grid_num, mini_grid_size, 3
+        ).permute(
+            0, 2, 4, 1, 3, 5, 6
+        ).reshape(
+            -1, mini_grid_size * mini_grid_size * mini_grid_size, 3
+        )
+
+    return query_grid_cache.get(key, build), grid_size
+
+
+def next_level_grid(
+    grid: SparseBlockGrid,
+    mc_level: float,
+    octree_depth_now: int,
+    expand_num: int,
+):
+    """Allocate the next octree level around the near-surface voxels of every sample in `grid`.
+
+    Dilating the coarse voxels by `expand_num` and the upsampled voxels by `2 - expand_num` selects
+    every fine voxel within Chebyshev distance `2 + expand_num` of an upsampled near-surface voxel.
+    """
+    b, x, y, z = grid.near_surface_points(mc_level)
+    return SparseBlockGrid.from_seed_points(
+        (b, x * 2, y * 2, z * 2),
+        radius=2 + expand_num,
+        batch_size=grid.batch_size,
+        resolution=octree_depth_now,
+        dtype=grid.dtype,
+        block_size=grid.block_size,
+    )
+
+
+def ragged_offsets(batch_index: torch.Tensor, batch_size: int):
+    """Per-sample counts and start offsets of a flattened ragged array whose rows are sorted by sample."""
+    counts = torch.bincount(batch_index, minlength=batch_size)
+    offsets = torch.zeros(batch_size + 1, dtype=torch.long, device=batch_index.device)
+    offsets[1:] = torch.cumsum(counts, dim=0)
+    return counts, offsets
+
+
+def decode_ragged_queries(
+    queries: torch.Tensor,
+    batch_index: torch.Tensor,
+    latents: torch.FloatTensor,
+    geo_decoder: Callable,
+    num_chunks: int,
+    desc: str = "Volume Decoding",
+    enable_pbar: bool = True,
+    latents_kv: Optional[torch.FloatTensor] = None,
+):
+    """Decode a ragged set of query points, where queries[i] belongs to sample batch_index[i].
+
+    Every chunk gathers up to `num_chunks` points from each sample, so `geo_decoder` runs once per chunk
+    for the whole batch. Samples with fewer points are padded by repeating their last point, and the padded
+    results are dropped on scatter. `latents_kv` are the projected latents of `geo_decoder.project_latents`.
+
+    Returns:
+        logits of shape [N] aligned with `queries`.
+    """
+    batch_size = latents.shape[0]
+    num_points = queries.shape[0]
+    logits = torch.empty(num_points, dtype=latents.dtype, device=latents.device)
+    if num_points == 0:
+        return logits
+
+    counts, offsets = ragged_offsets(batch_index, batch_size)
+    max_count = int(counts.max())
+    for start in tqdm(range(0, max_count, num_chunks), desc=desc, disable=not enable_pbar):
+        local_index = torch.arange(start, min(start + num_chunks, max_count), device=queries.device)
+        valid = local_index[None] < counts[:, None]
+        local_index = torch.minimum(local_index[None], (counts[:, None] - 1).clamp(min=0))
+        gather_index = (offsets[:-1, None] + local_index).clamp(max=num_points - 1)
+        chunk_logits = geo_decoder(queries=queries[gather_index].to(latents.dtype), latents=latents,
+                                   latents_kv=latents_kv)
+        logits[gather_index[valid]] = chunk_logits[..., 0][valid]
+    return logits
+
+
 class VanillaVolumeDecoder:
     @torch.no_grad()
     def __call__(
@@ -159,21 +237,16 @@ class VanillaVolumeDecoder:
             bounds = [-bounds, -bounds, -bounds, bounds, bounds, bounds]
 
         bbox_min, bbox_max = np.array(bounds[0:3]), np.array(bounds[3:6])
-        xyz_samples, grid_size, length = generate_dense_grid_points(
-            bbox_min=bbox_min,
-            bbox_max=bbox_max,
-            octree_resolution=octree_resolution,
-            indexing="ij"
-        )
-        xyz_samples = torch.from_numpy(xyz_samples).to(device, dtype=dtype).contiguous().reshape(-1, 3)
+        xyz_samples, grid_size = get_query_grid(bbox_min, bbox_max, octree_resolution, dtype, device)
 
         # 2. latents to 3d volume
+        latents_kv = geo_decoder.project_latents(latents)
         batch_logits = []
         for start in tqdm(range(0, xyz_samples.shape[0], num_chunks), desc=f"Volume Decoding",
                           disable=not enable_pbar):
             chunk_queries = xyz_samples[start: start + num_chunks, :]
             chunk_queries = repeat(chunk_queries, "p c -> b p c", b=batch_size)
-            logits = geo_decoder(queries=chunk_queries, latents=latents)
+            logits = geo_decoder(queries=chunk_queries, latents=latents, latents_kv=latents_kv)
             batch_logits.append(logits)
 
         grid_logits = torch.cat(batch_logits, dim=1)
@@ -214,67 +287,42 @@ class HierarchicalVolumeDecoding:
         bbox_max = np.array(bounds[3:6])
         bbox_size = bbox_max - bbox_min
 
-        xyz_samples, grid_size, length = generate_dense_grid_points(
-            bbox_min=bbox_min,
-            bbox_max=bbox_max,
-            octree_resolution=resolutions[0],
-            indexing="ij"
-        )
-
-        dilate = nn.Conv3d(1, 1, 3, padding=1, bias=False, device=device, dtype=dtype)
-        dilate.weight = torch.nn.Parameter(torch.ones(dilate.weight.shape, dtype=dtype, device=device))
-
-        grid_size = np.array(grid_size)
-        xyz_samples = torch.from_numpy(xyz_samples).to(device, dtype=dtype).contiguous().reshape(-1, 3)
+        xyz_samples, grid_size = get_query_grid(bbox_min, bbox_max, resolutions[0], dtype, device)
 
         # 2. latents to 3d volume
+        latents_kv = geo_decoder.project_latents(latents)
         batch_logits = []
         batch_size = latents.shape[0]
         for start in tqdm(range(0, xyz_samples.shape[0], num_chunks),
-                          desc=f"Hierarchical Volume Decoding [r{resolutions[0] + 1}]"):
+                          desc=f"Hierarchical Volume Decoding [r{resolutions[0] + 1}]", disable=not enable_pbar):
             queries = xyz_samples[start: start + num_chunks, :]
             batch_queries = repeat(queries, "p c -> b p c", b=batch_size)
-            logits = geo_decoder(queries=batch_queries, latents=latents)
+            logits = geo_decoder(queries=batch_queries, latents=latents, latents_kv=latents_kv)
             batch_logits.append(logits)
 
         grid_logits = torch.cat(batch_logits, dim=1).view((batch_size, grid_size[0], grid_size[1], grid_size[2]))
 
+        grid = SparseBlockGrid.from_dense(grid_logits)
         for octree_depth_now in resolutions[1:]:
-            grid_size = np.array([octree_depth_now + 1] * 3)
             resolution = bbox_size / octree_depth_now
-            next_index = torch.zeros(tuple(grid_size), dtype=dtype, device=device)
-            next_logits = torch.full(next_index.shape, -10000., dtype=dtype, device=device)
-            curr_points = extract_near_surface_volume_fn(grid_logits.squeeze(0), mc_level)
-            curr_points += grid_logits.squeeze(0).abs() < 0.95
-
             if octree_depth_now == resolutions[-1]:
                 expand_num = 0
             else:
                 expand_num = 1
-            for i in range(expand_num):
-                curr_points = dilate(curr_points.unsqueeze(0).to(dtype)).squeeze(0)
-            (cidx_x, cidx_y, cidx_z) = torch.where(curr_points > 0)
-            next_index[cidx_x * 2, cidx_y * 2, cidx_z * 2] = 1
-            for i in range(2 - expand_num):
-                next_index = dilate(next_index.unsqueeze(0)).squeeze(0)
-            nidx = torch.where(next_index > 0)
-
-            next_points = torch.stack(nidx, dim=1)
-            next_points = (next_points * torch.tensor(resolution, dtype=next_points.dtype, device=device) +
-                           torch.tensor(bbox_min, dtype=next_points.dtype, device=device))
-            batch_logits = []
-            for start in tqdm(range(0, next_points.shape[0], num_chunks),
-                              desc=f"Hierarchical Volume Decoding [r{octree_depth_now + 1}]"):
-                queries = next_points[start: start + num_chunks, :]
-                batch_queries = repeat(queries, "p c -> b p c", b=batch_size)
-                logits = geo_decoder(queries=batch_queries.to(latents.dtype), latents=latents)
-                batch_logits.append(logits)
-            grid_logits = torch.cat(batch_logits, dim=1)
-            next_logits[nidx] = grid_logits[0, ..., 0]
-            grid_logits = next_logits.unsqueeze(0)
-        grid_logits[grid_logits == -10000.] = float('nan')
+            grid = next_level_grid(grid, mc_level, octree_depth_now, expand_num)
+            nidx = grid.active_points()
 
-        return grid_logits
+            next_points = torch.stack(nidx[1:], dim=1)
+            next_points = (next_points * torch.tensor(resolution, dtype=torch.float32, device=device) +
+                           torch.tensor(bbox_min, dtype=torch.float32, device=device))
+            grid.set_values(nidx, decode_ragged_queries(
+                next_points, nidx[0], latents, geo_decoder, num_chunks,
+                desc=f"Hierarchical Volume Decoding [r{octree_depth_now + 1}]",
+                enable_pbar=enable_pbar,
+                latents_kv=latents_kv,
+            ))
+
+        return grid
 
 
 class FlashVDMVolumeDecoding:
@@ -301,8 +349,8 @@ class FlashVDMVolumeDecoding:
         enable_pbar: bool = True,
         **kwargs,
     ):
-        processor = self.processor
-        geo_decoder.set_cross_attention_processor(processor)
+        # the processor is stateless, the kv selection of each call is passed as `kv_selection`
+        geo_decoder.set_cross_attention_processor(self.processor)
 
         device = latents.device
         dtype = latents.dtype
@@ -327,109 +375,89 @@ class FlashVDMVolumeDecoding:
         bbox_max = np.array(bounds[3:6])
         bbox_size = bbox_max - bbox_min
 
-        xyz_samples, grid_size, length = generate_dense_grid_points(
-            bbox_min=bbox_min,
-            bbox_max=bbox_max,
-            octree_resolution=resolutions[0],
-            indexing="ij"
-        )
-
-        dilate = nn.Conv3d(1, 1, 3, padding=1, bias=False, device=device, dtype=dtype)
-        dilate.weight = torch.nn.Parameter(torch.ones(dilate.weight.shape, dtype=dtype, device=device))
-
-        grid_size = np.array(grid_size)
-
         # 2. latents to 3d volume
-        xyz_samples = torch.from_numpy(xyz_samples).to(device, dtype=dtype)
+        xyz_samples, grid_size = get_query_grid(
+            bbox_min, bbox_max, resolutions[0], dtype, device, mini_grid_num=mini_grid_num)
         batch_size = latents.shape[0]
-        mini_grid_size = xyz_samples.shape[0] // mini_grid_num
-        xyz_samples = xyz_samples.view(
-            mini_grid_num, mini_grid_size,
-            mini_grid_num, mini_grid_size,
-            mini_grid_num, mini_grid_size, 3
-        ).permute(
-            0, 2, 4, 1, 3, 5, 6
-        ).reshape(
-            -1, mini_grid_size * mini_grid_size * mini_grid_size, 3
-        )
+        latents_kv = geo_decoder.project_latents(latents)
+        mini_grid_size = (resolutions[0] + 1) // mini_grid_num
         batch_logits = []
-        num_batchs = max(num_chunks // xyz_samples.shape[1], 1)
+        num_batchs = max(num_chunks // (xyz_samples.shape[1] * batch_size), 1)
         for start in tqdm(range(0, xyz_samples.shape[0], num_batchs),
                           desc=f"FlashVDM Volume Decoding", disable=not enable_pbar):
             queries = xyz_samples[start: start + num_batchs, :]
             batch = queries.shape[0]
-            batch_latents = repeat(latents.squeeze(0), "p c -> b p c", b=batch)
-            processor.topk = True
-            logits = geo_decoder(queries=queries, latents=batch_latents)
-            batch_logits.append(logits)
-        grid_logits = torch.cat(batch_logits, dim=0).reshape(
+            # every sample decodes every mini grid: [B * batch, M, 3] against [B * batch, N, C]
+            batch_queries = repeat(queries, "g m c -> (b g) m c", b=batch_size)
+            batch_latents_kv = repeat(latents_kv, "b p c -> (b g) p c", g=batch)
+            logits = geo_decoder(queries=batch_queries, latents_kv=batch_latents_kv, kv_selection=True)
+            batch_logits.append(logits.view(batch_size, batch, -1))
+        grid_logits = torch.cat(batch_logits, dim=1).reshape(
+            batch_size,
             mini_grid_num, mini_grid_num, mini_grid_num,
             mini_grid_size, mini_grid_size,
             mini_grid_size
-        ).permute(0, 3, 1, 4, 2, 5).contiguous().view(
+        ).permute(0, 1, 4, 2, 5, 3, 6).contiguous().view(
             (batch_size, grid_size[0], grid_size[1], grid_size[2])
         )
 
+        grid = SparseBlockGrid.from_dense(grid_logits)
         for octree_depth_now in resolutions[1:]:
-            grid_size = np.array([octree_depth_now + 1] * 3)
             resolution = bbox_size / octree_depth_now
-            next_index = torch.zeros(tuple(grid_size), dtype=dtype, device=device)
-            next_logits = torch.full(next_index.shape, -10000., dtype=dtype, device=device)
-            curr_points = extract_near_surface_volume_fn(grid_logits.squeeze(0), mc_level)
-            curr_points += grid_logits.squeeze(0).abs() < 0.95
-
             if octree_depth_now == resolutions[-1]:
                 expand_num = 0
             else:
                 expand_num = 1
-            for i in range(expand_num):
-                curr_points = dilate(curr_points.unsqueeze(0).to(dtype)).squeeze(0)
-            (cidx_x, cidx_y, cidx_z) = torch.where(curr_points > 0)
+            grid = next_level_grid(grid, mc_level, octree_depth_now, expand_num)
+            nidx = grid.active_points()
 
-            next_index[cidx_x * 2, cidx_y * 2, cidx_z * 2] = 1
-            for i in range(2 - expand_num):
-                next_index = dilate(next_index.unsqueeze(0)).squeeze(0)
-            nidx = torch.where(next_index > 0)
-
-            next_points = torch.stack(nidx, dim=1)
+            next_points = torch.stack(nidx[1:], dim=1)
             next_points = (next_points * torch.tensor(resolution, dtype=torch.float32, device=device) +
                            torch.tensor(bbox_min, dtype=torch.float32, device=device))
 
-            query_grid_num = 6
-            min_val = next_points.min(axis=0).values
-            max_val = next_points.max(axis=0).values
-            vol_queries_index = (next_points - min_val) / (max_val - min_val) * (query_grid_num - 0.001)
-            index = torch.floor(vol_queries_index).long()
-            index = index[..., 0] * (query_grid_num ** 2) + index[..., 1] * query_grid_num + index[..., 2]
-            index = index.sort()
-            next_points = next_points[index.indices].unsqueeze(0).contiguous()
-            unique_values = torch.unique(index.values, return_counts=True)
-            grid_logits = torch.zeros((next_points.shape[1]), dtype=latents.dtype, device=latents.device)
-            input_grid = [[], []]
-            logits_grid_list = []
-            start_num = 0
-            sum_num = 0
-            for grid_index, count in zip(unique_values[0].cpu().tolist(), unique_values[1].cpu().tolist()):
-                if sum_num + count < num_chunks or sum_num == 0:
-                    sum_num += count
-                    input_grid[0].append(grid_index)
-                    input_grid[1].append(count)
-                else:
-                    processor.topk = input_grid
-                    logits_grid = geo_decoder(queries=next_points[:, start_num:start_num + sum_num], latents=latents)
-                    start_num = start_num + sum_num
-                    logits_grid_list.append(logits_grid)
-                    input_grid = [[grid_index], [count]]
-                    sum_num = count
-            if sum_num > 0:
-                processor.topk = input_grid
-                logits_grid = geo_decoder(queries=next_points[:, start_num:start_num + sum_num], latents=latents)
+            # the adaptive kv selection is chosen per spatial cell of one sample,
+            # so the cell-sorted queries of each sample are decoded against its own latents
+            counts, _ = ragged_offsets(nidx[0], batch_size)
+            grid.set_values(nidx, torch.cat([
+                self._decode_cells(points, latents_kv[i:i + 1], geo_decoder, num_chunks)
+                for i, points in enumerate(torch.split(next_points, counts.cpu().tolist()))
+            ]))
+
+        return grid
+
+    def _decode_cells(self, next_points, latents_kv, geo_decoder, num_chunks, query_grid_num=6):
+        grid_logits = torch.zeros((next_points.shape[0]), dtype=latents_kv.dtype, device=latents_kv.device)
+        if next_points.shape[0] == 0:
+            return grid_logits
+
+        min_val = next_points.min(axis=0).values
+        max_val = next_points.max(axis=0).values
+        vol_queries_index = (next_points - min_val) / (max_val - min_val) * (query_grid_num - 0.001)
+        index = torch.floor(vol_queries_index).long()
+        index = index[..., 0] * (query_grid_num ** 2) + index[..., 1] * query_grid_num + index[..., 2]
+        index = index.sort()
+        next_points = next_points[index.indices].unsqueeze(0).contiguous()
+        unique_values = torch.unique(index.values, return_counts=True)
+        input_grid = [[], []]
+        logits_grid_list = []
+        start_num = 0
+        sum_num = 0
+        for grid_index, count in zip(unique_values[0].cpu().tolist(), unique_values[1].cpu().tolist()):
+            if sum_num + count < num_chunks or sum_num == 0:
+                sum_num += count
+                input_grid[0].append(grid_index)
+                input_grid[1].append(count)
+            else:
+                logits_grid = geo_decoder(queries=next_points[:, start_num:start_num + sum_num],
+                                          latents_kv=latents_kv, kv_selection=input_grid)
+                start_num = start_num + sum_num
                 logits_grid_list.append(logits_grid)
-            logits_grid = torch.cat(logits_grid_list, dim=1)
-            grid_logits[index.indices] = logits_grid.squeeze(0).squeeze(-1)
-            next_logits[nidx] = grid_logits
-            grid_logits = next_logits.unsqueeze(0)
-
-        grid_logits[grid_logits == -10000.] = float('nan')
-
+                input_grid = [[grid_index], [count]]
+                sum_num = count
+        if sum_num > 0:
+            logits_grid = geo_decoder(queries=next_points[:, start_num:start_num + sum_num],
+                                      latents_kv=latents_kv, kv_selection=input_grid)
+            logits_grid_list.append(logits_grid)
+        logits_grid = torch.cat(logits_grid_list, dim=1)
+        grid_logits[index.indices] = logits_grid.squeeze(0).squeeze(-1)
         return grid_logits
@@ -281,6 +281,46 @@ class LastLayer(nn.Module):
         return x
 
 
+class DiTStepCache:
+    """
+    Reuse of block residuals across adjacent sampling steps.
+
+    Every step runs the first double-stream block. Its output residual is compared with the one from the last
+    fully computed step. If the relative L1 drift stays below `drift_threshold`, the cached residuals of the
+    other double-stream blocks and of the single-stream blocks are added instead of running them. A full step
+    is forced every `refresh_interval` steps.
+    """
+
+    def __init__(self, refresh_interval: int = 3, drift_threshold: float = 0.05):
+        self.refresh_interval = refresh_interval
+        self.drift_threshold = drift_threshold
+        self.reset()
+
+    def reset(self):
+        self.probe = None
+        self.double_residuals = None
+        self.single_residual = None
+        self.steps_since_refresh = 0
+        self.computed_steps = 0
+        self.skipped_steps = 0
+
+    def can_reuse(self, probe: Tensor) -> bool:
+        if self.probe is None or self.probe.shape != probe.shape:
+            return False
+        if self.steps_since_refresh + 1 >= self.refresh_interval:
+            return False
+        drift = (probe - self.probe).abs().mean() / self.probe.abs().mean().clamp_min(1e-6)
+        return drift.item() < self.drift_threshold
+
+    def stats(self):
+        total = self.computed_steps + self.skipped_steps
+        return {
+            'computed_steps': self.computed_steps,
+            'skipped_steps': self.skipped_steps,
+            'skip_ratio': self.skipped_steps / total if total else 0.0,
+        }
+
+
 class Hunyuan3DDiT(nn.Module):
     def __init__(
         self,
@@ -354,6 +394,7 @@ class Hunyuan3DDiT(nn.Module):
         )
 
         self.final_layer = LastLayer(self.hidden_size, 1, self.out_channels)
+        self.step_cache = None
 
         if ckpt_path is not None:
             print('restored denoiser ckpt', ckpt_path)
@@ -378,6 +419,10 @@ class Hunyuan3DDiT(nn.Module):
             print('unexpected keys:', unexpected)
             print('missing keys:', missing)
 
+    def enable_step_cache(self, enabled: bool = True, refresh_interval: int = 3, drift_threshold: float = 0.05):
+        """Skip most blocks on steps whose first block output barely changed, see `DiTStepCache`."""
+        self.step_cache = DiTStepCache(refresh_interval, drift_threshold) if enabled else None
+
     def forward(
         self,
         x,
@@ -398,13 +443,46 @@ class Hunyuan3DDiT(nn.Module):
         cond = self.cond_in(cond)
         pe = None
 
-        for block in self.double_blocks:
+        if self.step_cache is None:
+            for block in self.double_blocks:
+                latent, cond = block(img=latent, txt=cond, vec=vec, pe=pe)
+
+            latent = torch.cat((cond, latent), 1)
+            for block in self.single_blocks:
+                latent = block(latent, vec=vec, pe=pe)
+        else:
+            latent, cond = self._forward_blocks_cached(latent, cond, vec, pe)
+
+        latent = latent[:, cond.shape[1]:, ...]
+        latent = self.final_layer(latent, vec)
+        return latent
+
+    def _forward_blocks_cached(self, latent, cond, vec, pe):
+        cache = self.step_cache
+        first_latent, first_cond = self.double_blocks[0](img=latent, txt=cond, vec=vec, pe=pe)
+        probe = first_latent - latent
+
+        if cache.can_reuse(probe):
+            latent_residual, cond_residual = cache.double_residuals
+            cond = first_cond + cond_residual
+            latent = torch.cat((cond, first_latent + latent_residual), 1) + cache.single_residual
+            cache.steps_since_refresh += 1
+            cache.skipped_steps += 1
+            return latent, cond
+
+        latent, cond = first_latent, first_cond
+        for block in self.double_blocks[1:]:
             latent, cond = block(img=latent, txt=cond, vec=vec, pe=pe)
+        double_residuals = (latent - first_latent, cond - first_cond)
 
         latent = torch.cat((cond, latent), 1)
+        single_input = latent
         for block in self.single_blocks:
             latent = block(latent, vec=vec, pe=pe)
 
-        latent = latent[:, cond.shape[1]:, ...]
-        latent = self.final_layer(latent, vec)
-        return latent
+        cache.probe = probe
+        cache.double_residuals = double_residuals
+        cache.single_residual = latent - single_input
+        cache.steps_since_refresh = 0
+        cache.computed_steps += 1
+        return latent, cond
@@ -3,6 +3,7 @@ import math
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
+from diffusers.models.activations import GELU
 from diffusers.models.attention import FeedForward
 
 
@@ -91,11 +92,24 @@ class MoEGate(nn.Module):
 
 
 class MoEBlock(nn.Module):
+    """
+    Mixture of routed experts plus a shared expert.
+
+    At inference, `grouped_experts` runs all routed experts as two batched matmuls over their stacked
+    weights instead of one small FeedForward per expert, see `moe_infer_grouped`. The stacks are built by
+    `build_grouped_experts` once the weights are loaded; until then the per-expert loop is used.
+    Each expert gets at most `capacity_factor` times its even share of the routed tokens.
+    """
+
     def __init__(self, dim, num_experts=8, moe_top_k=2,
                  activation_fn="gelu", dropout=0.0, final_dropout=False,
-                 ff_inner_dim=None, ff_bias=True):
+                 ff_inner_dim=None, ff_bias=True, grouped_experts=True, capacity_factor=2.0):
         super().__init__()
         self.moe_top_k = moe_top_k
+        self.grouped_experts = grouped_experts
+        self.capacity_factor = capacity_factor
+        # (up weight, up bias, down weight, down bias) as [E, ...] tensors the expert parameters are views of
+        self._stacked_experts = None
         self.experts = nn.ModuleList([
             FeedForward(dim, dropout=dropout, activation_fn=activation_fn, final_dropout=final_dropout,
                         inner_dim=ff_inner_dim, bias=ff_bias)
@@ -124,6 +138,8 @@ class MoEBlock(nn.Module):
             y = (y.view(*topk_weight.shape, -1) * topk_weight.unsqueeze(-1)).sum(dim=1)
             y = y.view(*orig_shape)
             y = AddAuxiliaryLoss.apply(y, aux_loss)
+        elif self.grouped_experts and self.grouped_weights() is not None:
+            y = self.moe_infer_grouped(hidden_states, flat_topk_idx, topk_weight.view(-1)).view(*orig_shape)
         else:
             y = self.moe_infer(hidden_states, flat_topk_idx, topk_weight.view(-1, 1)).view(*orig_shape)
         y = y + self.shared_experts(identity)
@@ -149,3 +165,101 @@ class MoEBlock(nn.Module):
             expert_cache = expert_cache.to(expert_out.dtype)
             expert_cache.scatter_reduce_(0, exp_token_idx.view(-1, 1).repeat(1, x.shape[-1]), expert_out, reduce='sum')
         return expert_cache
+
+    def supports_grouped_experts(self):
+        return all(isinstance(expert.net[0], GELU) for expert in self.experts)
+
+    def _expert_layers(self):
+        return [(expert.net[0].proj, expert.net[2]) for expert in self.experts]
+
+    @torch.no_grad()
+    def build_grouped_experts(self):
+        """
+        Stack the up and down projection weights and biases of all experts for `moe_infer_grouped`.
+
+        Call it once the weights are loaded. The expert parameters become views of the stacks, so the weights
+        are not duplicated and `load_state_dict` keeps updating both. `.to()` and the other conversions stack
+        the converted parameters again.
+        """
+        if not self.supports_grouped_experts():
+            self._stacked_experts = None
+            return
+        layers = self._expert_layers()
+        stacked = []
+        # the stacks become the parameters and must stay usable outside inference mode
+        with torch.inference_mode(False):
+            for index, name in [(0, 'weight'), (0, 'bias'), (1, 'weight'), (1, 'bias')]:
+                params = [getattr(pair[index], name) for pair in layers]
+                if params[0] is None:
+                    stacked.append(None)
+                    continue
+                first = params[0]
+                tensor = torch.empty((len(params), *first.shape), dtype=first.dtype, device=first.device,
+                                     pin_memory=first.device.type == 'cpu' and first.is_pinned())
+                torch.stack([p.detach() for p in params], out=tensor)
+                for pair, param, view in zip(layers, params, tensor):
+                    setattr(pair[index], name, nn.Parameter(view, requires_grad=param.requires_grad))
+                stacked.append(tensor)
+        self._stacked_experts = tuple(stacked)
+
+    def grouped_weights(self):
+        """The stacks, or None if they were not built or the expert parameters were replaced since"""
+        if self._stacked_experts is None:
+            return None
+        up, down = self._expert_layers()[0]
+        if up.weight.data_ptr() != self._stacked_experts[0].data_ptr() or \
+                down.weight.data_ptr() != self._stacked_experts[2].data_ptr():
+            return None
+        return self._stacked_experts
+
+    def _apply(self, fn, *args, **kwargs):
+        # conversions replace every expert parameter on its own, stack the results again to share storage
+        grouped = self._stacked_experts is not None
+        self._stacked_experts = None
+        super()._apply(fn, *args, **kwargs)
+        if grouped:
+            self.build_grouped_experts()
+        return self
+
+    @torch.no_grad()
+    def moe_infer_grouped(self, x, flat_expert_indices, flat_expert_weights):
+        """
+        Routed experts as batched matmuls.
+
+        Assignments are sorted by expert on device and scattered into a [E, capacity, dim] buffer, where
+        capacity is `capacity_factor` times the number of assignments per expert if routing were even. Both
+        projections are one `bmm` over all experts and the weighted outputs are added back per token with
+        `index_add_`. The capacity depends only on the input shape, so there is no host sync. Assignments
+        beyond the capacity of their expert are dropped, as in capacity-based MoE layers, and the token
+        keeps its other experts and the shared expert.
+        """
+        num_experts = len(self.experts)
+        up_weight, up_bias, down_weight, down_bias = self.grouped_weights()
+        capacity = min(x.shape[0], math.ceil(self.capacity_factor * len(flat_expert_indices) / num_experts))
+
+        order = flat_expert_indices.argsort(stable=True)
+        sorted_experts = flat_expert_indices[order]
+        token_idxs = order // self.moe_top_k
+        counts = torch.bincount(flat_expert_indices, minlength=num_experts)
+        starts = counts.cumsum(0) - counts
+        slots = torch.arange(len(order), device=x.device) - starts[sorted_experts]
+        kept = slots < capacity
+        # dropped assignments all write to a spare last row, which is never read back
+        slots = torch.where(kept, slots, capacity)
+
+        dtype = up_weight.dtype
+        buffer = x.new_zeros(num_experts, capacity + 1, x.shape[-1], dtype=dtype)
+        buffer[sorted_experts, slots] = x[token_idxs].to(dtype)
+
+        # weights are stored [E, out, in] like nn.Linear, bmm reads the transposed views in place
+        hidden = torch.bmm(buffer, up_weight.transpose(1, 2))
+        if up_bias is not None:
+            hidden += up_bias[:, None, :]
+        hidden = F.gelu(hidden, approximate=self.experts[0].net[0].approximate)
+        out = torch.bmm(hidden, down_weight.transpose(1, 2))
+        if down_bias is not None:
+            out += down_bias[:, None, :]
+
+        weights = torch.where(kept, flat_expert_weights[order], 0).to(dtype)
+        expert_out = out[sorted_experts, slots] * weights[:, None]
+        return torch.zeros(x.shape, dtype=dtype, device=x.device).index_add_(0, token_idxs, expert_out)
@@ -16,6 +16,7 @@ import copy
 import importlib
 import inspect
 import os
+import time
 from typing import List, Optional, Union
 
 import numpy as np
@@ -27,9 +28,12 @@ from diffusers.utils.torch_utils import randn_tensor
 from diffusers.utils.import_utils import is_accelerate_version, is_accelerate_available
 from tqdm import tqdm
 
+from .cond_cache import ConditionCache, conditioner_fingerprint, sample_key, select_inputs, cat_nested, map_nested
+from .guidance import GUIDED, REUSE
 from .models.autoencoders import ShapeVAE
 from .models.autoencoders import SurfaceExtractors
-from .utils import logger, synchronize_timer, smart_load_model
+from .models.denoisers.moe_layers import MoEBlock
+from .utils import logger, synchronize_timer, smart_load_model, load_checkpoint, instantiate_with_state_dict
 
 
 def retrieve_timesteps(
@@ -158,10 +162,12 @@ class Hunyuan3DDiTPipeline:
             raise FileNotFoundError(f"Model file {ckpt_path} not found")
         logger.info(f"Loading model from {ckpt_path}")
 
+        # tensors are memory-mapped views of the checkpoint file
+        load_times = {}
+        ckpt = load_checkpoint(ckpt_path, use_safetensors)
         if use_safetensors:
             # parse safetensors
-            import safetensors.torch
-            safetensors_ckpt = safetensors.torch.load_file(ckpt_path, device='cpu')
+            safetensors_ckpt = ckpt
             ckpt = {}
             for key, value in safetensors_ckpt.items():
                 model_name = key.split('.')[0]
@@ -169,16 +175,20 @@ class Hunyuan3DDiTPipeline:
                 if model_name not in ckpt:
                     ckpt[model_name] = {}
                 ckpt[model_name][new_key] = value
-        else:
-            ckpt = torch.load(ckpt_path, map_location='cpu', weights_only=True)
-        # load model
-        model = instantiate_from_config(config['model'])
-        model.load_state_dict(ckpt['model'])
-        vae = instantiate_from_config(config['vae'])
-        vae.load_state_dict(ckpt['vae'])
-        conditioner = instantiate_from_config(config['conditioner'])
+        # load model, building each component on the meta device and assigning its weights
+        model = instantiate_with_state_dict(
+            lambda: instantiate_from_config(config['model']), ckpt['model'], 'model', load_times)
+        # stack the routed experts once, now that their weights are loaded
+        for module in model.modules():
+            if isinstance(module, MoEBlock) and module.grouped_experts:
+                module.build_grouped_experts()
+        vae = instantiate_with_state_dict(
+            lambda: instantiate_from_config(config['vae']), ckpt['vae'], 'vae', load_times)
         if 'conditioner' in ckpt:
-            conditioner.load_state_dict(ckpt['conditioner'])
+            conditioner = instantiate_with_state_dict(
+                lambda: instantiate_from_config(config['conditioner']), ckpt['conditioner'], 'conditioner', load_times)
+        else:
+            conditioner = instantiate_from_config(config['conditioner'])
         image_processor = instantiate_from_config(config['image_processor'])
         scheduler = instantiate_from_config(config['scheduler'])
 
@@ -190,12 +200,20 @@ class Hunyuan3DDiTPipeline:
             image_processor=image_processor,
             device=device,
             dtype=dtype,
+            # identifies the weights, e.g. to scope the condition cache
+            checkpoint=dict(path=os.path.abspath(ckpt_path), size=os.path.getsize(ckpt_path),
+                            mtime=os.path.getmtime(ckpt_path)),
         )
         model_kwargs.update(kwargs)
 
-        return cls(
+        start = time.time()
+        pipeline = cls(
             **model_kwargs
         )
+        load_times['to_device'] = time.time() - start
+        pipeline.load_times = load_times
+        logger.info(f"Load times (s): {', '.join(f'{k}={v:.2f}' for k, v in load_times.items())}")
+        return pipeline
 
     @classmethod
     def from_pretrained(
@@ -248,6 +266,9 @@ class Hunyuan3DDiTPipeline:
         self.conditioner = conditioner
         self.image_processor = image_processor
         self.kwargs = kwargs
+        self.cond_cache = None
+        self._cond_fingerprint = None
+        self.load_times = {}
         self.to(device, dtype)
 
     def compile(self):
@@ -297,6 +318,27 @@ class Hunyuan3DDiTPipeline:
                 self.vae = ShapeVAE.from_pretrained(model_path, subfolder=subfolder)
             self.vae.enable_flashvdm_decoder(enabled=False)
 
+    def enable_cond_cache(self, enabled: bool = True, max_entries: int = 32, cache_dir: Optional[str] = None):
+        """Reuse conditioner outputs for images that were already encoded, e.g. the same image with a new seed.
+
+        Args:
+            max_entries (`int`): number of encoded images kept in memory.
+            cache_dir (`str`, *optional*): directory of an additional on-disk safetensors tier.
+        """
+        self.cond_cache = ConditionCache(max_entries=max_entries, cache_dir=cache_dir) if enabled else None
+
+    def enable_step_cache(self, enabled: bool = True, refresh_interval: int = 3, drift_threshold: float = 0.05):
+        """Reuse DiT block residuals on sampling steps where the features barely change.
+
+        Args:
+            refresh_interval (`int`): a full DiT forward is run at least every `refresh_interval` steps.
+            drift_threshold (`float`): relative change of the first block output above which a step is recomputed.
+        """
+        model = getattr(self.model, '_orig_mod', self.model)
+        if not hasattr(model, 'enable_step_cache'):
+            raise NotImplementedError(f"{type(model).__name__} does not support step caching")
+        model.enable_step_cache(enabled, refresh_interval=refresh_interval, drift_threshold=drift_threshold)
+
     def to(self, device=None, dtype=None):
         if dtype is not None:
             self.dtype = dtype
@@ -420,14 +462,51 @@ class Hunyuan3DDiTPipeline:
         # make sure the model is in the same state as before calling it
         self.enable_model_cpu_offload()
 
+    def _encode_cond_cached(self, image, additional_cond_inputs):
+        if self._cond_fingerprint is None:
+            pretrained_kwargs = self.kwargs.get('from_pretrained_kwargs', {})
+            checkpoint = self.kwargs.get('checkpoint', {})
+            namespace = f"{pretrained_kwargs.get('model_path', '')}/{pretrained_kwargs.get('subfolder', '')}" \
+                        f"/{pretrained_kwargs.get('variant', '')}" \
+                        f"/{checkpoint.get('path', '')}:{checkpoint.get('size', '')}:{checkpoint.get('mtime', '')}"
+            self._cond_fingerprint = conditioner_fingerprint(self.conditioner, namespace)
+
+        bsz = image.shape[0]
+        keys = [
+            sample_key(self._cond_fingerprint, image[i:i + 1], select_inputs(additional_cond_inputs, [i]))
+            for i in range(bsz)
+        ]
+        entries = [self.cond_cache.get(key) for key in keys]
+        missing = [i for i, entry in enumerate(entries) if entry is None]
+        if len(missing) > 0:
+            missing_inputs = select_inputs(additional_cond_inputs, missing)
+            cond = self.conditioner(image=image[missing], **missing_inputs)
+            un_cond = self.conditioner.unconditional_embedding(len(missing), **missing_inputs)
+            for j, i in enumerate(missing):
+                entries[i] = self.cond_cache.put(keys[i], {
+                    'cond': map_nested(lambda t: t[j:j + 1], cond),
+                    'uncond': map_nested(lambda t: t[j:j + 1], un_cond),
+                })
+
+        def to_device(t):
+            return t.to(self.device, dtype=self.dtype)
+
+        cond = map_nested(to_device, cat_nested([entry['cond'] for entry in entries]))
+        un_cond = map_nested(to_device, cat_nested([entry['uncond'] for entry in entries]))
+        return cond, un_cond
+
     @synchronize_timer('Encode cond')
     def encode_cond(self, image, additional_cond_inputs, do_classifier_free_guidance, dual_guidance):
         bsz = image.shape[0]
-        cond = self.conditioner(image=image, **additional_cond_inputs)
+        if self.cond_cache is not None:
+            cond, un_cond = self._encode_cond_cached(image, additional_cond_inputs)
+        else:
+            cond = self.conditioner(image=image, **additional_cond_inputs)
+            un_cond = None
 
         if do_classifier_free_guidance:
-            un_cond = self.conditioner.unconditional_embedding(bsz, **additional_cond_inputs)
-
+            if un_cond is None:
+                un_cond = self.conditioner.unconditional_embedding(bsz, **additional_cond_inputs)
             if dual_guidance:
                 un_cond_drop_main = copy.deepcopy(un_cond)
                 un_cond_drop_main['additional'] = cond['additional']
@@ -546,7 +625,7 @@ class Hunyuan3DDiTPipeline:
                     'pipeline.vae.surface_extractor = SurfaceExtractors[mc_algo]() instead\n')
         if mc_algo not in SurfaceExtractors.keys():
             raise ValueError(f"Unknown mc_algo {mc_algo}")
-        self.vae.surface_extractor = SurfaceExtractors[mc_algo]()
+        self.vae.set_surface_extractor(mc_algo)
 
     @torch.no_grad()
     def __call__(
@@ -696,6 +775,7 @@ class Hunyuan3DDiTFlowMatchingPipeline(Hunyuan3DDiTPipeline):
         num_chunks=8000,
         output_type: Optional[str] = "trimesh",
         enable_pbar=True,
+        guidance_schedule=None,
         **kwargs,
     ) -> List[List[trimesh.Trimesh]]:
         callback = kwargs.pop("callback", None)
@@ -737,10 +817,25 @@ class Hunyuan3DDiTFlowMatchingPipeline(Hunyuan3DDiTPipeline):
             guidance = torch.tensor([guidance_scale] * batch_size, device=device, dtype=dtype)
             # logger.info(f'Using guidance embed with scale {guidance_scale}')
 
+        step_cache = getattr(getattr(self.model, '_orig_mod', self.model), 'step_cache', None)
+        if step_cache is not None:
+            step_cache.reset()
+
+        # the conditional half of `cond`, for steps that skip the unconditional branch
+        guidance_modes = [GUIDED] * len(timesteps)
+        cond_only = cond
+        if do_classifier_free_guidance and guidance_schedule is not None:
+            guidance_modes = guidance_schedule.plan(
+                (timesteps / self.scheduler.config.num_train_timesteps).tolist())
+            cond_only = map_nested(lambda x: x[:batch_size], cond)
+            logger.info(f'{guidance_schedule}: {guidance_modes.count(GUIDED)} of {len(timesteps)} steps guided')
+        guidance_delta = None
+
         with synchronize_timer('Diffusion Sampling'):
             for i, t in enumerate(tqdm(timesteps, disable=not enable_pbar, desc="Diffusion Sampling:")):
+                guided = do_classifier_free_guidance and guidance_modes[i] == GUIDED
                 # expand the latents if we are doing classifier free guidance
-                if do_classifier_free_guidance:
+                if guided:
                     latent_model_input = torch.cat([latents] * 2)
                 else:
                     latent_model_input = latents
@@ -748,11 +843,16 @@ class Hunyuan3DDiTFlowMatchingPipeline(Hunyuan3DDiTPipeline):
                 # NOTE: we assume model get timesteps ranged from 0 to 1
                 timestep = t.expand(latent_model_input.shape[0]).to(
                     latents.dtype) / self.scheduler.config.num_train_timesteps
-                noise_pred = self.model(latent_model_input, timestep, cond, guidance=guidance)
+                noise_pred = self.model(latent_model_input, timestep, cond if guided else cond_only,
+                                        guidance=guidance)
 
-                if do_classifier_free_guidance:
+                if guided:
                     noise_pred_cond, noise_pred_uncond = noise_pred.chunk(2)
-                    noise_pred = noise_pred_uncond + guidance_scale * (noise_pred_cond - noise_pred_uncond)
+                    guidance_delta = noise_pred_cond - noise_pred_uncond
+                    noise_pred = noise_pred_uncond + guidance_scale * guidance_delta
+                elif do_classifier_free_guidance and guidance_modes[i] == REUSE and guidance_delta is not None:
+                    # uncond + scale * delta, with the delta of the last guided step
+                    noise_pred = noise_pred + (guidance_scale - 1) * guidance_delta
 
                 # compute the previous noisy sample x_t -> x_t-1
                 outputs = self.scheduler.step(noise_pred, t, latents)
@@ -762,6 +862,9 @@ class Hunyuan3DDiTFlowMatchingPipeline(Hunyuan3DDiTPipeline):
                     step_idx = i // getattr(self.scheduler, "order", 1)
                     callback(step_idx, t, outputs)
 
+        if step_cache is not None:
+            logger.info(f'DiT step cache: {step_cache.stats()}')
+
         return self._export(
             latents,
             output_type,
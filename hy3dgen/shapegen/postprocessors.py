@@ -59,43 +59,46 @@ def remove_floater(mesh: pymeshlab.MeshSet):
     return mesh
 
 
-def pymeshlab2trimesh(mesh: pymeshlab.MeshSet):
-    with tempfile.NamedTemporaryFile(suffix='.ply', delete=False) as temp_file:
-        mesh.save_current_mesh(temp_file.name)
-        mesh = trimesh.load(temp_file.name)
-    # 检查加载的对象类型
-    if isinstance(mesh, trimesh.Scene):
-        combined_mesh = trimesh.Trimesh()
-        # 如果是Scene，遍历所有的geometry并合并
-        for geom in mesh.geometry.values():
-            combined_mesh = trimesh.util.concatenate([combined_mesh, geom])
-        mesh = combined_mesh
+def remove_degenerate_face(mesh: pymeshlab.MeshSet):
+    mesh.apply_filter("meshing_remove_duplicate_faces")
+    mesh.apply_filter("meshing_remove_null_faces")
+    mesh.apply_filter("meshing_remove_unreferenced_vertices")
     return mesh
 
 
+def pymeshlab2trimesh(mesh: pymeshlab.MeshSet):
+    current = mesh.current_mesh()
+    vertex_colors = None
+    if current.has_vertex_color():
+        vertex_colors = np.clip(current.vertex_color_matrix() * 255, 0, 255).astype(np.uint8)
+    return trimesh.Trimesh(
+        vertices=current.vertex_matrix(),
+        faces=current.face_matrix(),
+        vertex_colors=vertex_colors,
+    )
+
+
 def trimesh2pymeshlab(mesh: trimesh.Trimesh):
-    with tempfile.NamedTemporaryFile(suffix='.ply', delete=False) as temp_file:
-        if isinstance(mesh, trimesh.scene.Scene):
-            for idx, obj in enumerate(mesh.geometry.values()):
-                if idx == 0:
-                    temp_mesh = obj
-                else:
-                    temp_mesh = temp_mesh + obj
-            mesh = temp_mesh
-        mesh.export(temp_file.name)
-        mesh = pymeshlab.MeshSet()
-        mesh.load_new_mesh(temp_file.name)
-    return mesh
+    if isinstance(mesh, trimesh.scene.Scene):
+        mesh = trimesh.util.concatenate(list(mesh.geometry.values()))
+    attributes = dict(
+        vertex_matrix=np.asarray(mesh.vertices, dtype=np.float64),
+        face_matrix=np.asarray(mesh.faces, dtype=np.int32),
+    )
+    if mesh.visual.kind == 'vertex':
+        attributes['v_color_matrix'] = np.asarray(mesh.visual.vertex_colors, dtype=np.float64) / 255.
+    ms = pymeshlab.MeshSet()
+    ms.add_mesh(pymeshlab.Mesh(**attributes), "converted_mesh")
+    return ms
 
 
 def export_mesh(input, output):
     if isinstance(input, pymeshlab.MeshSet):
         mesh = output
     elif isinstance(input, Latent2MeshOutput):
-        output = Latent2MeshOutput()
-        output.mesh_v = output.current_mesh().vertex_matrix()
-        output.mesh_f = output.current_mesh().face_matrix()
-        mesh = output
+        mesh = Latent2MeshOutput()
+        mesh.mesh_v = output.current_mesh().vertex_matrix()
+        mesh.mesh_f = output.current_mesh().face_matrix()
     else:
         mesh = pymeshlab2trimesh(output)
     return mesh
@@ -116,6 +119,9 @@ def import_mesh(mesh: Union[pymeshlab.MeshSet, trimesh.Trimesh, Latent2MeshOutpu
 
 
 class FaceReducer:
+    def apply(self, ms: pymeshlab.MeshSet, max_facenum: int = 40000) -> pymeshlab.MeshSet:
+        return reduce_face(ms, max_facenum=max_facenum)
+
     @synchronize_timer('FaceReducer')
     def __call__(
         self,
@@ -123,36 +129,69 @@ class FaceReducer:
         max_facenum: int = 40000
     ) -> Union[pymeshlab.MeshSet, trimesh.Trimesh]:
         ms = import_mesh(mesh)
-        ms = reduce_face(ms, max_facenum=max_facenum)
+        ms = self.apply(ms, max_facenum=max_facenum)
         mesh = export_mesh(mesh, ms)
         return mesh
 
 
 class FloaterRemover:
+    def apply(self, ms: pymeshlab.MeshSet) -> pymeshlab.MeshSet:
+        return remove_floater(ms)
+
     @synchronize_timer('FloaterRemover')
     def __call__(
         self,
         mesh: Union[pymeshlab.MeshSet, trimesh.Trimesh, Latent2MeshOutput, str],
     ) -> Union[pymeshlab.MeshSet, trimesh.Trimesh, Latent2MeshOutput]:
         ms = import_mesh(mesh)
-        ms = remove_floater(ms)
+        ms = self.apply(ms)
         mesh = export_mesh(mesh, ms)
         return mesh
 
 
 class DegenerateFaceRemover:
+    def apply(self, ms: pymeshlab.MeshSet) -> pymeshlab.MeshSet:
+        return remove_degenerate_face(ms)
+
     @synchronize_timer('DegenerateFaceRemover')
     def __call__(
         self,
         mesh: Union[pymeshlab.MeshSet, trimesh.Trimesh, Latent2MeshOutput, str],
     ) -> Union[pymeshlab.MeshSet, trimesh.Trimesh, Latent2MeshOutput]:
         ms = import_mesh(mesh)
+        ms = self.apply(ms)
+        mesh = export_mesh(mesh, ms)
+        return mesh
+
+
+class PostprocessChain:
+    """ Run several postprocessors on a single MeshSet, converting the mesh in and out only once.
+
+        Stages are postprocessors with an `apply(ms, **kwargs)` method, optionally paired with their kwargs.
+
+        Example:
+        ```python
+        chain = PostprocessChain([
+            FloaterRemover(),
+            DegenerateFaceRemover(),
+            (FaceReducer(), dict(max_facenum=40000)),
+        ])
+        mesh = chain(mesh)
+        ```
+    """
 
-        with tempfile.NamedTemporaryFile(suffix='.ply', delete=False) as temp_file:
-            ms.save_current_mesh(temp_file.name)
-            ms = pymeshlab.MeshSet()
-            ms.load_new_mesh(temp_file.name)
+    def __init__(self, stages):
+        self.stages = [stage if isinstance(stage, tuple) else (stage, {}) for stage in stages]
 
+    @synchronize_timer('PostprocessChain')
+    def __call__(
+        self,
+        mesh: Union[pymeshlab.MeshSet, trimesh.Trimesh, Latent2MeshOutput, str],
+    ) -> Union[pymeshlab.MeshSet, trimesh.Trimesh, Latent2MeshOutput]:
+        ms = import_mesh(mesh)
+        for stage, kwargs in self.stages:
+            with synchronize_timer(type(stage).__name__):
+                ms = stage.apply(ms, **kwargs)
         mesh = export_mesh(mesh, ms)
         return mesh
 
@@ -321,6 +321,187 @@ class FlowMatchEulerDiscreteScheduler(SchedulerMixin, ConfigMixin):
         return self.config.num_train_timesteps
 
 
+class FlowMatchHeunDiscreteScheduler(FlowMatchEulerDiscreteScheduler):
+    """
+    Second-order flow-matching scheduler, Heun's method or the explicit midpoint method.
+
+    Every interval of the sigma schedule takes two model evaluations, so `timesteps` holds two entries per
+    interval and `step` alternates between the predictor and the corrector. Zero-length intervals, such as the
+    last one of the pipelines' `linspace(0, 1, n)` sigmas, are dropped. Swap it into a pipeline with
+    `pipeline.scheduler = FlowMatchHeunDiscreteScheduler.from_config(pipeline.scheduler.config)`.
+
+    Args:
+        solver (`str`, defaults to `"heun"`):
+            `"heun"` evaluates the corrector at the end of the interval and averages both velocities,
+            `"midpoint"` evaluates it halfway and uses that velocity alone.
+    """
+
+    order = 2
+
+    @register_to_config
+    def __init__(
+        self,
+        num_train_timesteps: int = 1000,
+        shift: float = 1.0,
+        use_dynamic_shifting=False,
+        solver: str = "heun",
+    ):
+        if solver not in ("heun", "midpoint"):
+            raise ValueError(f"Unknown solver {solver}, expected 'heun' or 'midpoint'")
+        super().__init__(num_train_timesteps=num_train_timesteps, shift=shift,
+                         use_dynamic_shifting=use_dynamic_shifting)
+        self._reset_state()
+
+    def _reset_state(self):
+        self.prev_derivative = None
+        self.prev_sample_start = None
+
+    def set_timesteps(
+        self,
+        num_inference_steps: int = None,
+        device: Union[str, torch.device] = None,
+        sigmas: Optional[List[float]] = None,
+        mu: Optional[float] = None,
+    ):
+        super().set_timesteps(num_inference_steps, device=device, sigmas=sigmas, mu=mu)
+        sigmas = torch.unique_consecutive(self.sigmas)
+        if self.config.solver == "heun":
+            eval_sigmas = torch.cat([sigmas[:1], sigmas[1:-1].repeat_interleave(2), sigmas[-1:]])
+        else:
+            eval_sigmas = torch.stack([sigmas[:-1], (sigmas[:-1] + sigmas[1:]) / 2], dim=1).flatten()
+        self.sigmas = sigmas
+        self._sigma_values = sigmas.tolist()
+        self.timesteps = eval_sigmas * self.config.num_train_timesteps
+        self._reset_state()
+
+    @property
+    def state_in_first_order(self):
+        return self.prev_derivative is None
+
+    def step(
+        self,
+        model_output: torch.FloatTensor,
+        timestep: Union[float, torch.FloatTensor],
+        sample: torch.FloatTensor,
+        generator: Optional[torch.Generator] = None,
+        return_dict: bool = True,
+    ) -> Union[FlowMatchEulerDiscreteSchedulerOutput, Tuple]:
+        if self._step_index is None:
+            self._step_index = self._begin_index or 0
+
+        interval = self._step_index // 2
+        dt = self._sigma_values[interval + 1] - self._sigma_values[interval]
+        velocity = model_output.to(torch.float32)
+
+        if self.state_in_first_order:
+            # predictor: Euler to the end (heun) or the middle (midpoint) of the interval
+            self.prev_derivative = velocity
+            self.prev_sample_start = sample.to(torch.float32)
+            scale = dt if self.config.solver == "heun" else dt / 2
+            prev_sample = self.prev_sample_start + scale * velocity
+        else:
+            if self.config.solver == "heun":
+                velocity = (self.prev_derivative + velocity) / 2
+            prev_sample = self.prev_sample_start + dt * velocity
+            self._reset_state()
+
+        prev_sample = prev_sample.to(model_output.dtype)
+        self._step_index += 1
+
+        if not return_dict:
+            return (prev_sample,)
+
+        return FlowMatchEulerDiscreteSchedulerOutput(prev_sample=prev_sample)
+
+
+class FlowMatchDPMSolverMultistepScheduler(FlowMatchEulerDiscreteScheduler):
+    """
+    Multistep flow-matching scheduler in the style of DPM-Solver++(2M).
+
+    The velocity is turned into a prediction of the clean sample, `x0 = x + (1 - sigma) * v`, and the second-order
+    update extrapolates that prediction from the current and the previous step, so it costs one model
+    evaluation per step like Euler. The first step, and any step starting from or ending at the end points of
+    the schedule, falls back to the first-order update. Zero-length intervals, such as the last one of the
+    pipelines' `linspace(0, 1, n)` sigmas, are dropped. Swap it into a pipeline with
+    `pipeline.scheduler = FlowMatchDPMSolverMultistepScheduler.from_config(pipeline.scheduler.config)`.
+
+    Args:
+        solver_order (`int`, defaults to 2):
+            1 is the first-order update, which matches Euler for flow matching, 2 the multistep update.
+    """
+
+    @register_to_config
+    def __init__(
+        self,
+        num_train_timesteps: int = 1000,
+        shift: float = 1.0,
+        use_dynamic_shifting=False,
+        solver_order: int = 2,
+    ):
+        if solver_order not in (1, 2):
+            raise ValueError(f"solver_order must be 1 or 2, got {solver_order}")
+        super().__init__(num_train_timesteps=num_train_timesteps, shift=shift,
+                         use_dynamic_shifting=use_dynamic_shifting)
+        self.model_outputs = []
+
+    def set_timesteps(
+        self,
+        num_inference_steps: int = None,
+        device: Union[str, torch.device] = None,
+        sigmas: Optional[List[float]] = None,
+        mu: Optional[float] = None,
+    ):
+        super().set_timesteps(num_inference_steps, device=device, sigmas=sigmas, mu=mu)
+        self.sigmas = torch.unique_consecutive(self.sigmas)
+        self._sigma_values = self.sigmas.tolist()
+        self.timesteps = self.sigmas[:-1] * self.config.num_train_timesteps
+        self.model_outputs = []
+
+    @staticmethod
+    def _lambda(sigma):
+        # log signal-to-noise ratio, the sample is sigma * data + (1 - sigma) * noise
+        return math.log(sigma) - math.log1p(-sigma)
+
+    def step(
+        self,
+        model_output: torch.FloatTensor,
+        timestep: Union[float, torch.FloatTensor],
+        sample: torch.FloatTensor,
+        generator: Optional[torch.Generator] = None,
+        return_dict: bool = True,
+    ) -> Union[FlowMatchEulerDiscreteSchedulerOutput, Tuple]:
+        if self._step_index is None:
+            self._step_index = self._begin_index or 0
+
+        sample = sample.to(torch.float32)
+        sigma = self._sigma_values[self._step_index]
+        sigma_next = self._sigma_values[self._step_index + 1]
+        x0 = sample + (1.0 - sigma) * model_output.to(torch.float32)
+
+        # x_next = (1 - s_next) / (1 - s) * x + s_next * (1 - exp(-h)) * D, with h the log-SNR step and D the
+        # clean sample estimate; exp(-h) is written out so the end points 0 and 1 need no special case.
+        exp_neg_h = (sigma * (1.0 - sigma_next)) / ((1.0 - sigma) * sigma_next)
+        denoised = x0
+        if self.config.solver_order == 2 and self.model_outputs and 0 < sigma and sigma_next < 1:
+            sigma_prev, x0_prev = self.model_outputs[-1]
+            if sigma_prev > 0:
+                h = self._lambda(sigma_next) - self._lambda(sigma)
+                h_prev = self._lambda(sigma) - self._lambda(sigma_prev)
+                r = h_prev / h
+                denoised = (1 + 1 / (2 * r)) * x0 - (1 / (2 * r)) * x0_prev
+
+        prev_sample = (1.0 - sigma_next) / (1.0 - sigma) * sample + sigma_next * (1.0 - exp_neg_h) * denoised
+        self.model_outputs = [(sigma, x0)]
+
+        prev_sample = prev_sample.to(model_output.dtype)
+        self._step_index += 1
+
+        if not return_dict:
+            return (prev_sample,)
+
+        return FlowMatchEulerDiscreteSchedulerOutput(prev_sample=prev_sample)
+
+
 @dataclass
 class ConsistencyFlowMatchEulerDiscreteSchedulerOutput(BaseOutput):
     prev_sample: torch.FloatTensor
@@ -12,8 +12,13 @@
 # fine-tuning enabling code and other elements of the foregoing made publicly available
 # by Tencent in accordance with TENCENT HUNYUAN COMMUNITY LICENSE AGREEMENT.
 
+import json
 import logging
+import mmap
 import os
+import struct
+import time
+from contextlib import contextmanager
 from functools import wraps
 
 import torch
@@ -124,3 +129,103 @@ def smart_load_model(
     config_path = os.path.join(model_path, 'config.yaml')
     ckpt_path = os.path.join(model_path, ckpt_name)
     return config_path, ckpt_path
+
+
+_SAFETENSORS_DTYPES = {
+    'F64': torch.float64,
+    'F32': torch.float32,
+    'F16': torch.float16,
+    'BF16': torch.bfloat16,
+    'I64': torch.int64,
+    'I32': torch.int32,
+    'I16': torch.int16,
+    'I8': torch.int8,
+    'U8': torch.uint8,
+    'BOOL': torch.bool,
+}
+
+
+def load_safetensors_mmap(ckpt_path):
+    """Read a safetensors file as CPU tensors that are views of a copy-on-write memory map of the file.
+
+    Nothing is read from disk until a tensor is used, and moving a tensor to its device copies it straight from
+    the page cache.
+    """
+    with open(ckpt_path, 'rb') as f:
+        header_size = struct.unpack('<Q', f.read(8))[0]
+        header = json.loads(f.read(header_size))
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    data_start = 8 + header_size
+
+    tensors = {}
+    for name, info in header.items():
+        if name == '__metadata__':
+            continue
+        dtype = _SAFETENSORS_DTYPES[info['dtype']]
+        begin, end = info['data_offsets']
+        if end == begin:
+            tensors[name] = torch.empty(info['shape'], dtype=dtype)
+            continue
+        count = (end - begin) // dtype.itemsize
+        tensors[name] = torch.frombuffer(buffer, dtype=dtype, count=count, offset=data_start + begin) \
+            .reshape(info['shape'])
+    return tensors
+
+
+def load_checkpoint(ckpt_path, use_safetensors):
+    if use_safetensors:
+        return load_safetensors_mmap(ckpt_path)
+    return torch.load(ckpt_path, map_location='cpu', weights_only=True, mmap=True)
+
+
+@contextmanager
+def init_empty_weights():
+    """Create the parameters of modules built in this context on the meta device.
+
+    Buffers are still materialized, since modules may compute them in `__init__` and checkpoints may not store them.
+    """
+    register_parameter = torch.nn.Module.register_parameter
+
+    def register_empty_parameter(module, name, param):
+        register_parameter(module, name, param)
+        if param is not None:
+            param = module._parameters[name]
+            module._parameters[name] = type(param)(param.to('meta'), requires_grad=param.requires_grad)
+
+    torch.nn.Module.register_parameter = register_empty_parameter
+    try:
+        yield
+    finally:
+        torch.nn.Module.register_parameter = register_parameter
+
+
+def instantiate_with_state_dict(build_fn, state_dict, name='model', load_times=None):
+    """Build a module on the meta device and assign the checkpoint tensors to its parameters without copying them.
+
+    Falls back to a regular build and `load_state_dict` if the checkpoint leaves any parameter uninitialized.
+
+    Args:
+        build_fn: callable building the module.
+        state_dict: checkpoint tensors, e.g. from `load_checkpoint`.
+        name: component name used for logging and as key in `load_times`.
+        load_times: dict receiving the seconds spent on this component.
+    """
+    start = time.time()
+    try:
+        with init_empty_weights():
+            module = build_fn()
+        module.load_state_dict(state_dict, assign=True)
+        uninitialized = [key for key, param in module.named_parameters() if param.is_meta]
+        if uninitialized:
+            raise RuntimeError(f'{len(uninitialized)} parameters are not in the checkpoint, e.g. {uninitialized[0]}')
+    except Exception as e:
+        # e.g. modules that load pretrained weights of their own in `__init__`
+        logger.warning(f'Loading {name} without meta initialization: {e}')
+        module = build_fn()
+        module.load_state_dict(state_dict)
+
+    elapsed = time.time() - start
+    logger.info(f'Loaded {name} in {elapsed:.2f}s')
+    if load_times is not None:
+        load_times[name] = elapsed
+    return module
@@ -12,5 +12,29 @@
 # fine-tuning enabling code and other elements of the foregoing made publicly available
 # by Tencent in accordance with TENCENT HUNYUAN COMMUNITY LICENSE AGREEMENT.
 
+# Public names are resolved on first access, so importing the package does not load the
+# rasterizer extension, xatlas, cv2 or diffusers until texturing is used.
+import importlib
+from typing import TYPE_CHECKING
 
-from .pipelines import Hunyuan3DPaintPipeline, Hunyuan3DTexGenConfig
+_LAZY_IMPORTS = {
+    'Hunyuan3DPaintPipeline': '.pipelines',
+    'Hunyuan3DTexGenConfig': '.pipelines',
+}
+
+__all__ = list(_LAZY_IMPORTS)
+
+if TYPE_CHECKING:
+    from .pipelines import Hunyuan3DPaintPipeline, Hunyuan3DTexGenConfig
+
+
+def __getattr__(name):
+    if name not in _LAZY_IMPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_LAZY_IMPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
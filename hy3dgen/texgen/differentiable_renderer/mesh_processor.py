@@ -13,50 +13,100 @@
 # by Tencent in accordance with TENCENT HUNYUAN COMMUNITY LICENSE AGREEMENT.
 
 import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.csgraph import breadth_first_order
+from scipy.sparse.linalg import spsolve
+
+
+def _last_occurrence(indices):
+    """Positions of the last occurrence of each distinct value, matching sequential last-write-wins."""
+    _, rev_pos = np.unique(indices[::-1], return_index=True)
+    return len(indices) - 1 - rev_pos
+
 
 def meshVerticeInpaint_smooth(texture, mask, vtx_pos, vtx_uv, pos_idx, uv_idx):
+    """Fill vertex colors that fall outside `mask` from their colored neighbours and splat them into the texture.
+
+    Neighbour colors are averaged with inverse-square distance weights over the directed face-edge adjacency,
+    kept as a CSR matrix. Like the reference loop, a pass visits the uncolored corners in face order and every
+    visit already sees the colors set earlier in the same pass. Which visits find a colored neighbour is a
+    reachability query on the graph of visits and the most recent earlier visits of their neighbours, and the
+    colors of one pass are a single sparse unit lower triangular solve over that graph.
+    """
     texture_height, texture_width, texture_channel = texture.shape
     vtx_num = vtx_pos.shape[0]
+    pos_idx = np.asarray(pos_idx, dtype=np.int64)
+    uv_idx = np.asarray(uv_idx, dtype=np.int64)
+
+    corner_vtx = pos_idx.reshape(-1)
+    corner_uv = vtx_uv[uv_idx.reshape(-1)]
+    uv_v = np.rint(corner_uv[:, 0] * (texture_width - 1)).astype(np.int64)
+    uv_u = np.rint((1.0 - corner_uv[:, 1]) * (texture_height - 1)).astype(np.int64)
+    corner_colored = mask[uv_u, uv_v] > 0
+
+    vtx_mask = np.zeros(vtx_num, dtype=bool)
+    vtx_color = np.zeros((vtx_num, texture_channel), dtype=np.float32)
+    colored = np.nonzero(corner_colored)[0]
+    colored = colored[_last_occurrence(corner_vtx[colored])]
+    vtx_mask[corner_vtx[colored]] = True
+    vtx_color[corner_vtx[colored]] = texture[uv_u[colored], uv_v[colored]]
 
-    vtx_mask = np.zeros(vtx_num, dtype=np.float32)
-    vtx_color = [np.zeros(texture_channel, dtype=np.float32) for _ in range(vtx_num)]
-    uncolored_vtxs = []
-    G = [[] for _ in range(vtx_num)]
-
-    for i in range(uv_idx.shape[0]):
-        for k in range(3):
-            vtx_uv_idx = uv_idx[i, k]
-            vtx_idx = pos_idx[i, k]
-            uv_v = int(round(vtx_uv[vtx_uv_idx, 0] * (texture_width - 1)))
-            uv_u = int(round((1.0 - vtx_uv[vtx_uv_idx, 1]) * (texture_height - 1)))
-            if mask[uv_u, uv_v] > 0:
-                vtx_mask[vtx_idx] = 1.0
-                vtx_color[vtx_idx] = texture[uv_u, uv_v]
-            else:
-                uncolored_vtxs.append(vtx_idx)
-            G[pos_idx[i, k]].append(pos_idx[i, (k + 1) % 3])
-
-    smooth_count = 2
+    # weighted adjacency, duplicated face edges add up like the repeated entries of the reference lists
+    edge_src = pos_idx.reshape(-1)
+    edge_dst = np.roll(pos_idx, -1, axis=1).reshape(-1)
+    dist = np.linalg.norm(vtx_pos[edge_src] - vtx_pos[edge_dst], axis=1)
+    adjacency = sp.csr_matrix((1.0 / np.maximum(dist, 1e-4) ** 2, (edge_src, edge_dst)), shape=(vtx_num, vtx_num))
+
+    # one visit per uncolored corner, in face order; a visit's row lists the neighbours of its vertex
+    visit_vtx = corner_vtx[~corner_colored]
+    visit_num = len(visit_vtx)
+    pairs = adjacency[visit_vtx].tocoo()
+    pair_visit, pair_vtx, pair_weight = pairs.row, pairs.col, pairs.data
+
+    # most recent earlier visit of each neighbour, or -1
+    visit_key = visit_vtx * visit_num + np.arange(visit_num)
+    key_order = np.argsort(visit_key)
+    sorted_key = visit_key[key_order]
+    found = np.searchsorted(sorted_key, pair_vtx * visit_num + pair_visit) - 1
+    found_valid = found >= 0
+    found_valid[found_valid] = sorted_key[found[found_valid]] // visit_num == pair_vtx[found_valid]
+    pair_dep = np.where(found_valid, key_order[np.maximum(found, 0)], -1)
+    has_dep = pair_dep >= 0
+    # reversed dependencies plus a root at `visit_num` that will point at the visits seeing a colored vertex
+    dep_src, dep_dst = pair_dep[has_dep], pair_visit[has_dep]
+    last_visit = _last_occurrence(visit_vtx)
+    last_visit_vtx = visit_vtx[last_visit]
+
+    # without uncolored corners the passes of the reference change nothing
+    smooth_count = 2 if visit_num > 0 else 0
     last_uncolored_vtx_count = 0
     while smooth_count > 0:
-        uncolored_vtx_count = 0
-        for vtx_idx in uncolored_vtxs:
-            sum_color = np.zeros(texture_channel, dtype=np.float32)
-            total_weight = 0.0
-            vtx_0 = vtx_pos[vtx_idx]
-            for connected_idx in G[vtx_idx]:
-                if vtx_mask[connected_idx] > 0:
-                    vtx1 = vtx_pos[connected_idx]
-                    dist = np.sqrt(np.sum((vtx_0 - vtx1) ** 2))
-                    dist_weight = 1.0 / max(dist, 1e-4)
-                    dist_weight *= dist_weight
-                    sum_color += vtx_color[connected_idx] * dist_weight
-                    total_weight += dist_weight
-            if total_weight > 0:
-                vtx_color[vtx_idx] = sum_color / total_weight
-                vtx_mask[vtx_idx] = 1.0
-            else:
-                uncolored_vtx_count += 1
+        seeded = np.unique(pair_visit[vtx_mask[pair_vtx]])
+        graph = sp.csr_matrix(
+            (np.ones(len(dep_src) + len(seeded)),
+             (np.concatenate([dep_src, np.full(len(seeded), visit_num)]), np.concatenate([dep_dst, seeded]))),
+            shape=(visit_num + 1, visit_num + 1))
+        updated = np.zeros(visit_num + 1, dtype=bool)
+        updated[breadth_first_order(graph, visit_num, directed=True, return_predecessors=False)] = True
+        updated = updated[:visit_num]
+
+        # a neighbour counts if it was colored before the pass or by an earlier successful visit
+        from_visit = has_dep & updated[np.maximum(pair_dep, 0)]
+        weight = pair_weight * (vtx_mask[pair_vtx] | from_visit)
+        total_weight = np.bincount(pair_visit, weights=weight, minlength=visit_num)
+        scale = np.divide(1.0, total_weight, out=np.zeros_like(total_weight), where=updated)
+        fixed = weight * ~from_visit * scale[pair_visit]
+        rhs = np.stack([np.bincount(pair_visit, weights=fixed * vtx_color[pair_vtx, c], minlength=visit_num)
+                        for c in range(texture_channel)], axis=1)
+        coupling = (weight * scale[pair_visit])[from_visit]
+        lower = sp.identity(visit_num, format='csc') - sp.csc_matrix(
+            (coupling, (pair_visit[from_visit], pair_dep[from_visit])), shape=(visit_num, visit_num))
+        visit_color = spsolve(lower, rhs, permc_spec='NATURAL').reshape(visit_num, texture_channel)
+
+        done = updated[last_visit]
+        vtx_color[last_visit_vtx[done]] = visit_color[last_visit[done]]
+        vtx_mask[last_visit_vtx[done]] = True
+        uncolored_vtx_count = int(visit_num - updated.sum())
 
         if last_uncolored_vtx_count == uncolored_vtx_count:
             smooth_count -= 1
@@ -66,17 +116,13 @@ def meshVerticeInpaint_smooth(texture, mask, vtx_pos, vtx_uv, pos_idx, uv_idx):
 
     new_texture = texture.copy()
     new_mask = mask.copy()
-    for face_idx in range(uv_idx.shape[0]):
-        for k in range(3):
-            vtx_uv_idx = uv_idx[face_idx, k]
-            vtx_idx = pos_idx[face_idx, k]
-            if vtx_mask[vtx_idx] == 1.0:
-                uv_v = int(round(vtx_uv[vtx_uv_idx, 0] * (texture_width - 1)))
-                uv_u = int(round((1.0 - vtx_uv[vtx_uv_idx, 1]) * (texture_height - 1)))
-                new_texture[uv_u, uv_v] = vtx_color[vtx_idx]
-                new_mask[uv_u, uv_v] = 255
+    splat = np.nonzero(vtx_mask[corner_vtx])[0]
+    splat = splat[_last_occurrence(uv_u[splat] * texture_width + uv_v[splat])]
+    new_texture[uv_u[splat], uv_v[splat]] = vtx_color[corner_vtx[splat]]
+    new_mask[uv_u[splat], uv_v[splat]] = 255
     return new_texture, new_mask
 
+
 def meshVerticeInpaint(texture, mask, vtx_pos, vtx_uv, pos_idx, uv_idx, method="smooth"):
     if method == "smooth":
         return meshVerticeInpaint_smooth(texture, mask, vtx_pos, vtx_uv, pos_idx, uv_idx)
@@ -17,6 +17,7 @@ import logging
 import numpy as np
 import os
 import torch
+from contextlib import contextmanager
 from PIL import Image
 from typing import List, Union, Optional
 
@@ -87,6 +88,7 @@ class Hunyuan3DPaintPipeline:
     def __init__(self, config):
         self.config = config
         self.models = {}
+        self.residency = None
         self.render = MeshRender(
             default_resolution=self.config.render_size,
             texture_size=self.config.texture_size)
@@ -105,6 +107,34 @@ class Hunyuan3DPaintPipeline:
         self.models['delight_model'].pipeline.enable_model_cpu_offload(gpu_id=gpu_id, device=device)
         self.models['multiview_model'].pipeline.enable_model_cpu_offload(gpu_id=gpu_id, device=device)
 
+    def enable_residency(self, manager, prefix='texgen'):
+        """Let a `ModelResidencyManager` move the delight and multiview models between device, CPU and disk."""
+        self.residency = manager
+        self._residency_names = {}
+        loaders = {'delight_model': Light_Shadow_Remover, 'multiview_model': Multiview_Diffusion_Net}
+        for key, model_cls in loaders.items():
+            name = f'{prefix}.{key}'
+            manager.register(
+                name,
+                loader=lambda model_cls=model_cls: model_cls(self.config),
+                obj=self.models.get(key),
+                setter=lambda model, key=key: self.models.__setitem__(key, model),
+            )
+            self._residency_names[key] = name
+
+    @contextmanager
+    def _use_model(self, key):
+        if self.residency is None:
+            yield self.models[key]
+        else:
+            with self.residency.acquire(self._residency_names[key]) as model:
+                yield model
+
+    def prefetch_models(self):
+        """Start bringing the first texturing stage to the device ahead of a call."""
+        if self.residency is not None:
+            self.residency.prefetch(self._residency_names['delight_model'])
+
     def render_normal_multiview(self, camera_elevs, camera_azims, use_abs_coor=True):
         normal_maps = []
         for elev, azim in zip(camera_elevs, camera_azims):
@@ -200,7 +230,10 @@ class Hunyuan3DPaintPipeline:
             
         images_prompt = [self.recenter_image(image_prompt) for image_prompt in images_prompt]
 
-        images_prompt = [self.models['delight_model'](image_prompt) for image_prompt in images_prompt]
+        with self._use_model('delight_model') as delight_model:
+            if self.residency is not None:
+                self.residency.prefetch(self._residency_names['multiview_model'])
+            images_prompt = [delight_model(image_prompt) for image_prompt in images_prompt]
 
         mesh = mesh_uv_wrap(mesh)
 
@@ -217,7 +250,8 @@ class Hunyuan3DPaintPipeline:
         camera_info = [(((azim // 30) + 9) % 12) // {-20: 1, 0: 1, 20: 1, -90: 3, 90: 3}[
             elev] + {-20: 0, 0: 12, 20: 24, -90: 36, 90: 40}[elev] for azim, elev in
                        zip(selected_camera_azims, selected_camera_elevs)]
-        multiviews = self.models['multiview_model'](images_prompt, normal_maps + position_maps, camera_info)
+        with self._use_model('multiview_model') as multiview_model:
+            multiviews = multiview_model(images_prompt, normal_maps + position_maps, camera_info)
 
         for i in range(len(multiviews)):
             # multiviews[i] = self.models['super_model'](multiviews[i])
@@ -1,31 +1,47 @@
-import subprocess
+import argparse
 import os
 
-# Define the paths to the scripts
-script1 = r"D:\AECTech_bcn\Hunyuan3D-2-main\examples\shape_gen_multiview.py"
-script2 = r"D:\AECTech_bcn\Hunyuan3D-2-main\PARAM_all.py"
+from design_pipeline import DesignPipeline
 
-def run_pipeline():
-    try:
-        # Step 1: Run shape_gen_multiview.py
-        print(f"Running: {script1}")
-        subprocess.run(["python", script1], check=True)
-        print(f"Completed: {script1}")
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
 
-        # Step 2: Run PARAM_all.py
-        print(f"Running: {script2}")
-        subprocess.run(["python", script2], check=True)
-        print(f"Completed: {script2}")
+# Example input views and the mesh written for the standalone viewer
+DEFAULT_IMAGE_DIR = os.path.join(REPO_DIR, "assets", "example_mv_images", "16")
+DEFAULT_OUTPUT_PLY = os.path.join(REPO_DIR, "FS1.ply")
+# The example photos are not named after their view
+DEFAULT_VIEWS = {
+    "front": "IMG-20250614-WA0017.jpg",
+    "left": "IMG-20250614-WA0018.jpg",
+    "back": "IMG-20250614-WA0019.jpg",
+    "right": "IMG-20250614-WA0020.jpg",
+}
 
-        print("Pipeline executed successfully!")
-    except subprocess.CalledProcessError as e:
+def run_pipeline(pipeline=None, view=True, image_dir=DEFAULT_IMAGE_DIR, views=DEFAULT_VIEWS,
+                 output_ply=DEFAULT_OUTPUT_PLY):
+    """Generate the shape and open the parametric editor on it, all in this process."""
+    pipeline = pipeline or DesignPipeline()
+    try:
+        result = pipeline.run(image_dir=image_dir, views=views, export_path=output_ply)
+    except Exception as e:
         print(f"An error occurred while running the pipeline: {e}")
         return False
+
+    if view:
+        from PARAM_all import run_viewer
+        run_viewer(result["deformer"])
     return True
 
 if __name__ == "__main__":
-    success = run_pipeline()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--image-dir", default=os.environ.get("PARAMATRIX_IMAGE_DIR", DEFAULT_IMAGE_DIR),
+                        help="folder with the view images, named front, left, back and right unless it is the example")
+    parser.add_argument("--output-ply", default=os.environ.get("PARAMATRIX_MESH_FILE", DEFAULT_OUTPUT_PLY))
+    parser.add_argument("--no-view", action="store_true", help="do not open the parametric editor")
+    args = parser.parse_args()
+
+    views = DEFAULT_VIEWS if os.path.abspath(args.image_dir) == DEFAULT_IMAGE_DIR else None
+    success = run_pipeline(view=not args.no_view, image_dir=args.image_dir, views=views, output_ply=args.output_ply)
     if success:
         print("Pipeline finished successfully!")
     else:
-        print("Pipeline failed.")
\ No newline at end of file
+        print("Pipeline failed.")
@@ -1,13 +1,20 @@
 import open3d as o3d
 import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
 from scipy.spatial import cKDTree
 import matplotlib.pyplot as plt
+import struct
 import time
 
 def detect_planar_surfaces(points, normals, angle_threshold=2, distance_threshold=0.03):
     """
     Detect planar surfaces using point normals and connectivity
     
+    Two points are connected when they are within `distance_threshold` of each other and their normals
+    are parallel within `angle_threshold`; each surface is a connected component of that graph.
+    Surfaces are numbered in the order of their lowest point index.
+    
     Args:
         points: np.array of shape (N, 3) containing point coordinates
         normals: np.array of shape (N, 3) containing point normals
@@ -15,44 +22,26 @@ def detect_planar_surfaces(points, normals, angle_threshold=2, distance_threshol
         distance_threshold: maximum distance between points to be considered connected
     """
     N = len(points)
-    labels = np.full(N, -1)
-    current_label = 0
     
     # Convert angle threshold to dot product threshold
     angle_threshold_rad = np.cos(np.radians(angle_threshold))
     
-    # Build KD-tree for nearest neighbor search
+    # Neighbor graph as an edge list, one KD-tree query for all points
     tree = cKDTree(points)
+    pairs = tree.query_pairs(distance_threshold, output_type='ndarray')
     
-    for i in range(N):
-        if labels[i] >= 0:
-            continue
-            
-        # Start new surface
-        stack = [i]
-        labels[i] = current_label
-        
-        # Region growing
-        while stack:
-            current_idx = stack.pop()
-            current_normal = normals[current_idx]
-            
-            # Find nearby points
-            neighbors = tree.query_ball_point(points[current_idx], distance_threshold)
-            
-            for neighbor_idx in neighbors:
-                if labels[neighbor_idx] >= 0:
-                    continue
-                    
-                # Check if normals are similar
-                neighbor_normal = normals[neighbor_idx]
-                if abs(np.dot(current_normal, neighbor_normal)) > angle_threshold_rad:
-                    labels[neighbor_idx] = current_label
-                    stack.append(neighbor_idx)
-        
-        current_label += 1
+    # Keep edges whose normals are similar
+    similarity = np.abs(np.einsum('ij,ij->i', normals[pairs[:, 0]], normals[pairs[:, 1]]))
+    pairs = pairs[similarity > angle_threshold_rad]
     
-    return labels
+    graph = coo_matrix((np.ones(len(pairs), dtype=np.int8), (pairs[:, 0], pairs[:, 1])), shape=(N, N)).tocsr()
+    _, labels = connected_components(graph, directed=False)
+    
+    # Number surfaces by their first point, as a sequential scan over the points would
+    _, first_index = np.unique(labels, return_index=True)
+    order = np.empty(len(first_index), dtype=np.int64)
+    order[np.argsort(first_index)] = np.arange(len(first_index))
+    return order[labels]
 
 def preprocess_mesh(input_ply):
     """Load and preprocess mesh to extract surface information"""
@@ -72,47 +61,129 @@ def preprocess_mesh(input_ply):
     
     return points, surface_ids
 
-def save_xyzc(points, surface_ids, output_file):
-    """Save points with surface IDs to XYZC format"""
-    # Ensure surface IDs start from 1
-    surface_ids = surface_ids + 1
+XYZC_MAGIC = b'XYZC'
+XYZC_VERSION = 1
+# magic, version, number of points, number of surfaces
+XYZC_HEADER = struct.Struct('<4sIQQ')
+
+
+def write_xyzc_binary(points, surface_ids, output_file):
+    """
+    Write points to the binary XYZC container
     
-    # Combine points and surface IDs
-    data = np.hstack((points, surface_ids.reshape(-1, 1)))
+    Layout (little endian): header, surface offsets uint64[S + 1], surface ids uint32[S],
+    xyz float32[N, 3], surface id uint32[N]. Points are sorted by surface, so the points of
+    surface k are rows offsets[k]:offsets[k + 1].
+    """
+    order = np.argsort(surface_ids, kind='stable')
+    xyz = np.ascontiguousarray(points[order], dtype='<f4')
+    ids = np.ascontiguousarray(surface_ids[order], dtype='<u4')
+    unique_ids, counts = np.unique(ids, return_counts=True)
+    offsets = np.zeros(len(unique_ids) + 1, dtype='<u8')
+    np.cumsum(counts, out=offsets[1:])
     
-    # Save to file
+    with open(output_file, 'wb') as f:
+        f.write(XYZC_HEADER.pack(XYZC_MAGIC, XYZC_VERSION, len(xyz), len(unique_ids)))
+        f.write(offsets.tobytes())
+        f.write(unique_ids.astype('<u4').tobytes())
+        f.write(xyz.tobytes())
+        f.write(ids.tobytes())
+
+
+def write_xyzc_text(points, surface_ids, output_file):
+    """Write points as `x y z id` text lines, for tools that expect plain XYZC"""
+    data = np.hstack((points, surface_ids.reshape(-1, 1)))
     np.savetxt(output_file, data, delimiter=' ', fmt=['%.6f', '%.6f', '%.6f', '%d'])
+
+
+class XYZCReader:
+    """
+    Memory-mapped reader for binary XYZC files
+    
+    Only the header and surface table are read up front; point data is paged in on access.
+    
+    Example:
+        reader = XYZCReader("FS1.xyzc")
+        roof = reader.surface(reader.surface_ids[0])
+    """
+    
+    def __init__(self, file_path):
+        self.file_path = file_path
+        with open(file_path, 'rb') as f:
+            magic, version, n_points, n_surfaces = XYZC_HEADER.unpack(f.read(XYZC_HEADER.size))
+        if magic != XYZC_MAGIC:
+            raise ValueError(f"{file_path} is not a binary XYZC file")
+        if version != XYZC_VERSION:
+            raise ValueError(f"Unsupported XYZC version {version} in {file_path}")
+        
+        self.num_points = n_points
+        offset = XYZC_HEADER.size
+        self.offsets = np.fromfile(file_path, dtype='<u8', count=n_surfaces + 1, offset=offset)
+        offset += self.offsets.nbytes
+        self.surface_ids = np.fromfile(file_path, dtype='<u4', count=n_surfaces, offset=offset)
+        offset += self.surface_ids.nbytes
+        self.xyz = np.memmap(file_path, dtype='<f4', mode='r', offset=offset, shape=(n_points, 3))
+        offset += self.xyz.nbytes
+        self.ids = np.memmap(file_path, dtype='<u4', mode='r', offset=offset, shape=(n_points,))
+        self._surface_index = {int(surface_id): i for i, surface_id in enumerate(self.surface_ids)}
+    
+    def __len__(self):
+        return self.num_points
+    
+    def surface(self, surface_id):
+        """Points of one surface as a read-only view into the file"""
+        i = self._surface_index[int(surface_id)]
+        return self.xyz[self.offsets[i]:self.offsets[i + 1]]
+
+
+def is_binary_xyzc(file_path):
+    with open(file_path, 'rb') as f:
+        return f.read(len(XYZC_MAGIC)) == XYZC_MAGIC
+
+
+def read_xyzc(file_path):
+    """Read a binary or text XYZC file into (xyz, surface_ids)"""
+    if is_binary_xyzc(file_path):
+        reader = XYZCReader(file_path)
+        return reader.xyz, reader.ids
+    data = np.loadtxt(file_path, delimiter=' ')
+    return data[:, :3], data[:, 3].astype(np.uint32)
+
+
+def save_xyzc(points, surface_ids, output_file, binary=True):
+    """Save points with surface IDs to XYZC format, binary by default or text with `binary=False`"""
+    # Ensure surface IDs start from 1
+    surface_ids = surface_ids + 1
+    
+    if binary:
+        write_xyzc_binary(points, surface_ids, output_file)
+    else:
+        write_xyzc_text(points, surface_ids, output_file)
     
     n_surfaces = len(np.unique(surface_ids))
     print(f"✅ Saved {len(points)} points with {n_surfaces} surfaces to {output_file}")
-    return data
+    return np.hstack((points, surface_ids.reshape(-1, 1)))
 
-def ply_to_xyzc(input_ply, output_xyzc):
+def ply_to_xyzc(input_ply, output_xyzc, binary=True):
     """Convert PLY mesh to XYZC format preserving surface information"""
     # Process mesh and detect surfaces
     points, surface_ids = preprocess_mesh(input_ply)
     
     # Save results
-    data = save_xyzc(points, surface_ids, output_xyzc)
+    data = save_xyzc(points, surface_ids, output_xyzc, binary=binary)
     return data
 
 def visualize_xyzc(file_path):
     """Visualize the XYZC file with colored surfaces"""
     try:
-        data = np.loadtxt(file_path, delimiter=' ')
-        xyz = data[:, :3]
-        surface_ids = data[:, 3]
+        xyz, surface_ids = read_xyzc(file_path)
         
-        unique_ids = np.unique(surface_ids)
-        colors = np.zeros((len(xyz), 3))
+        unique_ids, inverse = np.unique(surface_ids, return_inverse=True)
         color_map = plt.cm.get_cmap('tab20')(np.linspace(0, 1, len(unique_ids)))[:, :3]
-        
-        for i, id in enumerate(unique_ids):
-            mask = surface_ids == id
-            colors[mask] = color_map[i % len(color_map)]
+        colors = color_map[inverse % len(color_map)]
         
         pcd = o3d.geometry.PointCloud()
-        pcd.points = o3d.utility.Vector3dVector(xyz)
+        pcd.points = o3d.utility.Vector3dVector(np.asarray(xyz, dtype=np.float64))
         pcd.colors = o3d.utility.Vector3dVector(colors)
         
         o3d.visualization.draw_geometries([pcd])
@@ -136,7 +207,7 @@ def convert_glb_to_ply(input_glb, output_ply):
 if __name__ == "__main__":
     input_glb = "FS1.glb"  # Replace with your .glb file
     intermediate_ply = "FS1.ply"  # Temporary .ply file for processing
-    output_file = "FS1.xyzc"  # Final output file
+    output_file = "FS1.xyzc"  # Final output file (binary, see XYZCReader; pass binary=False for text)
 
     # Convert .glb to .ply
     convert_glb_to_ply(input_glb, intermediate_ply)
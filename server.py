@@ -1,89 +1,232 @@
-from flask import Flask, request, send_file, jsonify
-import subprocess
+from flask import Flask, Response, request, send_file, jsonify, stream_with_context
+import io
+import json
+import math
 import os
 import threading
+import time
 from flask_cors import CORS
+import trimesh
+
+from design_pipeline import DesignPipeline, IMAGE_EXTENSIONS, VIEWS
+from facade_deformer import FacadeDeformer, DEFAULT_SLIDER_VALUES
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
-UPLOAD_FOLDER = r"D:\AECTech_bcn\Hunyuan3D-2-main\assets\example_mv_images\16"
-OUTPUT_FILE = r"D:\AECTech_bcn\Hunyuan3D-2-main\assets\output.png"
+# Paths can be overridden through the environment, they default to the repository folder
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+UPLOAD_FOLDER = os.environ.get("PARAMATRIX_UPLOAD_FOLDER", os.path.join(REPO_DIR, "uploads"))
+OUTPUT_FILE = os.environ.get("PARAMATRIX_OUTPUT_FILE", os.path.join(REPO_DIR, "assets", "output.png"))
+MESH_FILE = os.environ.get("PARAMATRIX_MESH_FILE", os.path.join(REPO_DIR, "FS1.ply"))
+MAX_UPDATES_PER_SECOND = 30
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
-slider_values = {
-    "X": 100,
-    "Y": 100,
-    "Z": 100,
-    "Stretch +X Facade": 100,
-    "Stretch -X Facade": 100,
-    "Stretch +Y Facade": 100,
-    "Stretch -Y Facade": 100,
-}
+deformer = None
+deformer_lock = threading.Lock()
+design_pipeline = DesignPipeline()
+pipeline_lock = threading.Lock()  # one generation at a time on the resident model
+
+def remove_view_images(views=VIEWS):
+    """Delete the uploaded images of `views`, leaving other files of the folder alone"""
+    for f in os.listdir(UPLOAD_FOLDER):
+        stem, ext = os.path.splitext(f)
+        if stem.lower() in views and ext.lower() in IMAGE_EXTENSIONS:
+            os.remove(os.path.join(UPLOAD_FOLDER, f))
+
+@app.route('/clear-images', methods=['POST'])
+def clear_images():
+    # Start a new upload so views of the previous one are not used again
+    remove_view_images()
+    return "Images cleared", 200
 
 @app.route('/save-images', methods=['POST'])
 def save_images():
-    file = request.files['file']
-    file.save(os.path.join(UPLOAD_FOLDER, file.filename))
+    file = request.files.get('file')
+    view = request.form.get('view', '').lower()
+    if file is None or view not in VIEWS:
+        return f"Expected a file and a view out of {', '.join(VIEWS)}", 400
+    ext = os.path.splitext(file.filename)[1].lower()
+    if ext not in IMAGE_EXTENSIONS:
+        return f"Unsupported image type {ext!r}", 400
+    # Saved under its view name, which is how the pipeline assigns the images
+    remove_view_images([view])
+    file.save(os.path.join(UPLOAD_FOLDER, view + ext))
     return "Image saved successfully", 200
 
 @app.route('/run-pipeline', methods=['POST'])
 def run_pipeline():
+    global deformer
     try:
-        # Run the first operation (e.g., shape_gen_multiview.py)
-        script1 = r"D:\AECTech_bcn\Hunyuan3D-2-main\examples\shape_gen_multiview.py"
-        subprocess.run(["python", script1], check=True)
-
-        # Run PARAM_all.py as the second operation
-        script2 = r"D:\AECTech_bcn\Hunyuan3D-2-main\PARAM_all.py"
-        subprocess.run(["python", script2], check=True)
-
-        return "Pipeline executed successfully", 200
-    except subprocess.CalledProcessError as e:
+        # Generate the shape in-process with the resident model and hand the mesh to the deformer
+        with pipeline_lock:
+            result = design_pipeline.run(image_dir=UPLOAD_FOLDER, export_path=MESH_FILE)
+    except Exception as e:
         return f"Pipeline execution failed: {e}", 500
 
+    with deformer_lock:
+        deformer = result["deformer"]
+    # Apply the current slider state to the new mesh
+    slider_updates.submit({})
+    return jsonify({"status": "success", "timings": result["timings"]}), 200
+
 @app.route('/get-visualization', methods=['GET'])
 def get_visualization():
     if os.path.exists(OUTPUT_FILE):
         return send_file(OUTPUT_FILE, mimetype='image/png')
     return "Visualization not found", 404
 
+def parse_slider_values(payload):
+    """Known slider names with finite numeric values, or a ValueError"""
+    if not isinstance(payload, dict):
+        raise ValueError("Expected a JSON object of slider values")
+    values = {}
+    for name, value in payload.items():
+        if name not in DEFAULT_SLIDER_VALUES:
+            raise ValueError(f"Unknown slider {name!r}")
+        if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+            raise ValueError(f"Slider {name!r} must be a number")
+        try:
+            values[name] = float(value)
+        except ValueError:
+            raise ValueError(f"Slider {name!r} must be a number")
+        if not math.isfinite(values[name]):
+            raise ValueError(f"Slider {name!r} must be finite")
+    return values
+
 @app.route('/update-sliders', methods=['POST'])
 def update_sliders():
-    global slider_values
-    slider_values = request.json  # Receive slider values from the frontend
-    update_pyqt_visualization(slider_values)  # Update PyQt visualization
-    return jsonify({"status": "success", "slider_values": slider_values})
+    # Receive slider values from the frontend; the update loop applies only the newest state
+    try:
+        values = parse_slider_values(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({"status": "error", "error": str(e)}), 400
+    return jsonify({"status": "accepted", "slider_values": slider_updates.submit(values)}), 202
 
 @app.route('/get-slider-values', methods=['GET'])
 def get_slider_values():
-    return jsonify(slider_values)
-
-def update_pyqt_visualization(slider_values):
-    new_vertices = mesh.vertices.copy()
-
-    # Apply global scaling based on slider values
-    new_vertices[:, 0] *= slider_values["X"] / 100
-    new_vertices[:, 1] *= slider_values["Y"] / 100
-    new_vertices[:, 2] *= slider_values["Z"] / 100
-
-    # Apply facade scaling
-    for facade, vertices, axis in [
-        ("Stretch +X Facade", vertices_posX, 0),
-        ("Stretch -X Facade", vertices_negX, 0),
-        ("Stretch +Y Facade", vertices_posY, 1),
-        ("Stretch -Y Facade", vertices_negY, 1),
-    ]:
-        scale = slider_values[facade] / 100
-        new_vertices[vertices, axis] *= scale
-
-    global mesh_item
-    window.removeItem(mesh_item)
-    mesh_item = create_mesh_item(new_vertices, mesh.faces)
-    window.addItem(mesh_item)
+    return jsonify(slider_updates.values())
+
+@app.route('/deformed-mesh', methods=['GET'])
+def deformed_mesh():
+    """GLB of the latest applied slider state; its version is in the X-Mesh-Version header"""
+    version, glb = slider_updates.latest_result()
+    if glb is None:
+        return "No deformed mesh yet", 404
+    response = send_file(io.BytesIO(glb), mimetype='model/gltf-binary', download_name='deformed.glb')
+    response.headers['X-Mesh-Version'] = str(version)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/slider-events', methods=['GET'])
+def slider_events():
+    """Server-sent events with every applied slider state and the URL of its deformed mesh"""
+    def stream():
+        version = 0
+        while True:
+            event = slider_updates.wait_for_update(version, timeout=15)
+            if event is None:
+                yield ": keep-alive\n\n"
+                continue
+            version = event["version"]
+            yield f"data: {json.dumps(event)}\n\n"
+
+    return Response(stream_with_context(stream()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def get_deformer():
+    """Load the generated mesh and precompute its facades on first use"""
+    global deformer
+    if deformer is None:
+        deformer = FacadeDeformer.from_trimesh(trimesh.load(MESH_FILE, force='mesh'))
+    return deformer
+
+def apply_slider_values(slider_values):
+    """Deform the mesh for the given slider values and return it as GLB bytes"""
+    with deformer_lock:
+        current = get_deformer()
+        vertices = current.apply(slider_values)
+        # back from the viewer's Y-up order to the mesh frame; this also copies the reused buffer
+        mesh = trimesh.Trimesh(vertices[:, current.output_axes], current.faces, process=False)
+    return mesh.export(file_type='glb')
+
+class SliderUpdateLoop:
+    """
+    Latest-value-wins slider updates
+
+    `submit` merges changed sliders into the current state and overwrites a single pending slot
+    with it, and one worker thread applies only the newest pending state, at most `max_fps` times
+    per second. Every applied state is published as an
+    event that `wait_for_update` hands to the SSE streams, and the result of `apply_fn` for it
+    is kept for `latest_result`.
+    """
+
+    def __init__(self, apply_fn, initial_values, max_fps=MAX_UPDATES_PER_SECOND, result_url='/deformed-mesh'):
+        self.apply_fn = apply_fn
+        self.min_interval = 1.0 / max_fps
+        self.result_url = result_url
+        self._values = dict(initial_values)
+        self._pending = None
+        self._event = {"version": 0}
+        self._result = None
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def submit(self, values):
+        """Merge `values` into the current state, queue it and return a copy of it"""
+        with self._condition:
+            self._values.update(values)
+            self._pending = dict(self._values)
+            self._condition.notify_all()
+            return dict(self._values)
+
+    def values(self):
+        with self._condition:
+            return dict(self._values)
+
+    def wait_for_update(self, version, timeout=None):
+        """Block until an event newer than `version` is published, or return None on timeout"""
+        with self._condition:
+            self._condition.wait_for(lambda: self._event["version"] > version, timeout=timeout)
+            return self._event if self._event["version"] > version else None
+
+    def latest_result(self):
+        """(version, result) of the newest successfully applied state"""
+        with self._condition:
+            return self._result if self._result is not None else (0, None)
+
+    def _loop(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending is not None)
+                values, self._pending = self._pending, None
+
+            start = time.time()
+            result = None
+            try:
+                result = self.apply_fn(values)
+                event = {"status": "applied", "slider_values": values}
+            except Exception as e:
+                print(f"Slider update failed: {e}")
+                event = {"status": "error", "error": str(e), "slider_values": values}
+
+            with self._condition:
+                version = self._event["version"] + 1
+                event["version"] = version
+                if event["status"] == "applied":
+                    self._result = (version, result)
+                    event["mesh_url"] = f"{self.result_url}?version={version}"
+                self._event = event
+                self._condition.notify_all()
+
+            # Cap the update rate; states submitted meanwhile collapse into the newest one
+            time.sleep(max(0.0, self.min_interval - (time.time() - start)))
+
+slider_updates = SliderUpdateLoop(apply_slider_values, DEFAULT_SLIDER_VALUES)
 
 def run_flask():
-    app.run(debug=True, use_reloader=False)
+    app.run(debug=True, use_reloader=False, threaded=True)
 
 if __name__ == '__main__':
     flask_thread = threading.Thread(target=run_flask)
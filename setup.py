@@ -33,6 +33,7 @@ setup(
         "transformers>=4.48.0",
         'omegaconf',
         'trimesh',
+        'scipy',
         'pymeshlab',
         'pygltflib',
         'xatlas',